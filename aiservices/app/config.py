@@ -22,6 +22,61 @@ class Settings(BaseSettings):
     max_tokens: int = 1000
     temperature: float = 0.7
     
+    # LLM Response Cache
+    llm_cache_enabled: bool = True
+    llm_cache_max_entries: int = 1024
+    llm_cache_ttl_seconds: int = 3600
+    llm_cache_backend: str = "none"  # "none", "sqlite" or "redis"
+    llm_cache_sqlite_path: str = "llm_cache.sqlite3"
+    llm_cache_redis_url: str = "redis://localhost:6379/0"
+    
+    # Chatbot Intent Fast Path
+    intent_fastpath_enabled: bool = True
+    intent_fastpath_threshold: float = 0.85
+    intent_fastpath_audit_rate: float = 0.0  # share of confident hits also sent to the LLM to measure accuracy
+    
+    # Automation Preview Plans
+    automation_plan_secret: str = ""  # random per process when empty; required with several workers
+    automation_plan_ttl_seconds: int = 300
+    web_concurrency: int = 1  # WEB_CONCURRENCY, the worker count uvicorn and gunicorn read
+    automation_bulk_chunk_size: int = 1000
+    
+    # Demand Forecasting
+    forecast_models: list[str] = ["naive", "ses", "holt", "holt_winters"]
+    forecast_backtest_origins: int = 3  # held-out weeks for model selection
+    forecast_interval_level: float = 0.9
+    
+    # Bulk Sale Ingestion
+    trend_bulk_chunk_size: int = 1000  # rows per multi-row upsert
+    trend_bulk_max_json_bytes: int = 10 * 1024 * 1024  # JSON array bodies are parsed whole
+    trend_bulk_max_line_bytes: int = 64 * 1024  # NDJSON bodies stream line by line
+    
+    # Merchant Daily Transaction Stats
+    transaction_stats_refresh_seconds: int = 300
+    transaction_stats_overlap_seconds: int = 300  # rereads late-committed transactions
+    transaction_stats_max_staleness_seconds: int = 60  # summaries refresh only an older rollup
+    transaction_stats_page_size: int = 5000  # changed transactions read per refresh step
+    
+    # Transaction Summary Cache
+    transaction_summary_cache_max_entries: int = 1024
+    transaction_summary_cache_ttl_seconds: int = 900
+    
+    # Transaction Query Windows
+    transaction_query_default_days: int = 30  # queries naming no period
+    
+    # Risk Refresh Worker
+    risk_refresh_batch_size: int = 500  # products reassessed per transaction
+    risk_refresh_debounce_seconds: float = 2.0
+    risk_refresh_poll_seconds: float = 5.0  # picks up products queued by other processes
+    risk_refresh_claim_seconds: float = 300.0  # before another process may take a claimed batch
+    risk_refresh_max_attempts: int = 3  # per product before waiting for the daily sweep
+    risk_refresh_retry_seconds: float = 30.0  # doubles with each failed attempt
+    
+    # Soft-deleted Product Compaction
+    tombstone_retention_days: int = 30
+    tombstone_compaction_interval_seconds: int = 3600
+    tombstone_compaction_batch_size: int = 500
+    
     class Config:
         env_file = ".env"
         case_sensitive = False
@@ -1,10 +1,14 @@
+import logging
 import os
 from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy import inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Read DB config from environment variables
 DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
@@ -12,25 +16,64 @@ DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", "3306")
 DB_NAME = os.getenv("DB_NAME")
 
-# Construct database URL
-DATABASE_URL = (
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Construct database URL (DATABASE_URL overrides, e.g. sqlite+aiosqlite:// for tests)
+DATABASE_URL = os.getenv("DATABASE_URL") or (
+    f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
 )
 
-# Create engine
-engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+# Create async engine so queries never block the event loop
+engine = create_async_engine(DATABASE_URL, pool_pre_ping=True)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay loaded after commit; async sessions cannot lazy-load on attribute access
+SessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with SessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+async def init_db():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+
+def upgrade_schema(conn):
+    """Changes to existing tables that create_all does not make"""
+    _add_product_trends_key(conn)
+
+
+def _add_product_trends_key(conn):
+    """Merge duplicate (product_id, date) rows of product_trends and add
+    uq_product_trends_product_date, which record_sale's upsert relies on
+    
+    Tables created before the key could hold several rows per product and
+    day; their sums are kept on the oldest row.
+    """
+    inspector = inspect(conn)
+    if not inspector.has_table("product_trends"):
+        return
+    names = {c["name"] for c in inspector.get_unique_constraints("product_trends")}
+    names.update(i["name"] for i in inspector.get_indexes("product_trends") if i["unique"])
+    if "uq_product_trends_product_date" in names:
+        return
+    
+    duplicates = conn.execute(text(
+        "SELECT product_id, date, MIN(id), SUM(quantity_sold), SUM(revenue), SUM(views),"
+        " MAX(popularity_score) FROM product_trends GROUP BY product_id, date HAVING COUNT(*) > 1"
+    )).all()
+    for product_id, day, keep_id, quantity, revenue, views, popularity in duplicates:
+        conn.execute(text(
+            "UPDATE product_trends SET quantity_sold = :quantity, revenue = :revenue,"
+            " views = :views, popularity_score = :popularity WHERE id = :id"
+        ), {"id": keep_id, "quantity": quantity, "revenue": revenue, "views": views, "popularity": popularity})
+        conn.execute(text(
+            "DELETE FROM product_trends WHERE product_id = :product_id AND date = :date AND id <> :id"
+        ), {"product_id": product_id, "date": day, "id": keep_id})
+    
+    conn.execute(text(
+        "CREATE UNIQUE INDEX uq_product_trends_product_date ON product_trends (product_id, date)"
+    ))
+    logger.info(f"Added uq_product_trends_product_date after merging {len(duplicates)} duplicate product days")
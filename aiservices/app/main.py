@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.routers import ai_generate, risk, products, trends, chatbot, transaction_summary, reports
-from app.database import init_db
+from app.database import engine, init_db
 from app.config import settings
+from app.services import product_service, risk_services, transaction_stats, trend_rollups
+import asyncio
 
 app = FastAPI(
     title="AI Product Management Services",
@@ -29,9 +31,36 @@ app.include_router(transaction_summary.router, prefix="/transactions", tags=["Tr
 app.include_router(reports.router, prefix="/reports", tags=["Reports"])
 
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     """Initialize database on startup"""
-    init_db()
+    # Each process would sign automation plans with its own random key
+    if not settings.automation_plan_secret and settings.web_concurrency > 1:
+        raise RuntimeError("AUTOMATION_PLAN_SECRET must be set when running more than one worker")
+    
+    await init_db()
+    
+    # Purge old soft-deleted products in the background
+    app.state.tombstone_compaction = asyncio.create_task(
+        product_service.run_tombstone_compaction()
+    )
+    
+    # Load sales history into the trend rollups on first deploy
+    app.state.rollup_backfill = asyncio.create_task(trend_rollups.run_rollup_backfill())
+    
+    # Keep stored risk assessments current as products and sales change
+    app.state.risk_worker = asyncio.create_task(risk_services.run_risk_worker())
+    
+    # Roll new transactions into merchant_daily_stats
+    app.state.daily_stats_refresh = asyncio.create_task(transaction_stats.run_daily_stats_refresh())
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    """Stop background jobs and close pooled database connections"""
+    app.state.tombstone_compaction.cancel()
+    app.state.rollup_backfill.cancel()
+    app.state.risk_worker.cancel()
+    app.state.daily_stats_refresh.cancel()
+    await engine.dispose()
 
 @app.get("/")
 def root():
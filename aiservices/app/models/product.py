@@ -1,17 +1,21 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Date, JSON
+from sqlalchemy import Column, Integer, String, Float, DateTime, Text, ForeignKey, Date, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.mysql import INTEGER, BIGINT
 from datetime import datetime
 from app.database import Base
 
 
+# Unsigned BIGINT ids match Go's uint; SQLite only autoincrements INTEGER keys
+ID_TYPE = BIGINT(unsigned=True).with_variant(Integer, "sqlite")
+
+
 class Product(Base):
     """Product model for storing product information"""
     __tablename__ = "products"
     __table_args__ = {'extend_existing': True}
     
     # Use MySQL specific INTEGER(unsigned=True) to match Go's uint
-    id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
+    id = Column(ID_TYPE, primary_key=True, index=True)
     merchant_id = Column(BIGINT(unsigned=True), index=True, nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text)
@@ -25,6 +29,9 @@ class Product(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Soft-delete tombstone (shared with the Go backend's gorm.DeletedAt)
+    deleted_at = Column(DateTime, nullable=True, index=True)
+    
     # Relationships
     trends = relationship("ProductTrend", back_populates="product", cascade="all, delete-orphan")
     risks = relationship("ProductRisk", back_populates="product", cascade="all, delete-orphan")
@@ -32,40 +39,138 @@ class Product(Base):
 
 class ProductTrend(Base):
     __tablename__ = "product_trends"
+    # One row per product per day; record_sale upserts against this key
+    __table_args__ = (
+        UniqueConstraint("product_id", "date", name="uq_product_trends_product_date"),
+    )
     
-    id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
+    id = Column(ID_TYPE, primary_key=True, index=True)
     product_id = Column(BIGINT(unsigned=True), ForeignKey("products.id"), nullable=False)
     date = Column(Date, nullable=False, index=True)
-
+    
     quantity_sold = Column(Integer, default=0)
     revenue = Column(Float, default=0.0)
     views = Column(Integer, default=0)
     popularity_score = Column(Float, default=0.0)
-
+    
     meta_data = Column(JSON, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
-
+    
     product = relationship("Product", back_populates="trends")
 
 
 
-class ProductRisk(Base):
-    __tablename__ = "product_risks"
+class ProductTrendWeekly(Base):
+    """Product sales per ISO week, kept in step with product_trends"""
+    __tablename__ = "product_trends_weekly"
+    __table_args__ = (
+        UniqueConstraint("product_id", "week_start", name="uq_product_trends_weekly_product_week"),
+    )
+    
+    id = Column(ID_TYPE, primary_key=True)
+    product_id = Column(BIGINT(unsigned=True), ForeignKey("products.id"), nullable=False)
+    week_start = Column(Date, nullable=False)  # Monday
+    quantity_sold = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
 
-    id = Column(BIGINT(unsigned=True), primary_key=True, index=True)
+
+class ProductTrendMonthly(Base):
+    """Product sales per calendar month, kept in step with product_trends"""
+    __tablename__ = "product_trends_monthly"
+    __table_args__ = (
+        UniqueConstraint("product_id", "month_start", name="uq_product_trends_monthly_product_month"),
+    )
+    
+    id = Column(ID_TYPE, primary_key=True)
     product_id = Column(BIGINT(unsigned=True), ForeignKey("products.id"), nullable=False)
+    month_start = Column(Date, nullable=False)  # first day of the month
+    quantity_sold = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+
 
+class MerchantTrendDaily(Base):
+    """Merchant-wide sales per day, kept in step with product_trends"""
+    __tablename__ = "merchant_trends_daily"
+    __table_args__ = (
+        UniqueConstraint("merchant_id", "date", name="uq_merchant_trends_daily_merchant_date"),
+    )
+    
+    id = Column(ID_TYPE, primary_key=True)
+    merchant_id = Column(BIGINT(unsigned=True), nullable=False)
+    date = Column(Date, nullable=False)
+    quantity_sold = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+
+
+class ProductRisk(Base):
+    __tablename__ = "product_risks"
+    
+    id = Column(ID_TYPE, primary_key=True, index=True)
+    product_id = Column(BIGINT(unsigned=True), ForeignKey("products.id"), index=True, nullable=False)
+    
     risk_type = Column(String(50), nullable=False)
     risk_level = Column(String(20), nullable=False)
     risk_score = Column(Float, default=0.0)
     reason = Column(Text)
-
+    
     recommendation = Column(Text)
     calculated_at = Column(DateTime, default=datetime.utcnow)
-
+    
     product = relationship("Product", back_populates="risks")
 
 
+class ProductRiskSnapshot(Base):
+    """Overall risk of a product, kept current by the risk refresh worker"""
+    __tablename__ = "product_risk_snapshots"
+    __table_args__ = (
+        Index("ix_product_risk_snapshots_merchant_level", "merchant_id", "overall_risk_level"),
+    )
+    
+    product_id = Column(ID_TYPE, ForeignKey("products.id"), primary_key=True, autoincrement=False)
+    merchant_id = Column(BIGINT(unsigned=True), nullable=False)
+    overall_risk_level = Column(String(20), nullable=False)
+    overall_risk_score = Column(Float, default=0.0)
+    assessed_at = Column(DateTime, nullable=False)
+
+
+class RiskRefreshQueue(Base):
+    """Product waiting for the risk refresh worker; shared by every process"""
+    __tablename__ = "risk_refresh_queue"
+    
+    product_id = Column(ID_TYPE, primary_key=True, autoincrement=False)
+    version = Column(Integer, nullable=False, default=1)  # bumped by each enqueue
+    attempts = Column(Integer, nullable=False, default=0)  # failed refreshes since queued
+    queued_at = Column(DateTime, nullable=False)
+    retry_at = Column(DateTime, nullable=True)  # not taken before; also a worker's claim
+
+
+class MerchantDailyStats(Base):
+    """Per-day transaction statistics of a merchant, rolled up from the Go
+    backend's transactions by transaction_stats.refresh_daily_stats"""
+    __tablename__ = "merchant_daily_stats"
+    __table_args__ = (
+        UniqueConstraint("merchant_id", "date", name="uq_merchant_daily_stats_merchant_date"),
+    )
+    
+    id = Column(ID_TYPE, primary_key=True)
+    merchant_id = Column(BIGINT(unsigned=True), nullable=False)
+    date = Column(Date, nullable=False)  # DATE(created_at)
+    transaction_count = Column(Integer, default=0)
+    completed_count = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)  # completed transactions only
+    hour_counts = Column(JSON)  # 24 transaction counts, all statuses
+    payment_methods = Column(JSON)  # {method: completed count}
+    items = Column(JSON)  # {product name: quantity sold in completed transactions}
+    refreshed_at = Column(DateTime, default=datetime.utcnow)
+
+
+class SyncWatermark(Base):
+    """How far a rollup has read a source table"""
+    __tablename__ = "sync_watermarks"
+    
+    name = Column(String(50), primary_key=True)
+    value = Column(DateTime, nullable=False)
+
 
 class AutomationHistory(Base):
     """History of automation operations for undo functionality"""
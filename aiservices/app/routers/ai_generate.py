@@ -1,5 +1,6 @@
 from fastapi import APIRouter
-from app.services.llm_client import generate_text
+from app.services.llm_client import generate_text, inflight_requests
+from app.services.llm_cache import llm_cache
 
 router = APIRouter()
 
@@ -16,5 +17,21 @@ async def gen_desc(body: dict):
     {context}
     """
 
-    output = await generate_text(prompt)
+    # Asking again should give a fresh description, not the cached one
+    output = await generate_text(prompt, use_cache=False)
     return {"description": output}
+
+
+@router.get("/llm-cache/stats")
+def get_llm_cache_stats():
+    """Hit/miss/eviction counters for sizing the LLM response cache"""
+    stats = llm_cache.stats()
+    stats["coalescing"] = inflight_requests.stats()
+    return stats
+
+
+@router.delete("/llm-cache")
+def clear_llm_cache():
+    """Drop all entries from the in-process LLM response cache"""
+    llm_cache.clear()
+    return {"success": True}
@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from app.database import get_db
 from app.schemas.product import (
     ChatMessage, ChatResponse,
@@ -12,45 +13,23 @@ from app.services.report_service import report_service
 from app.services.education_service import education_service
 from app.services.transaction_automation import transaction_automation_service
 import json
-import asyncio
 
 router = APIRouter()
 
 
 @router.post("/message", response_model=ChatResponse)
-async def chat(message: ChatMessage, db: Session = Depends(get_db)):
+async def chat(message: ChatMessage, db: AsyncSession = Depends(get_db)):
     """Send a message to the chatbot"""
     return await chatbot_service.process_chat_message(db, message)
 
 
 @router.post("/message/stream")
-async def chat_stream(message: ChatMessage, db: Session = Depends(get_db)):
-    """Stream chatbot response in chunks for better UX"""
+async def chat_stream(message: ChatMessage, db: AsyncSession = Depends(get_db)):
+    """Stream chatbot response as server-sent events while it is generated"""
     async def generate():
-        # Get full response first
-        response = await chatbot_service.process_chat_message(db, message)
-        
-        # Send intent and confidence first
-        yield f"data: {{\"type\": \"meta\", \"intent\": \"{response.intent}\", \"confidence\": {response.confidence}}}\n\n"
-        
-        # Stream response text word by word
-        words = response.response.split()
-        for i, word in enumerate(words):
-            chunk = {
-                "type": "text",
-                "text": word + " ",
-                "done": i == len(words) - 1
-            }
-            yield f"data: {json.dumps(chunk)}\n\n"
-            await asyncio.sleep(0.03)  # 30ms delay for smooth animation
-        
-        # Send suggested actions
-        if response.suggested_actions:
-            actions_data = {
-                "type": "actions",
-                "actions": response.suggested_actions
-            }
-            yield f"data: {json.dumps(actions_data)}\n\n"
+        # Events: meta (intent), text chunks, suggested actions
+        async for event in chatbot_service.process_chat_message_stream(db, message):
+            yield f"data: {json.dumps(event)}\n\n"
         
         # Final done signal
         yield f"data: {{\"type\": \"done\"}}\n\n"
@@ -61,7 +40,7 @@ async def chat_stream(message: ChatMessage, db: Session = Depends(get_db)):
 @router.post("/automation/preview", response_model=AutomationPreview)
 async def preview_automation(
     request: AutomationExecuteRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Preview what an automation command will do"""
     result = await automation_service.preview_automation(
@@ -85,18 +64,20 @@ async def preview_automation(
         affected_products=[ProductResponse.model_validate(p) for p in result["affected_products"]],
         affected_count=result["affected_count"],
         estimated_impact=result["estimated_impact"],
-        requires_confirmation=result["requires_confirmation"]
+        requires_confirmation=result["requires_confirmation"],
+        plan_token=result["plan_token"]
     )
 
 
 @router.post("/automation/execute", response_model=AutomationResult)
 async def execute_automation(
     request: AutomationExecuteRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Execute an automation command"""
     result = await automation_service.execute_automation(
-        db, request.merchant_id, request.command, request.confirmed
+        db, request.merchant_id, request.command, request.confirmed,
+        plan_token=request.plan_token
     )
     
     if not result["success"]:
@@ -121,38 +102,38 @@ async def execute_automation(
 
 
 @router.post("/automation/undo")
-async def undo_automation(request: UndoRequest, db: Session = Depends(get_db)):
+async def undo_automation(request: UndoRequest, db: AsyncSession = Depends(get_db)):
     """Undo a previous automation operation"""
     return await automation_service.undo_last_operation(
-        db, request.merchant_id, request.operation_id
+        db, request.merchant_id, request.operation_id, request.steps
     )
 
 
 @router.get("/automation/history")
-def get_automation_history(
+async def get_automation_history(
     merchant_id: str,
     limit: int = 10,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get automation operation history"""
-    return automation_service.get_automation_history(db, merchant_id, limit)
+    return await automation_service.get_automation_history(db, merchant_id, limit)
 
 
 
 
 
 @router.get("/chat/history")
-def get_chat_history(
+async def get_chat_history(
     merchant_id: str,
     limit: int = 20,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get chat conversation history"""
     from app.models.product import ChatHistory
     
-    history = db.query(ChatHistory).filter(
+    history = (await db.scalars(select(ChatHistory).where(
         ChatHistory.merchant_id == merchant_id
-    ).order_by(ChatHistory.created_at.desc()).limit(limit).all()
+    ).order_by(ChatHistory.created_at.desc()).limit(limit))).all()
     
     return [
         {
@@ -166,28 +147,36 @@ def get_chat_history(
     ]
 
 
+@router.get("/intent-classifier/stats")
+def get_intent_classifier_stats():
+    """LLM bypass rate and accuracy of the local intent fast path"""
+    from app.services.intent_classifier import intent_classifier
+    
+    return intent_classifier.stats()
+
+
 @router.post("/business-tips")
-async def get_business_tips(merchant_id: str, db: Session = Depends(get_db)):
+async def get_business_tips(merchant_id: str, db: AsyncSession = Depends(get_db)):
     """Get business education tips based on merchant's business type"""
     return await education_service.get_business_tips(db, merchant_id)
 
 
 @router.post("/growth-strategy")
-async def get_growth_strategy(merchant_id: str, db: Session = Depends(get_db)):
+async def get_growth_strategy(merchant_id: str, db: AsyncSession = Depends(get_db)):
     """Get personalized growth strategy"""
     strategy = await education_service.get_growth_strategy(db, merchant_id)
     return {"strategy": strategy}
 
 
 @router.post("/automation/transaction")
-async def create_transaction_auto(merchant_id: str, description: str, db: Session = Depends(get_db)):
+async def create_transaction_auto(merchant_id: str, description: str, db: AsyncSession = Depends(get_db)):
     """Create transaction from natural language description"""
     result = await transaction_automation_service.create_transaction_data(db, merchant_id, description)
     return result
 
 
 @router.post("/automation/batch-products")
-async def batch_add_products(merchant_id: str, description: str, db: Session = Depends(get_db)):
+async def batch_add_products(merchant_id: str, description: str, db: AsyncSession = Depends(get_db)):
     """Add multiple products from package description"""
     result = await transaction_automation_service.batch_add_products(db, merchant_id, description)
     return result
@@ -1,5 +1,5 @@
 from fastapi import APIRouter, Depends, Query
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.schemas.transaction import (
     TransactionSummaryRequest,
@@ -15,16 +15,17 @@ router = APIRouter()
 @router.post("/summary", response_model=TransactionSummaryResponse)
 async def get_transaction_summary(
     request: TransactionSummaryRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Generate AI-powered transaction summary"""
     result = await transaction_summary_service.generate_transaction_summary(
         db=db,
         merchant_id=request.merchant_id,
-        date_from=request.date_from,
-        date_to=request.date_to,
+        date_from=request.date_from.isoformat() if request.date_from else None,
+        date_to=request.date_to.isoformat() if request.date_to else None,
         payment_method=request.payment_method,
-        limit=request.limit
+        limit=request.limit,
+        include_samples=request.include_samples
     )
     
     return TransactionSummaryResponse(
@@ -33,14 +34,15 @@ async def get_transaction_summary(
         total_revenue=result["total_revenue"],
         average_transaction=result["average_transaction"],
         insights=[TransactionInsight(**insight) for insight in result["insights"]],
-        period=result["period"]
+        period=result["period"],
+        samples=result.get("samples")
     )
 
 
 @router.post("/analyze")
 async def analyze_transactions(
     request: TransactionAnalyticsRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Analyze transactions based on natural language query"""
     result = await transaction_summary_service.analyze_transaction_query(
@@ -63,7 +65,7 @@ async def analyze_transactions(
 async def get_transaction_insights(
     merchant_id: str,
     days: int = Query(default=7, ge=1, le=90),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get transaction insights for the past N days"""
     from datetime import datetime, timedelta
@@ -1,46 +1,137 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+import json
+from typing import AsyncIterator, Iterable, List, Union
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
 from app.database import get_db
 from app.schemas.product import (
-    RecordSaleRequest, TrendAnalysisResponse, DemandPrediction
+    RecordSaleRequest, TrendAnalysisResponse, DemandPrediction, BatchTrendRequest,
+    BulkSaleResult
 )
 from app.services import trend_service
 
 router = APIRouter()
 
 
+def _ndjson(results: Iterable[BaseModel]) -> StreamingResponse:
+    """Stream one JSON object per line as each result is computed"""
+    return StreamingResponse(
+        (result.model_dump_json() + "\n" for result in results),
+        media_type="application/x-ndjson"
+    )
+
+
+async def _batch_products(request: BatchTrendRequest, db: AsyncSession):
+    if request.product_ids is None and request.merchant_id is None:
+        raise HTTPException(status_code=400, detail="Provide product_ids or merchant_id")
+    return await trend_service.get_batch_products(db, request.product_ids, request.merchant_id)
+
+
 @router.post("/record-sale")
-def record_sale(sale: RecordSaleRequest, db: Session = Depends(get_db)):
+async def record_sale(sale: RecordSaleRequest, db: AsyncSession = Depends(get_db)):
     """Record a product sale for trend tracking"""
-    trend = trend_service.record_sale(db, sale)
+    recorded = await trend_service.record_sale(db, sale)
     return {
         "success": True,
         "message": "Sale recorded successfully",
-        "trend_id": trend.id,
-        "date": trend.date.isoformat()
+        "trend_id": recorded.trend_id,
+        "date": recorded.date.isoformat()
     }
 
 
+async def _ndjson_lines(request: Request) -> AsyncIterator[bytes]:
+    """Yield the body's non-empty lines as chunks arrive, so an NDJSON
+    upload is never held in memory whole; each line is validated later"""
+    pending = b""
+    async for chunk in request.stream():
+        *lines, pending = (pending + chunk).split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+        if len(pending) > settings.trend_bulk_max_line_bytes:
+            raise HTTPException(status_code=413, detail="NDJSON line too long")
+    if pending.strip():
+        yield pending
+
+
+async def _read_json_body(request: Request, limit: int) -> bytes:
+    """The request body, refusing bodies over limit bytes before reading them"""
+    if int(request.headers.get("content-length") or 0) > limit:
+        raise HTTPException(status_code=413, detail=f"Body larger than {limit} bytes; send NDJSON instead")
+    body = bytearray()
+    async for chunk in request.stream():
+        body += chunk
+        if len(body) > limit:
+            raise HTTPException(status_code=413, detail=f"Body larger than {limit} bytes; send NDJSON instead")
+    return bytes(body)
+
+
+async def _read_sale_rows(request: Request) -> Union[List[dict], AsyncIterator[bytes]]:
+    """Sale rows from a JSON array body, or one JSON line each streamed from NDJSON"""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(("application/x-ndjson", "application/jsonl")):
+        return _ndjson_lines(request)
+    
+    try:
+        rows = json.loads(await _read_json_body(request, settings.trend_bulk_max_json_bytes))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(rows, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array of sales")
+    return rows
+
+
+@router.post("/record-sales:bulk", response_model=BulkSaleResult)
+async def record_sales_bulk(request: Request, db: AsyncSession = Depends(get_db)):
+    """Record many sales at once (JSON array or NDJSON of RecordSaleRequest)
+    
+    NDJSON is read line by line as it arrives; JSON arrays are limited to
+    TREND_BULK_MAX_JSON_BYTES.
+    """
+    rows = await _read_sale_rows(request)
+    return await trend_service.record_sales_bulk(db, rows)
+
+
 @router.get("/analysis/{product_id}", response_model=TrendAnalysisResponse)
-def get_trend_analysis(
+async def get_trend_analysis(
     product_id: int,
     days: int = 30,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get trend analysis for a product"""
     try:
-        return trend_service.analyze_product_trend(db, product_id, days)
+        return await trend_service.analyze_product_trend(db, product_id, days)
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
+@router.post("/analysis:batch")
+async def get_trend_analysis_batch(request: BatchTrendRequest, db: AsyncSession = Depends(get_db)):
+    """Get trend analysis for many products, streamed as NDJSON"""
+    products, missing = await _batch_products(request, db)
+    results = await trend_service.analyze_trends_batch(
+        db, products, missing, request.days, request.include_data_points
+    )
+    return _ndjson(results)
+
+
+@router.post("/predict:batch")
+async def predict_demand_batch(request: BatchTrendRequest, db: AsyncSession = Depends(get_db)):
+    """Get demand predictions for many products, streamed as NDJSON"""
+    products, missing = await _batch_products(request, db)
+    results = await trend_service.predict_demand_batch(db, products, missing)
+    return _ndjson(results)
+
+
 @router.get("/predict/{product_id}", response_model=DemandPrediction)
-def predict_demand(product_id: int, db: Session = Depends(get_db)):
+async def predict_demand(product_id: int, db: AsyncSession = Depends(get_db)):
     """Get demand prediction for a product"""
-    return trend_service.predict_demand(db, product_id)
+    return await trend_service.predict_demand(db, product_id)
 
 
 @router.get("/recommendations/{product_id}")
-def get_recommendations(product_id: int, db: Session = Depends(get_db)):
+async def get_recommendations(product_id: int, db: AsyncSession = Depends(get_db)):
     """Get purchase quantity recommendations"""
-    return trend_service.recommend_order_quantity(db, product_id)
+    return await trend_service.recommend_order_quantity(db, product_id)
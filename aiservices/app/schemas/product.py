@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime, date
+import datetime as dt
 
 
 # ===== Product Schemas =====
@@ -41,6 +42,7 @@ class ProductResponse(ProductBase):
     
     class Config:
         from_attributes = True
+        coerce_numbers_to_str = True  # merchant_id is an integer column
 
 
 # ===== Trend Schemas =====
@@ -58,7 +60,7 @@ class RecordSaleRequest(BaseModel):
     product_id: int
     merchant_id: str
     quantity: int
-    date: Optional[date] = None
+    date: Optional[dt.date] = None  # dt.date: the field name shadows the type here
 
 
 class TrendAnalysisResponse(BaseModel):
@@ -80,6 +82,41 @@ class DemandPrediction(BaseModel):
     predicted_demand_next_30_days: float
     confidence_level: str  # "low", "medium", "high"
     recommendation: str
+    forecast_model: Optional[str] = None  # "naive", "ses", "holt", "holt_winters"
+    interval_level: Optional[float] = None  # e.g. 0.9 for 90% prediction intervals
+    predicted_demand_next_7_days_lower: Optional[float] = None
+    predicted_demand_next_7_days_upper: Optional[float] = None
+    predicted_demand_next_30_days_lower: Optional[float] = None
+    predicted_demand_next_30_days_upper: Optional[float] = None
+
+
+class BulkSaleRowError(BaseModel):
+    """A rejected line of a bulk sale upload"""
+    index: int
+    error: str
+
+
+class BulkSaleResult(BaseModel):
+    """Outcome of a bulk sale upload, in upload order"""
+    accepted: List[bool]
+    accepted_count: int
+    rejected_count: int
+    trend_rows: int  # product/day rows written after aggregation
+    errors: List[BulkSaleRowError]
+
+
+class BatchTrendRequest(BaseModel):
+    """Request trend results for many products at once"""
+    product_ids: Optional[List[int]] = Field(default=None, max_length=500)
+    merchant_id: Optional[int] = None  # All of a merchant's products (or filter product_ids)
+    days: int = Field(default=30, ge=1, le=365)
+    include_data_points: bool = True
+
+
+class BatchTrendError(BaseModel):
+    """Batch result line for a product that could not be analyzed"""
+    product_id: int
+    error: str
 
 
 # ===== Risk Schemas =====
@@ -139,6 +176,7 @@ class AutomationPreview(BaseModel):
     affected_count: int
     estimated_impact: str
     requires_confirmation: bool
+    plan_token: Optional[str] = None  # Pass to execute to skip re-parsing
 
 
 class AutomationExecuteRequest(BaseModel):
@@ -146,6 +184,7 @@ class AutomationExecuteRequest(BaseModel):
     merchant_id: str
     command: str
     confirmed: bool = False
+    plan_token: Optional[str] = None  # From a previous preview
 
 
 class AutomationResult(BaseModel):
@@ -163,6 +202,7 @@ class UndoRequest(BaseModel):
     """Request to undo an operation"""
     merchant_id: str
     operation_id: Optional[int] = None  # If None, undo last operation
+    steps: int = Field(default=1, ge=1, le=50)  # Undo this many recent operations
 
 
 # ===== Search Schemas =====
@@ -1,15 +1,16 @@
 from pydantic import BaseModel, Field
 from typing import List, Optional
-from datetime import datetime
+from datetime import date, datetime
 
 
 class TransactionSummaryRequest(BaseModel):
     """Request for transaction summary generation"""
     merchant_id: str
-    date_from: Optional[str] = None  # ISO format date string
-    date_to: Optional[str] = None
+    date_from: Optional[date] = None  # ISO format, malformed dates are a 422
+    date_to: Optional[date] = None
     payment_method: Optional[str] = None
-    limit: int = Field(default=100, le=1000)
+    limit: int = Field(default=100, le=1000)  # samples returned with include_samples
+    include_samples: bool = False
 
 
 class TransactionInsight(BaseModel):
@@ -21,6 +22,17 @@ class TransactionInsight(BaseModel):
     confidence: float = Field(default=1.0, ge=0.0, le=1.0)
 
 
+class TransactionSample(BaseModel):
+    """One recent transaction returned alongside a summary"""
+    id: int
+    total_amount: float
+    payment_method: Optional[str] = None
+    customer_name: Optional[str] = None
+    status: Optional[str] = None
+    created_at: datetime
+    items: List[str]  # "product name (quantity)"
+
+
 class TransactionSummaryResponse(BaseModel):
     """AI-generated transaction summary"""
     summary: str  # Natural language summary
@@ -29,6 +41,7 @@ class TransactionSummaryResponse(BaseModel):
     average_transaction: float
     insights: List[TransactionInsight]
     period: str  # Description of the time period analyzed
+    samples: Optional[List[TransactionSample]] = None
 
 
 class TransactionAnalyticsRequest(BaseModel):
@@ -1,15 +1,27 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import case, delete, select, update
 from typing import List, Dict, Optional
 from datetime import datetime
 from app.models.product import Product, AutomationHistory, ChatHistory
 from app.services.product_service import get_products_by_ingredient
+from app.services.risk_refresh import enqueue_risk_refresh
 from app.services.llm_client import generate_text
+from app.config import settings
+import base64
+import hashlib
+import hmac
 import json
 import logging
+import secrets
+import time
+import zlib
 from jsonschema import validate, ValidationError
 
 logger = logging.getLogger(__name__)
 
+# Used to sign plan tokens when no automation_plan_secret is configured
+_PROCESS_PLAN_SECRET = secrets.token_bytes(32)
+
 automation_schema = {
     "type": "object",
     "properties": {
@@ -30,13 +42,21 @@ automation_schema = {
 
 
 async def preview_automation(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
-    command: str
+    command: str,
+    parsed: Optional[Dict] = None
 ) -> Dict:
-    """Preview what an automation command will do without executing"""
+    """Preview what an automation command will do without executing
+    
+    A command already parsed by the caller (e.g. the chatbot's combined
+    classification call) can be passed as `parsed` to skip the LLM.
+    """
     # Parse the command to understand intent
-    parsed = await _parse_automation_command(command, merchant_id)
+    if parsed is not None:
+        parsed = _validate_parsed_command(parsed)
+    else:
+        parsed = await _parse_automation_command(command, merchant_id)
     
     if not parsed["success"]:
         return {
@@ -64,15 +84,31 @@ async def preview_automation(
         impact = f"This will mark {len(affected_products)} products as out of stock. Sales will be blocked until restocked."
     elif action == "delete":
         description = f"Delete all products matching: {filters.get('description', 'unknown criteria')}"
-        impact = f"This will permanently delete {len(affected_products)} products from your inventory. This cannot be easily undone."
+        impact = f"This will delete {len(affected_products)} products from your inventory. They can be restored with undo."
     elif action == "update_stock":
-        new_stock = filters.get("new_stock", 0)
+        new_stock = parsed.get("new_stock", filters.get("new_stock", 0))
         description = f"Update stock to {new_stock} for products matching: {filters.get('description', 'unknown criteria')}"
         impact = f"This will update stock levels for {len(affected_products)} products."
     else:
         description = f"Unknown action: {action}"
         impact = "Cannot determine impact"
     
+    requires_confirmation = len(affected_products) > 5 or action == "delete"
+    
+    # Signed snapshot of this preview so execute can skip re-parsing
+    plan_token = _sign_plan({
+        "merchant_id": str(merchant_id),
+        "command": _command_digest(command),
+        "action": action,
+        "filters": filters,
+        "new_stock": parsed.get("new_stock"),
+        "description": description,
+        "estimated_impact": impact,
+        "requires_confirmation": requires_confirmation,
+        "products": [[p.id, _version_of(p)] for p in affected_products],
+        "expires_at": time.time() + settings.automation_plan_ttl_seconds
+    })
+    
     return {
         "success": True,
         "operation_type": action,
@@ -80,19 +116,31 @@ async def preview_automation(
         "affected_products": affected_products,
         "affected_count": len(affected_products),
         "estimated_impact": impact,
-        "requires_confirmation": len(affected_products) > 5 or action == "delete"
+        "requires_confirmation": requires_confirmation,
+        "new_stock": parsed.get("new_stock"),
+        "plan_token": plan_token
     }
 
 
 async def execute_automation(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
     command: str,
-    confirmed: bool = False
+    confirmed: bool = False,
+    plan_token: Optional[str] = None
 ) -> Dict:
-    """Execute an automation command"""
-    # Get preview first
-    preview = await preview_automation(db, merchant_id, command)
+    """Execute an automation command
+    
+    With a plan_token from preview_automation the parsed action and the
+    affected products come from the token: no LLM call and no filter
+    query. The token must belong to this merchant and command, and
+    products modified since the preview abort the execution.
+    """
+    # Reuse the confirmed preview when available, otherwise preview again
+    if plan_token:
+        preview = await _preview_from_plan(db, merchant_id, plan_token, command)
+    else:
+        preview = await preview_automation(db, merchant_id, command)
     
     if not preview["success"]:
         return preview
@@ -122,24 +170,45 @@ async def execute_automation(
             "description": product.description
         }
     
-    # Execute action
+    # Execute action as set-based statements, one per chunk of IDs
     try:
-        if action == "empty_stock":
-            for product in affected_products:
-                product.stock = 0
-                product.updated_at = datetime.utcnow()
+        now = datetime.utcnow()
+        
+        if action in ("empty_stock", "update_stock"):
+            if action == "empty_stock":
+                new_stock = 0
+            else:
+                new_stock = preview.get("new_stock")
+                if new_stock is None:
+                    new_stock = await _extract_stock_value(command)
             
-        elif action == "update_stock":
-            new_stock = await _extract_stock_value(command)
-            for product in affected_products:
-                product.stock = new_stock
-                product.updated_at = datetime.utcnow()
+            for chunk in _chunked(affected_ids):
+                await db.execute(
+                    update(Product)
+                    .where(
+                        Product.merchant_id == int(merchant_id),
+                        Product.id.in_(chunk),
+                        Product.deleted_at.is_(None)
+                    )
+                    .values(stock=new_stock, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
         
         elif action == "delete":
-            for product in affected_products:
-                db.delete(product)
+            # Soft delete: tombstones keep the rows so undo is a bulk update
+            for chunk in _chunked(affected_ids):
+                await db.execute(
+                    update(Product)
+                    .where(
+                        Product.merchant_id == int(merchant_id),
+                        Product.id.in_(chunk),
+                        Product.deleted_at.is_(None)
+                    )
+                    .values(deleted_at=now, updated_at=now)
+                    .execution_options(synchronize_session=False)
+                )
         
-        # Save automation history
+        # Save automation history in the same transaction
         history = AutomationHistory(
             merchant_id=merchant_id,
             operation_type=action,
@@ -149,7 +218,8 @@ async def execute_automation(
         )
         db.add(history)
         
-        db.commit()
+        await enqueue_risk_refresh(db, affected_ids)
+        await db.commit()
         
         return {
             "success": True,
@@ -162,7 +232,7 @@ async def execute_automation(
         }
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         return {
             "success": False,
             "error": f"Failed to execute automation: {str(e)}"
@@ -170,60 +240,115 @@ async def execute_automation(
 
 
 async def undo_last_operation(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
-    operation_id: Optional[int] = None
+    operation_id: Optional[int] = None,
+    steps: int = 1
 ) -> Dict:
-    """Undo a previous automation operation"""
+    """Undo a previous automation operation
+    
+    Undoes `operation_id`, or else the `steps` most recent operations as one
+    chain. All products are restored with bulk CASE updates and the history
+    rows are removed in a single transaction.
+    """
     if operation_id:
-        history = db.query(AutomationHistory).filter(
+        histories = (await db.scalars(select(AutomationHistory).where(
             AutomationHistory.id == operation_id,
             AutomationHistory.merchant_id == merchant_id
-        ).first()
+        ))).all()
     else:
-        # Get most recent operation
-        history = db.query(AutomationHistory).filter(
+        # Get most recent operations
+        histories = (await db.scalars(select(AutomationHistory).where(
             AutomationHistory.merchant_id == merchant_id
-        ).order_by(AutomationHistory.executed_at.desc()).first()
+        ).order_by(
+            AutomationHistory.executed_at.desc(), AutomationHistory.id.desc()
+        ).limit(steps))).all()
     
-    if not history:
+    if not histories:
         return {
             "success": False,
             "error": "No operation found to undo"
         }
     
+    history_ids = [h.id for h in histories]
+    operations = ", ".join(f"'{h.operation_type}'" for h in histories)
+    
+    # Walk newest to oldest so the oldest snapshot of each product wins
+    restore_stock = {}
+    undelete_ids = set()
+    for history in histories:
+        if history.operation_type == "delete":
+            undelete_ids.update(int(product_id) for product_id in history.affected_product_ids)
+            continue
+        for product_id, previous_values in history.previous_state.items():
+            if "stock" in previous_values:
+                restore_stock[int(product_id)] = previous_values["stock"]
+    
     # Restore previous state
     try:
-        restored_count = 0
+        # A product undone by several steps, or both undeleted and restocked,
+        # counts once
+        restored_ids = set()
+        for chunk in _chunked(sorted(undelete_ids | set(restore_stock))):
+            for product_id, deleted_at in (await db.execute(
+                select(Product.id, Product.deleted_at).where(
+                    Product.merchant_id == int(merchant_id),
+                    Product.id.in_(chunk)
+                )
+            )).all():
+                if product_id in restore_stock or deleted_at is not None:
+                    restored_ids.add(product_id)
+        restored_count = len(restored_ids)
+        now = datetime.utcnow()
         
-        if history.operation_type == "delete":
-            # Cannot restore deleted products easily
-            return {
-                "success": False,
-                "error": "Cannot undo delete operations. Products have been permanently removed."
-            }
-        
-        for product_id, previous_values in history.previous_state.items():
-            product = db.query(Product).filter(Product.id == product_id).first()
-            if product:
-                product.stock = previous_values.get("stock", product.stock)
-                product.updated_at = datetime.utcnow()
-                restored_count += 1
+        # Clear tombstones left by delete operations
+        for chunk in _chunked(sorted(undelete_ids)):
+            await db.execute(
+                update(Product)
+                .where(
+                    Product.merchant_id == int(merchant_id),
+                    Product.id.in_(chunk),
+                    Product.deleted_at.isnot(None)
+                )
+                .values(deleted_at=None, updated_at=now)
+                .execution_options(synchronize_session=False)
+            )
         
-        db.commit()
+        for chunk in _chunked(list(restore_stock)):
+            await db.execute(
+                update(Product)
+                .where(
+                    Product.merchant_id == int(merchant_id),
+                    Product.id.in_(chunk)
+                )
+                .values(
+                    stock=case(
+                        {product_id: restore_stock[product_id] for product_id in chunk},
+                        value=Product.id
+                    ),
+                    updated_at=now
+                )
+                .execution_options(synchronize_session=False)
+            )
         
-        # Delete history record
-        db.delete(history)
-        db.commit()
+        # Delete history records
+        await db.execute(
+            delete(AutomationHistory)
+            .where(AutomationHistory.id.in_(history_ids))
+            .execution_options(synchronize_session=False)
+        )
+        await enqueue_risk_refresh(db, undelete_ids | set(restore_stock))
+        await db.commit()
         
         return {
             "success": True,
-            "message": f"Successfully undone operation '{history.operation_type}'. Restored {restored_count} products.",
-            "restored_count": restored_count
+            "message": f"Successfully undone operation {operations}. Restored {restored_count} products.",
+            "restored_count": restored_count,
+            "undone_operation_ids": history_ids
         }
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         return {
             "success": False,
             "error": f"Failed to undo operation: {str(e)}"
@@ -275,18 +400,8 @@ IMPORTANT: Always include the "description" field in filters. Return ONLY the JS
             response = response.replace("```", "").strip()
         
         parsed = json.loads(response)
-        
-        # Add fallback description if missing
-        if "filters" in parsed and "description" not in parsed["filters"]:
-            search_query = parsed["filters"].get("search_query", "")
-            ingredient = parsed["filters"].get("ingredient", "")
-            parsed["filters"]["description"] = search_query or ingredient or "produk yang dimaksud"
-        
-        # Validate schema
-        validate(parsed, automation_schema)
-        parsed["success"] = True
-        return parsed
-
+        return _normalize_parsed_command(parsed)
+    
     except json.JSONDecodeError as e:
         logger.error(f"Failed to parse LLM JSON response: {e}. Response was: {response}")
         return {
@@ -307,6 +422,184 @@ IMPORTANT: Always include the "description" field in filters. Return ONLY the JS
         }
 
 
+class PlanTokenError(Exception):
+    """Raised when an automation plan token is invalid, expired or foreign"""
+
+
+class PlanSignatureError(PlanTokenError):
+    """Raised when a plan token was not signed with this process's key"""
+
+
+def _plan_secret() -> bytes:
+    return settings.automation_plan_secret.encode("utf-8") or _PROCESS_PLAN_SECRET
+
+
+def _sign_plan(plan: Dict) -> str:
+    """Serialize, compress and HMAC-sign a preview plan"""
+    payload = zlib.compress(json.dumps(plan, separators=(",", ":")).encode("utf-8"))
+    body = base64.urlsafe_b64encode(payload).rstrip(b"=")
+    signature = base64.urlsafe_b64encode(
+        hmac.new(_plan_secret(), body, hashlib.sha256).digest()
+    ).rstrip(b"=")
+    return (body + b"." + signature).decode("ascii")
+
+
+def _command_digest(command: str) -> str:
+    """Hash of a command for binding a plan token to it, ignoring whitespace"""
+    return hashlib.sha256(" ".join(command.split()).encode("utf-8")).hexdigest()
+
+
+def _load_plan(plan_token: str, merchant_id: str, command: str, verify: bool = True) -> Dict:
+    """Verify a plan token issued for this merchant and command and return
+    its plan; raises PlanTokenError
+    
+    verify=False skips only the signature check, for comparing an
+    unverifiable plan against a fresh preview.
+    """
+    try:
+        body, signature = plan_token.encode("ascii").split(b".")
+        padded = body + b"=" * (-len(body) % 4)
+        plan = json.loads(zlib.decompress(base64.urlsafe_b64decode(padded)))
+    except (ValueError, zlib.error):
+        raise PlanTokenError("Malformed plan token")
+    
+    expected = base64.urlsafe_b64encode(
+        hmac.new(_plan_secret(), body, hashlib.sha256).digest()
+    ).rstrip(b"=")
+    if verify and not hmac.compare_digest(signature, expected):
+        raise PlanSignatureError("Invalid plan token signature")
+    
+    if plan["expires_at"] < time.time():
+        raise PlanTokenError("Plan token expired")
+    if plan["merchant_id"] != str(merchant_id):
+        raise PlanTokenError("Plan token belongs to another merchant")
+    if plan.get("command") != _command_digest(command):
+        raise PlanTokenError("Plan token was issued for another command")
+    return plan
+
+
+def _chunked(ids: List[int], size: Optional[int] = None):
+    """Split an ID list into IN-clause sized chunks"""
+    size = size or settings.automation_bulk_chunk_size
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+def _version_of(product) -> List:
+    """What a plan records of a product to detect changes before execution
+    
+    updated_at alone can miss a write in the same second (MySQL DATETIME),
+    so the stock and price the preview showed are compared too.
+    """
+    updated_at = product.updated_at.isoformat() if product.updated_at else None
+    return [updated_at, product.stock, product.price]
+
+
+async def _preview_from_plan(db: AsyncSession, merchant_id: str, plan_token: str, command: str) -> Dict:
+    """Rebuild a preview from a plan token, checking products for drift"""
+    try:
+        plan = _load_plan(plan_token, merchant_id, command)
+    except PlanSignatureError:
+        # Signed by another worker process or before a restart
+        return await _repreview_plan(db, merchant_id, plan_token, command)
+    except PlanTokenError as e:
+        logger.warning(f"Rejected automation plan token: {e}")
+        return {
+            "success": False,
+            "error": "Preview sudah kedaluwarsa atau tidak valid. Silakan lakukan preview ulang."
+        }
+    
+    # One narrow SELECT serves both the drift check and the undo snapshot
+    versions = {product_id: version for product_id, version in plan["products"]}
+    affected_products = []
+    for chunk in _chunked(list(versions)):
+        affected_products.extend((await db.execute(select(
+            Product.id, Product.updated_at, Product.stock,
+            Product.name, Product.price, Product.description
+        ).where(
+            Product.merchant_id == int(merchant_id),
+            Product.id.in_(chunk)
+        ))).all())
+    
+    # Optimistic concurrency: every product must be unchanged since preview
+    drifted = len(affected_products) != len(versions) or any(
+        _version_of(p) != versions[p.id] for p in affected_products
+    )
+    if drifted:
+        return {
+            "success": False,
+            "error": "Data produk berubah sejak preview dibuat. Silakan lakukan preview ulang sebelum eksekusi."
+        }
+    
+    return {
+        "success": True,
+        "operation_type": plan["action"],
+        "description": plan["description"],
+        "affected_products": affected_products,
+        "affected_count": len(affected_products),
+        "estimated_impact": plan["estimated_impact"],
+        "requires_confirmation": plan["requires_confirmation"],
+        "new_stock": plan["new_stock"]
+    }
+
+
+async def _repreview_plan(db: AsyncSession, merchant_id: str, plan_token: str, command: str) -> Dict:
+    """Preview the command again for a plan token this process cannot verify
+    
+    The fresh preview is used only when it matches the token's action and
+    product versions exactly, so the merchant executes what they confirmed
+    and a forged token gains nothing over executing without one.
+    """
+    try:
+        plan = _load_plan(plan_token, merchant_id, command, verify=False)
+    except PlanTokenError as e:
+        logger.warning(f"Rejected automation plan token: {e}")
+        return {
+            "success": False,
+            "error": "Preview sudah kedaluwarsa atau tidak valid. Silakan lakukan preview ulang."
+        }
+    
+    logger.info("Automation plan token signed with another key; previewing again")
+    preview = await preview_automation(db, merchant_id, command)
+    if not preview["success"]:
+        return preview
+    
+    current = sorted([p.id, _version_of(p)] for p in preview["affected_products"])
+    if preview["operation_type"] != plan["action"] or current != sorted(plan["products"]):
+        return {
+            "success": False,
+            "error": "Data produk berubah sejak preview dibuat. Silakan lakukan preview ulang sebelum eksekusi."
+        }
+    return preview
+
+
+def _normalize_parsed_command(parsed: Dict) -> Dict:
+    """Fill defaults and validate a parsed command; raises ValidationError"""
+    # Add fallback description if missing
+    if "filters" in parsed and "description" not in parsed["filters"]:
+        search_query = parsed["filters"].get("search_query", "")
+        ingredient = parsed["filters"].get("ingredient", "")
+        parsed["filters"]["description"] = search_query or ingredient or "produk yang dimaksud"
+    
+    # Validate schema
+    validate(parsed, automation_schema)
+    parsed.setdefault("filters", {})
+    parsed["success"] = True
+    return parsed
+
+
+def _validate_parsed_command(parsed: Dict) -> Dict:
+    """Normalize an externally parsed command into the preview result shape"""
+    try:
+        return _normalize_parsed_command(dict(parsed))
+    except ValidationError as e:
+        logger.error(f"Parsed automation command failed validation: {e}")
+        return {
+            "success": False,
+            "error": "Hmm, saya kurang paham maksud perintahnya. Coba jelaskan lebih detail produk mana yang ingin diubah. Contoh: 'Hapus semua roti' atau 'Kosongkan stok produk tepung'"
+        }
+
+
 async def _extract_stock_value(command: str) -> int:
     """Extract stock value from command if updating stock"""
     # Simple extraction - look for numbers
@@ -316,12 +609,15 @@ async def _extract_stock_value(command: str) -> int:
 
 
 async def _find_affected_products(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
     filters: Dict
 ) -> List[Product]:
     """Find products that match the given filters"""
-    query = db.query(Product).filter(Product.merchant_id == int(merchant_id))
+    query = select(Product).where(
+        Product.merchant_id == int(merchant_id),
+        Product.deleted_at.is_(None)
+    )
     
     # Apply filters
     search_query = filters.get("search_query", "")
@@ -329,7 +625,7 @@ async def _find_affected_products(
     
     if search_query:
         # Search in name, description, category, or ingredients
-        query = query.filter(
+        query = query.where(
             (Product.name.ilike(f"%{search_query}%")) |
             (Product.description.ilike(f"%{search_query}%")) |
             (Product.category.ilike(f"%{search_query}%")) |
@@ -338,20 +634,20 @@ async def _find_affected_products(
     
     if ingredient:
         # Search specifically in ingredients field
-        query = query.filter(Product.ingredients.ilike(f"%{ingredient}%"))
+        query = query.where(Product.ingredients.ilike(f"%{ingredient}%"))
     
-    return query.all()
+    return (await db.scalars(query)).all()
 
 
-def get_automation_history(
-    db: Session,
+async def get_automation_history(
+    db: AsyncSession,
     merchant_id: str,
     limit: int = 10
 ) -> List[Dict]:
     """Get automation history for a merchant"""
-    history = db.query(AutomationHistory).filter(
+    history = (await db.scalars(select(AutomationHistory).where(
         AutomationHistory.merchant_id == merchant_id
-    ).order_by(AutomationHistory.executed_at.desc()).limit(limit).all()
+    ).order_by(AutomationHistory.executed_at.desc()).limit(limit))).all()
     
     return [
         {
@@ -360,7 +656,7 @@ def get_automation_history(
             "command": h.command,
             "affected_count": len(h.affected_product_ids),
             "executed_at": h.executed_at.isoformat(),
-            "can_undo": h.operation_type != "delete"
+            "can_undo": True
         }
         for h in history
     ]
@@ -1,12 +1,15 @@
-from sqlalchemy.orm import Session
-from typing import Dict
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from typing import Dict, AsyncIterator, Optional
 from app.models.product import Product
-from app.services.llm_client import generate_text
-from app.services.automation_service import preview_automation, execute_automation
+from app.services.llm_client import generate_text, generate_text_stream
+from app.services.automation_service import preview_automation, execute_automation, automation_schema
 from app.services.risk_services import get_high_risk_products, generate_risk_report
+from app.services.intent_classifier import intent_classifier
 from app.schemas.product import ChatMessage, ChatResponse
 import json
 import logging
+from jsonschema import validate, ValidationError
 
 logger = logging.getLogger(__name__)
 
@@ -43,17 +46,79 @@ Examples of what you can do:
 
 
 async def process_chat_message(
-    db: Session,
+    db: AsyncSession,
     message: ChatMessage
 ) -> ChatResponse:
     """Main entry point for processing chat messages"""
-    from app.models.product import ChatHistory
-    
     # Use hardcoded chatbot prompt
     system_prompt = chatbot_prompt
     
     # Build conversation context if history is provided
-    conversation_context = ""
+    conversation_context = _build_conversation_context(message)
+    
+    # Classify intent with conversation context
+    intent_result = await classify_intent(message.message, system_prompt, conversation_context)
+    intent = intent_result["intent"]
+    confidence = intent_result["confidence"]
+    
+    # Route to appropriate handler (pass conversation context for query handler)
+    response_text, suggested_actions = await _route_intent(
+        db, message, intent, conversation_context, intent_result.get("arguments")
+    )
+    
+    # Save chat history
+    await _save_chat_history(db, message, response_text, intent)
+    
+    return ChatResponse(
+        response=response_text,
+        intent=intent,
+        confidence=confidence,
+        suggested_actions=suggested_actions
+    )
+
+
+async def process_chat_message_stream(
+    db: AsyncSession,
+    message: ChatMessage
+) -> AsyncIterator[Dict]:
+    """
+    Streaming variant of process_chat_message
+    
+    Yields event dicts: a "meta" event with the intent, "text" events as the
+    response is produced, then "actions". Free-form answers are streamed
+    token by token from the LLM; templated responses arrive as one chunk.
+    """
+    conversation_context = _build_conversation_context(message)
+    
+    intent_result = await classify_intent(message.message, chatbot_prompt, conversation_context)
+    intent = intent_result["intent"]
+    yield {"type": "meta", "intent": intent, "confidence": intent_result["confidence"]}
+    
+    if intent == "query" and not _is_list_request(message.message):
+        parts = []
+        async for chunk in _stream_query(
+            db, message.merchant_id, message.message, conversation_context
+        ):
+            parts.append(chunk)
+            yield {"type": "text", "text": chunk, "done": False}
+        response_text = "".join(parts)
+        suggested_actions = QUERY_SUGGESTED_ACTIONS
+    else:
+        response_text, suggested_actions = await _route_intent(
+            db, message, intent, conversation_context, intent_result.get("arguments")
+        )
+        yield {"type": "text", "text": response_text, "done": False}
+    
+    yield {"type": "text", "text": "", "done": True}
+    
+    await _save_chat_history(db, message, response_text, intent)
+    
+    if suggested_actions:
+        yield {"type": "actions", "actions": suggested_actions}
+
+
+def _build_conversation_context(message: ChatMessage) -> str:
+    """Render the conversation history and current message for prompts"""
     if message.conversation_history and len(message.conversation_history) > 0:
         conversation_context = "\n\nPrevious conversation:\n"
         for msg in message.conversation_history:
@@ -62,48 +127,56 @@ async def process_chat_message(
         conversation_context += f"\nCurrent message from User: {message.message}\n"
     else:
         conversation_context = f"\nUser: {message.message}\n"
-    
-    # Classify intent with conversation context
-    intent_result = await classify_intent(message.message, system_prompt, conversation_context)
-    intent = intent_result["intent"]
-    confidence = intent_result["confidence"]
-    
-    # Route to appropriate handler (pass conversation context for query handler)
+    return conversation_context
+
+
+async def _route_intent(
+    db: AsyncSession,
+    message: ChatMessage,
+    intent: str,
+    conversation_context: str,
+    arguments: Optional[Dict] = None
+) -> tuple[str, list[str]]:
+    """Dispatch a classified message to its intent handler"""
     if intent == "automation":
-        response_text, suggested_actions = await _handle_automation_request(
-            db, message.merchant_id, message.message
+        return await _handle_automation_request(
+            db, message.merchant_id, message.message, arguments
         )
     elif intent == "add_product":
-        response_text, suggested_actions = await _handle_add_product(
-            db, message.merchant_id, message.message
+        return await _handle_add_product(
+            db, message.merchant_id, message.message, arguments
         )
     elif intent == "edit_product":
-        response_text, suggested_actions = await _handle_edit_product(
-            db, message.merchant_id, message.message
+        return await _handle_edit_product(
+            db, message.merchant_id, message.message, arguments
         )
     elif intent == "delete_product":
-        response_text, suggested_actions = await _handle_delete_product(
-            db, message.merchant_id, message.message
+        return await _handle_delete_product(
+            db, message.merchant_id, message.message, arguments
         )
     elif _is_list_request(message.message):
-         response_text, suggested_actions = await _handle_list_products(
+        return await _handle_list_products(
             db, message.merchant_id
         )
     elif intent == "risk_report":
-        response_text, suggested_actions = await _handle_risk_report(db, message.merchant_id)
+        return await _handle_risk_report(db, message.merchant_id)
     elif intent == "transaction_summary":
-        response_text, suggested_actions = await _handle_transaction_summary(
+        return await _handle_transaction_summary(
             db, message.merchant_id, message.message
         )
     elif intent == "query":
         # Pass conversation context to query handler
-        response_text, suggested_actions = await _handle_query(
+        return await _handle_query(
             db, message.merchant_id, message.message, conversation_context
         )
     else:
-        response_text, suggested_actions = await _handle_help(message.message)
+        return await _handle_help(message.message)
+
+
+async def _save_chat_history(db: AsyncSession, message: ChatMessage, response_text: str, intent: str):
+    """Persist a chat exchange; failures are logged and do not fail the chat"""
+    from app.models.product import ChatHistory
     
-    # Save chat history
     try:
         chat_record = ChatHistory(
             merchant_id=message.merchant_id,
@@ -112,23 +185,81 @@ async def process_chat_message(
             intent=intent
         )
         db.add(chat_record)
-        db.commit()
+        await db.commit()
     except Exception as e:
         logger.error(f"Failed to save chat history: {e}")
-        db.rollback()
-    
-    return ChatResponse(
-        response=response_text,
-        intent=intent,
-        confidence=confidence,
-        suggested_actions=suggested_actions
-    )
+        await db.rollback()
+
+
+# Typed arguments returned with the intent by classify_intent
+add_product_schema = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "price": {"type": "number"},
+        "stock": {"type": "integer"},
+        "description": {"type": ["string", "null"]},
+        "category": {"type": ["string", "null"]},
+        "ingredients": {"type": ["string", "null"]}
+    },
+    "required": ["name", "price"]
+}
+
+edit_product_schema = {
+    "type": "object",
+    "properties": {
+        "search_query": {"type": "string", "minLength": 1},
+        "updates": {"type": "object", "minProperties": 1}
+    },
+    "required": ["search_query", "updates"]
+}
+
+delete_product_schema = {
+    "type": "object",
+    "properties": {
+        "search_query": {"type": "string", "minLength": 1}
+    },
+    "required": ["search_query"]
+}
+
+intent_arguments_schemas = {
+    "add_product": add_product_schema,
+    "edit_product": edit_product_schema,
+    "delete_product": delete_product_schema,
+    "automation": automation_schema
+}
+
+chat_command_schema = {
+    "type": "object",
+    "properties": {
+        "intent": {
+            "type": "string",
+            "enum": [
+                "add_product", "edit_product", "delete_product", "automation",
+                "risk_report", "transaction_summary", "query", "help"
+            ]
+        },
+        "confidence": {"type": "number", "minimum": 0, "maximum": 1},
+        "arguments": {"type": ["object", "null"]}
+    },
+    "required": ["intent", "confidence"]
+}
 
 
 async def classify_intent(message: str, system_prompt: str = None, conversation_context: str = "") -> Dict:
-    """Classify user intent from message"""
+    """Classify user intent from message
+    
+    Returns the intent, its confidence and, for write intents classified by
+    the LLM, the typed `arguments` their handler needs, so add/edit/delete
+    and automation requests cost one LLM round-trip instead of two.
+    """
+    # Obvious messages are answered locally without an LLM round-trip
+    local_result, prediction = intent_classifier.classify(message)
+    if local_result is not None:
+        return {"intent": local_result["intent"], "confidence": local_result["confidence"]}
+    
     prompt = f"""
-Classify the following message into one of these intents:
+Classify the following message into one of these intents and extract its arguments:
 - "add_product": User wants to add/create a new product
 - "edit_product": User wants to edit/update an existing product
 - "delete_product": User wants to delete/remove a product
@@ -140,43 +271,68 @@ Classify the following message into one of these intents:
 
 {conversation_context}
 
-Return JSON with:
+Return a JSON object with:
 - intent: one of the above
 - confidence: 0.0 to 1.0
+- arguments: depends on intent, null for the others
+  - add_product: {{"name": str, "price": number, "stock": int (default 0), "description": str, "category": str, "ingredients": str}}
+  - edit_product: {{"search_query": product name to find, "updates": {{fields to update: price, stock, name, description, ...}}}}
+  - delete_product: {{"search_query": product name to find and delete}}
+  - automation: {{"action": "empty_stock" | "update_stock" | "delete", "filters": {{"search_query": str, "ingredient": str, "description": human-readable description of affected products}}, "new_stock": number (update_stock only)}}
 
 Examples:
-"Tambahkan produk Roti Tawar harga 15000" -> {{"intent": "add_product", "confidence": 0.95}}
-"Ubah harga Roti Tawar jadi 12000" -> {{"intent": "edit_product", "confidence": 0.9}}
-"Hapus produk Roti Tawar" -> {{"intent": "delete_product", "confidence": 0.95}}
-"Kosongkan semua produk yang mengandung tepung" -> {{"intent": "automation", "confidence": 0.95}}
-"Produk apa yang berisiko tinggi?" -> {{"intent": "risk_report", "confidence": 0.9}}
-"Ringkas transaksi hari ini" -> {{"intent": "transaction_summary", "confidence": 0.95}}
-"Berapa total penjualan minggu ini?" -> {{"intent": "transaction_summary", "confidence": 0.9}}
-"Berapa penjualan roti minggu ini?" -> {{"intent": "query", "confidence": 0.85}}
+"Tambahkan produk Roti Tawar harga 15000 stok 50" -> {{"intent": "add_product", "confidence": 0.95, "arguments": {{"name": "Roti Tawar", "price": 15000, "stock": 50}}}}
+"Ubah harga Roti Tawar jadi 12000" -> {{"intent": "edit_product", "confidence": 0.9, "arguments": {{"search_query": "Roti Tawar", "updates": {{"price": 12000}}}}}}
+"Hapus produk Roti Tawar" -> {{"intent": "delete_product", "confidence": 0.95, "arguments": {{"search_query": "Roti Tawar"}}}}
+"Kosongkan semua produk yang mengandung tepung" -> {{"intent": "automation", "confidence": 0.95, "arguments": {{"action": "empty_stock", "filters": {{"search_query": "tepung", "ingredient": "tepung", "description": "produk yang mengandung tepung"}}}}}}
+"Produk apa yang berisiko tinggi?" -> {{"intent": "risk_report", "confidence": 0.9, "arguments": null}}
+"Ringkas transaksi hari ini" -> {{"intent": "transaction_summary", "confidence": 0.95, "arguments": null}}
+"Berapa total penjualan minggu ini?" -> {{"intent": "transaction_summary", "confidence": 0.9, "arguments": null}}
+"Berapa penjualan roti minggu ini?" -> {{"intent": "query", "confidence": 0.85, "arguments": null}}
 
 Only return JSON, nothing else.
 """
     
     try:
-        response = await generate_text(prompt, system_prompt=system_prompt)
+        response = await generate_text(prompt, system_prompt=system_prompt, json_mode=True)
         response = response.strip()
         if response.startswith("```json"):
             response = response.replace("```json", "").replace("```", "").strip()
         
         result = json.loads(response)
-        return result
+        validate(result, chat_command_schema)
     except Exception:
         return {"intent": "query", "confidence": 0.5}
+    
+    if prediction is not None:
+        intent_classifier.record_llm_label(prediction, result["intent"])
+    
+    # Drop malformed arguments; the handler then extracts them itself
+    arguments = result.get("arguments")
+    arguments_schema = intent_arguments_schemas.get(result["intent"])
+    if arguments is not None and arguments_schema is not None:
+        try:
+            validate(arguments, arguments_schema)
+        except ValidationError as e:
+            logger.warning(f"Discarding invalid {result['intent']} arguments: {e.message}")
+            arguments = None
+    
+    return {
+        "intent": result["intent"],
+        "confidence": result["confidence"],
+        "arguments": arguments if arguments_schema is not None else None
+    }
 
 
 async def _handle_automation_request(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
-    message: str
+    message: str,
+    arguments: Optional[Dict] = None
 ) -> tuple[str, list[str]]:
     """Handle automation requests"""
-    # Get preview
-    preview = await preview_automation(db, merchant_id, message)
+    # Get preview (reusing the command parsed during classification, if any)
+    preview = await preview_automation(db, merchant_id, message, parsed=arguments)
     
     if not preview["success"]:
         return (
@@ -215,9 +371,9 @@ async def _handle_automation_request(
     return (response, suggested_actions)
 
 
-async def _handle_risk_report(db: Session, merchant_id: str) -> tuple[str, list[str]]:
+async def _handle_risk_report(db: AsyncSession, merchant_id: str) -> tuple[str, list[str]]:
     """Handle risk report requests"""
-    report = generate_risk_report(db, merchant_id)
+    report = await generate_risk_report(db, merchant_id)
     
     response = f"""
 🚨 **Laporan Risiko Produk**
@@ -247,7 +403,7 @@ async def _handle_risk_report(db: Session, merchant_id: str) -> tuple[str, list[
 
 
 async def _handle_transaction_summary(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
     message: str
 ) -> tuple[str, list[str]]:
@@ -294,46 +450,60 @@ async def _handle_transaction_summary(
         )
 
 
-async def _handle_query(
-    db: Session,
+QUERY_SUGGESTED_ACTIONS = [
+    "Analisis tren produk",
+    "Cek risiko",
+    "Lihat rekomendasi"
+]
+
+
+async def _build_query_prompt(
+    db: AsyncSession,
     merchant_id: str,
     message: str,
     conversation_context: str = ""
-) -> tuple[str, list[str]]:
-    """Handle general queries using LLM with product data from database"""
-    try:
-        # Get recent products from database
-        from app.services.product_service import get_products
-        products = get_products(db, merchant_id, limit=20)
-        
-        # Build context from database products
-        product_context = ""
-        if products:
-            product_context = "Available products:\n"
-            for p in products:
-                product_context += f"- {p.name}: Rp {p.price:,.0f}, Stock: {p.stock}"
-                if p.description:
-                    product_context += f", {p.description}"
-                product_context += "\n"
-        else:
-            product_context = "No products in database yet.\n"
-        
-        # Build full prompt with context
-        full_prompt = f"""{conversation_context}
+) -> str:
+    """Build the query prompt with product data from database"""
+    # Get recent products from database
+    from app.services.product_service import get_products
+    products = await get_products(db, merchant_id, limit=20)
+    
+    # End the read so the pooled connection is not held while the LLM answers
+    await db.commit()
+    
+    # Build context from database products
+    product_context = ""
+    if products:
+        product_context = "Available products:\n"
+        for p in products:
+            product_context += f"- {p.name}: Rp {p.price:,.0f}, Stock: {p.stock}"
+            if p.description:
+                product_context += f", {p.description}"
+            product_context += "\n"
+    else:
+        product_context = "No products in database yet.\n"
+    
+    # Build full prompt with context
+    return f"""{conversation_context}
 
 {product_context}
 
 Based on the conversation and product data above, answer this question: {message}
 
 Answer in Indonesian (Bahasa Indonesia) and be concise and helpful."""
-        
+
+
+async def _handle_query(
+    db: AsyncSession,
+    merchant_id: str,
+    message: str,
+    conversation_context: str = ""
+) -> tuple[str, list[str]]:
+    """Handle general queries using LLM with product data from database"""
+    try:
+        full_prompt = await _build_query_prompt(db, merchant_id, message, conversation_context)
         answer = await generate_text(full_prompt, system_prompt=chatbot_prompt)
-        suggested_actions = [
-            "Analisis tren produk",
-            "Cek risiko",
-            "Lihat rekomendasi"
-        ]
-        return (answer, suggested_actions)
+        return (answer, QUERY_SUGGESTED_ACTIONS)
     except Exception as e:
         logger.error(f"Query handler error: {e}")
         return (
@@ -342,6 +512,22 @@ Answer in Indonesian (Bahasa Indonesia) and be concise and helpful."""
         )
 
 
+async def _stream_query(
+    db: AsyncSession,
+    merchant_id: str,
+    message: str,
+    conversation_context: str = ""
+) -> AsyncIterator[str]:
+    """Stream the answer to a general query as the LLM produces it"""
+    try:
+        full_prompt = await _build_query_prompt(db, merchant_id, message, conversation_context)
+        async for chunk in generate_text_stream(full_prompt, system_prompt=chatbot_prompt):
+            yield chunk
+    except Exception as e:
+        logger.error(f"Query handler error: {e}")
+        yield f"Maaf, saya mengalami kesulitan menjawab pertanyaan tersebut. Error: {str(e)}"
+
+
 async def _handle_help(message: str) -> tuple[str, list[str]]:
     """Handle help requests"""
     help_text = """
@@ -380,9 +566,10 @@ Silakan tanya apa saja!
 
 
 async def _handle_add_product(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
-    message: str
+    message: str,
+    arguments: Optional[Dict] = None
 ) -> tuple[str, list[str]]:
     """Handle add product requests"""
     from app.services.product_service import create_product
@@ -407,12 +594,15 @@ Only return JSON, nothing else.
 """
     
     try:
-        response = await generate_text(prompt)
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response.replace("```json", "").replace("```", "").strip()
-        
-        product_data = json.loads(response)
+        if arguments is not None:
+            product_data = arguments
+        else:
+            response = await generate_text(prompt)
+            response = response.strip()
+            if response.startswith("```json"):
+                response = response.replace("```json", "").replace("```", "").strip()
+            
+            product_data = json.loads(response)
         
         # Validate required fields
         if not product_data.get("name") or not product_data.get("price"):
@@ -426,7 +616,7 @@ Only return JSON, nothing else.
             merchant_id=merchant_id,
             name=product_data["name"],
             price=float(product_data["price"]),
-            stock=int(product_data.get("stock", 0)),
+            stock=int(product_data.get("stock") or 0),
             description=product_data.get("description"),
             category=product_data.get("category"),
             ingredients=product_data.get("ingredients")
@@ -452,9 +642,10 @@ Only return JSON, nothing else.
 
 
 async def _handle_edit_product(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
-    message: str
+    message: str,
+    arguments: Optional[Dict] = None
 ) -> tuple[str, list[str]]:
     """Handle edit product requests"""
     from app.services.product_service import get_products, update_product
@@ -476,12 +667,15 @@ Only return JSON, nothing else.
 """
     
     try:
-        response = await generate_text(prompt)
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response.replace("```json", "").replace("```", "").strip()
-        
-        edit_data = json.loads(response)
+        if arguments is not None:
+            edit_data = arguments
+        else:
+            response = await generate_text(prompt)
+            response = response.strip()
+            if response.startswith("```json"):
+                response = response.replace("```json", "").replace("```", "").strip()
+            
+            edit_data = json.loads(response)
         search_query = edit_data.get("search_query", "")
         updates = edit_data.get("updates", {})
         
@@ -492,10 +686,11 @@ Only return JSON, nothing else.
             )
         
         # Find product
-        products = db.query(Product).filter(
+        products = (await db.scalars(select(Product).where(
             Product.merchant_id == int(merchant_id),
-            Product.name.ilike(f"%{search_query}%")
-        ).all()
+            Product.name.ilike(f"%{search_query}%"),
+            Product.deleted_at.is_(None)
+        ))).all()
         
         if not products:
             return (
@@ -532,9 +727,10 @@ Only return JSON, nothing else.
 
 
 async def _handle_delete_product(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
-    message: str
+    message: str,
+    arguments: Optional[Dict] = None
 ) -> tuple[str, list[str]]:
     """Handle delete product requests"""
     from app.services.product_service import delete_product
@@ -553,12 +749,15 @@ Only return JSON, nothing else.
 """
     
     try:
-        response = await generate_text(prompt)
-        response = response.strip()
-        if response.startswith("```json"):
-            response = response.replace("```json", "").replace("```", "").strip()
-        
-        delete_data = json.loads(response)
+        if arguments is not None:
+            delete_data = arguments
+        else:
+            response = await generate_text(prompt)
+            response = response.strip()
+            if response.startswith("```json"):
+                response = response.replace("```json", "").replace("```", "").strip()
+            
+            delete_data = json.loads(response)
         search_query = delete_data.get("search_query", "")
         
         if not search_query:
@@ -568,10 +767,11 @@ Only return JSON, nothing else.
             )
         
         # Find product
-        products = db.query(Product).filter(
+        products = (await db.scalars(select(Product).where(
             Product.merchant_id == int(merchant_id),
-            Product.name.ilike(f"%{search_query}%")
-        ).all()
+            Product.name.ilike(f"%{search_query}%"),
+            Product.deleted_at.is_(None)
+        ))).all()
         
         if not products:
             return (
@@ -589,7 +789,7 @@ Only return JSON, nothing else.
         # Delete product
         product = products[0]
         product_name = product.name
-        delete_product(db, product.id)
+        await delete_product(db, product.id)
         
         return (
             f"✅ Produk **{product_name}** berhasil dihapus!",
@@ -616,11 +816,11 @@ def _is_list_request(message: str) -> bool:
     return has_obj and has_act
 
 
-async def _handle_list_products(db: Session, merchant_id: str) -> tuple[str, list[str]]:
+async def _handle_list_products(db: AsyncSession, merchant_id: str) -> tuple[str, list[str]]:
     """Handle request to list products - QUERY DATABASE DIRECTLY"""
     from app.services.product_service import get_products
     
-    products = get_products(db, merchant_id, limit=50)
+    products = await get_products(db, merchant_id, limit=50)
     
     if not products:
         return (
@@ -0,0 +1,281 @@
+"""
+Date Windows
+Deterministic parser for the period a transaction question asks about, in
+Indonesian or English: relative days, weeks, months, quarters and years,
+named months, quarters, years, explicit dates and ranges. Every expression
+resolves to an inclusive (first_day, last_day) window without an LLM call.
+"""
+from datetime import date, timedelta
+from typing import Callable, List, Optional, Tuple
+import re
+from dateutil.relativedelta import relativedelta
+
+Window = Tuple[date, date]
+
+MONTHS = {
+    "januari": 1, "january": 1, "jan": 1,
+    "februari": 2, "pebruari": 2, "february": 2, "feb": 2,
+    "maret": 3, "march": 3, "mar": 3,
+    "april": 4, "apr": 4,
+    "mei": 5, "may": 5,
+    "juni": 6, "june": 6, "jun": 6,
+    "juli": 7, "july": 7, "jul": 7,
+    "agustus": 8, "august": 8, "agu": 8, "agt": 8, "aug": 8,
+    "september": 9, "sept": 9, "sep": 9,
+    "oktober": 10, "october": 10, "okt": 10, "oct": 10,
+    "november": 11, "nov": 11,
+    "desember": 12, "december": 12, "des": 12, "dec": 12,
+}
+
+# Abbreviations that are also everyday words ("May I...", "jan" for jangan):
+# on their own they only count after a preposition or before a year
+AMBIGUOUS_MONTHS = {"may", "mar", "jan", "jun", "des", "sep"}
+
+UNITS = {
+    "hari": "day", "day": "day", "days": "day",
+    "minggu": "week", "pekan": "week", "week": "week", "weeks": "week",
+    "bulan": "month", "month": "month", "months": "month",
+    "kuartal": "quarter", "triwulan": "quarter", "quarter": "quarter", "quarters": "quarter",
+    "tahun": "year", "year": "year", "years": "year",
+}
+
+QUARTER_WORDS = {"pertama": 1, "kedua": 2, "ketiga": 3, "keempat": 4}
+
+
+def _alternatives(words) -> str:
+    return "(?:" + "|".join(sorted(words, key=len, reverse=True)) + r")(?!\w)"
+
+
+_MONTH = _alternatives(MONTHS)
+_PLAIN_MONTH = _alternatives(set(MONTHS) - AMBIGUOUS_MONTHS)
+_UNIT = "(" + "|".join(sorted(UNITS, key=len, reverse=True)) + r")(?!\w)"
+_YEAR = r"(?:19|20)\d{2}(?!\d)"
+_DAY = r"\d{1,2}(?!\d)"
+
+# Calendar expressions, most specific first. Named groups: y(ear), m(onth
+# number), mon(th name), d(ay), q(uarter)
+POINT_FORMS = [
+    rf"(?P<y>\d{{4}})-(?P<m>\d{{1,2}})-(?P<d>{_DAY})",
+    rf"(?P<d>\d{{1,2}})/(?P<m>\d{{1,2}})/(?P<y>{_YEAR})",
+    rf"(?P<d>{_DAY})\s+(?P<mon>{_MONTH})(?:\s+(?P<y>{_YEAR}))?",
+    rf"(?P<mon>{_MONTH})\s+(?P<d>{_DAY})(?:,?\s+(?P<y>{_YEAR}))?",
+    rf"(?:kuartal|triwulan|quarter|q)\s*(?:ke-?\s*)?(?P<q>[1-4](?!\d)|pertama|kedua|ketiga|keempat)(?:\s+(?P<y>{_YEAR}))?",
+    rf"(?P<mon>{_MONTH})\s+(?P<y>{_YEAR})",
+    rf"(?:in|bulan|di|pada|during)\s+(?P<mon>{_MONTH})",
+    rf"(?P<mon>{_PLAIN_MONTH})",
+    rf"(?:tahun|year)\s+(?P<y>{_YEAR})",
+]
+POINT_PATTERNS = [re.compile(rf"\b{form}") for form in POINT_FORMS]
+
+# Any month name, once a range or "since" has made the intent clear
+MONTH_PATTERN = re.compile(rf"\b(?P<mon>{_MONTH})(?:\s+(?P<y>{_YEAR}))?")
+
+# A year on its own ("penjualan 2025"), unless it reads as an amount
+YEAR_PATTERN = re.compile(rf"\b(?P<y>{_YEAR})(?![.,]\d)")
+AMOUNT_CONTEXT = re.compile(
+    r"\b(?:atas|bawah|(?:lebih|kurang) dari|sebanyak|sejumlah|rp\.?|idr|over|under|above|below|than)\s*$"
+)
+
+# The same alternatives without group names, for embedding in ranges
+_POINT = "|".join(re.sub(r"\(\?P<\w+>", "(?:", form) for form in POINT_FORMS)
+
+RANGE_PATTERN = re.compile(
+    rf"\b(?P<left>{_POINT}|{_MONTH}|{_DAY})\s*"
+    r"(?:-|–|s/d|s\.d\.?|sampai(?:\s+dengan)?|hingga|to|until|till|through|and|dan)"
+    rf"\s*\b(?P<right>{_POINT}|{_MONTH})"
+)
+SINCE_PATTERN = re.compile(r"\b(?:sejak|since|mulai)\s+(?P<start>.+)")
+ALL_TIME_PATTERN = re.compile(
+    r"\b(semua waktu|sepanjang waktu|seluruh waktu|sejak awal|all[- ]time|from the beginning)\b"
+)
+
+
+def _period(unit: str, day: date) -> Window:
+    """The calendar day, week (Monday first), month, quarter or year containing day"""
+    if unit == "day":
+        return day, day
+    if unit == "week":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if unit == "year":
+        return date(day.year, 1, 1), date(day.year, 12, 31)
+    months = 3 if unit == "quarter" else 1
+    start = date(day.year, (day.month - 1) // months * months + 1, 1)
+    return start, start + relativedelta(months=months) - timedelta(days=1)
+
+
+def _shift(unit: str, day: date, count: int) -> date:
+    if unit == "quarter":
+        return day + relativedelta(months=3 * count)
+    return day + relativedelta(**{unit + "s": count})
+
+
+def _count(match: re.Match) -> int:
+    # "se" as in "seminggu", "sebulan"; empty as in "past week"
+    return 1 if match.group(1) in ("", "se") else int(match.group(1))
+
+
+def _trailing(match: re.Match, today: date) -> Window:
+    # "0 hari terakhir" still means today
+    count, unit = max(1, _count(match)), UNITS[match.group(2)]
+    return _shift(unit, today, -count) + timedelta(days=1), today
+
+
+def _ago(match: re.Match, today: date) -> Window:
+    count, unit = _count(match), UNITS[match.group(2)]
+    return _period(unit, _shift(unit, today, -count))
+
+
+def _current(match: re.Match, today: date) -> Window:
+    return _period(UNITS[match.group(1)], today)
+
+
+def _previous(match: re.Match, today: date) -> Window:
+    unit = UNITS[match.group(1)]
+    return _period(unit, _shift(unit, today, -1))
+
+
+def _days_back(count: int) -> Callable[[re.Match, date], Window]:
+    return lambda match, today: _period("day", today - timedelta(days=count))
+
+
+# Ordered rule table: first match wins, so counted expressions are checked
+# before the bare unit phrases they contain
+RELATIVE_RULES: List[Tuple[re.Pattern, Callable[[re.Match, date], Window]]] = [
+    (re.compile(rf"\b(\d+|se)\s*{_UNIT}\s+(?:terakhir|belakangan|ke belakang)\b"), _trailing),
+    (re.compile(rf"\b(?:last|past|previous)\s+(\d+)\s+{_UNIT}"), _trailing),
+    (re.compile(rf"\bpast\s+(){_UNIT}"), _trailing),
+    (re.compile(rf"\b(\d+|se)\s*{_UNIT}\s+(?:(?:yang\s+)?lalu|sebelumnya|ago)\b"), _ago),
+    (re.compile(r"\b(kemarin lusa|day before yesterday)\b"), _days_back(2)),
+    (re.compile(rf"\b{_UNIT}\s+ini\b"), _current),
+    (re.compile(rf"\bthis\s+{_UNIT}"), _current),
+    (re.compile(rf"\b{_UNIT}\s+(?:lalu|kemarin|sebelumnya)\b"), _previous),
+    (re.compile(rf"\b(?:last|previous)\s+{_UNIT}"), _previous),
+    (re.compile(r"\b(kemarin|yesterday)\b"), _days_back(1)),
+    (re.compile(r"\b(today|sekarang)\b"), _days_back(0)),
+]
+
+
+def _point_window(match: re.Match, today: date, year: Optional[int] = None) -> Window:
+    """Window of a POINT_PATTERNS match
+    
+    Without a year in the text the given year is used, else the most
+    recent occurrence that has started by today.
+    """
+    parts = match.groupdict()
+    if parts.get("y"):
+        year = int(parts["y"])
+    
+    def build(year: int) -> Window:
+        if parts.get("q"):
+            quarter = QUARTER_WORDS.get(parts["q"]) or int(parts["q"])
+            return _period("quarter", date(year, 3 * quarter - 2, 1))
+        month = MONTHS[parts["mon"]] if parts.get("mon") else parts.get("m")
+        if month is None:
+            return _period("year", date(year, 1, 1))
+        if parts.get("d"):
+            return _period("day", date(year, int(month), int(parts["d"])))
+        return _period("month", date(year, int(month), 1))
+    
+    if year is not None:
+        return build(year)
+    window = build(today.year)
+    return window if window[0] <= today else build(today.year - 1)
+
+
+def _parse_point(text: str, today: date, year: Optional[int] = None) -> Optional[Window]:
+    for pattern in POINT_PATTERNS + [MONTH_PATTERN]:
+        match = pattern.fullmatch(text)
+        if match:
+            return _point_window(match, today, year)
+    return None
+
+
+def _parse_since(text: str, today: date) -> Optional[Window]:
+    """From the start of the period text begins with through today
+    
+    The period is calendar ("sejak 1 mei") or relative ("since last month").
+    """
+    for pattern in POINT_PATTERNS + [MONTH_PATTERN]:
+        match = pattern.match(text)
+        if match:
+            return _point_window(match, today)[0], today
+    for pattern, resolve in RELATIVE_RULES:
+        match = pattern.match(text)
+        if match:
+            return resolve(match, today)[0], today
+    return None
+
+
+def _parse_year(text: str) -> Optional[Window]:
+    for match in YEAR_PATTERN.finditer(text):
+        if not AMOUNT_CONTEXT.search(text, 0, match.start()):
+            return _period("year", date(int(match.group("y")), 1, 1))
+    return None
+
+
+def _parse_range(match: re.Match, today: date) -> Optional[Window]:
+    right = _parse_point(match.group("right"), today)
+    left_text = match.group("left")
+    if left_text.isdigit():
+        # "1-15 januari": the day takes the right side's month and year
+        day = right[0].replace(day=int(left_text))
+        left = day, day
+    else:
+        # A left side without a year takes the right side's, or the year before
+        # when that would put it after the right side ("november - februari 2026")
+        left = _parse_point(left_text, today, right[0].year)
+        if left[0] > right[1] and not re.search(_YEAR, left_text):
+            left = _parse_point(left_text, today, right[0].year - 1)
+    
+    # Written latest first ("15-1 januari")
+    if left[0] > right[1]:
+        return right[0], left[1]
+    return left[0], right[1]
+
+
+def parse_date_window(text: str, today: date, default_days: int) -> Tuple[Optional[date], Optional[date]]:
+    """Inclusive (first_day, last_day) window asked for by text
+    
+    Windows end no later than today once they have started. Text without a
+    recognizable period gets the last default_days days; only an explicit
+    all-time request returns (None, None).
+    """
+    text = " ".join(text.lower().split())
+    if ALL_TIME_PATTERN.search(text):
+        return None, None
+    
+    window = None
+    try:
+        match = RANGE_PATTERN.search(text)
+        if match:
+            window = _parse_range(match, today)
+        if window is None:
+            match = SINCE_PATTERN.search(text)
+            if match:
+                window = _parse_since(match.group("start"), today)
+        if window is None:
+            for pattern, resolve in RELATIVE_RULES:
+                match = pattern.search(text)
+                if match:
+                    window = resolve(match, today)
+                    break
+        if window is None:
+            for pattern in POINT_PATTERNS:
+                match = pattern.search(text)
+                if match:
+                    window = _point_window(match, today)
+                    break
+        if window is None:
+            window = _parse_year(text)
+    except (ValueError, OverflowError):
+        # An impossible date such as "31 februari", or a count such as
+        # "99999999999 hari" that leaves the calendar
+        window = None
+    
+    if window is None:
+        return today - timedelta(days=default_days - 1), today
+    first_day, last_day = window
+    if first_day <= today < last_day:
+        last_day = today
+    return first_day, last_day
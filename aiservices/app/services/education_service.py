@@ -2,7 +2,8 @@
 Business Education Service
 Provides context-aware business tips and best practices
 """
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from app.models.product import Product
 from app.services.llm_client import generate_text
 from typing import List, Dict
@@ -32,10 +33,13 @@ class EducationService:
         
         return "general"
     
-    async def get_business_tips(self, db: Session, merchant_id: str) -> Dict:
+    async def get_business_tips(self, db: AsyncSession, merchant_id: str) -> Dict:
         """Get contextual business tips"""
         # Get merchant products
-        products = db.query(Product).filter(Product.merchant_id == merchant_id).all()
+        products = (await db.scalars(select(Product).where(
+            Product.merchant_id == merchant_id,
+            Product.deleted_at.is_(None)
+        ))).all()
         
         if not products:
             return {
@@ -109,9 +113,12 @@ class EducationService:
         
         return tips_db.get(business_type, tips_db["general"])
     
-    async def get_growth_strategy(self, db: Session, merchant_id: str) -> str:
+    async def get_growth_strategy(self, db: AsyncSession, merchant_id: str) -> str:
         """Get personalized growth strategy"""
-        products = db.query(Product).filter(Product.merchant_id == merchant_id).all()
+        products = (await db.scalars(select(Product).where(
+            Product.merchant_id == merchant_id,
+            Product.deleted_at.is_(None)
+        ))).all()
         business_type = self.detect_business_type(products)
         
         total_value = sum(p.stock * p.price for p in products)
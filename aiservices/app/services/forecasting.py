@@ -0,0 +1,282 @@
+"""
+Demand Forecasting
+Vectorized exponential smoothing models fitted over a whole catalog at once,
+with per-product model selection from a rolling-origin backtest
+"""
+from datetime import date
+from statistics import NormalDist
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+import numpy as np
+from app.services.trend_engine import SalesSeries
+
+# Weekly seasonality of daily sales
+SEASON = 7
+
+
+def demand_history(series_list: Sequence[SalesSeries], start: date, days: int) -> np.ndarray:
+    """Products x days history matrix from date-ordered sales series
+
+    Days without a row are zero sales; days before a product's first
+    recorded sale are NaN so they do not count as zero demand.
+    """
+    history = np.full((len(series_list), days), np.nan)
+    for row, series in enumerate(series_list):
+        if len(series):
+            first = max(int((series.dates[0] - np.datetime64(start, "D")).astype(np.int64)), 0)
+            history[row, first:] = series.dense(start, days)[first:]
+    return history
+
+
+class Forecaster:
+    """A forecasting model over a products x days history matrix
+    
+    History holds daily quantities, zero on days without sales and NaN
+    before a product's first sale. Subclasses fit every row at once.
+    """
+    
+    name = "base"
+    min_history = 1  # observed days needed before the model is trusted
+    
+    def forecast(self, history: np.ndarray, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Daily forecasts (products x horizon) and one-step residual std per product"""
+        raise NotImplementedError
+
+
+class NaiveForecaster(Forecaster):
+    """Flat forecast at the mean of the last week"""
+    
+    name = "naive"
+    min_history = 1
+    
+    def forecast(self, history: np.ndarray, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+        recent = history[:, -SEASON:]
+        observed = ~np.isnan(recent)
+        counts = observed.sum(axis=1)
+        level = np.where(counts > 0, np.nansum(recent, axis=1) / np.maximum(counts, 1), 0.0)
+    
+        # Residuals of the same rule one week back
+        errors = history[:, SEASON:] - _trailing_means(history)[:, :-1][:, SEASON - 1:]
+        return np.repeat(level[:, None], horizon, axis=1), _residual_std(errors)
+
+
+class ExponentialSmoothing(Forecaster):
+    """Additive exponential smoothing with optional damped trend and weekly season
+    
+    Smoothing parameters come from a small grid; every product picks the
+    combination with the lowest one-step in-sample error. All products and
+    grid points are updated together, one day at a time.
+    """
+    
+    def __init__(
+        self,
+        name: str,
+        alphas: Sequence[float],
+        betas: Sequence[float] = (0.0,),
+        gammas: Sequence[float] = (0.0,),
+        phi: float = 0.9,
+        min_history: int = SEASON
+    ):
+        self.name = name
+        self.min_history = min_history
+        self.phi = phi
+        self.trend = any(betas)
+        self.seasonal = any(gammas)
+        grid = np.array([(a, b, g) for a in alphas for b in betas for g in gammas], dtype=np.float64)
+        self.alpha, self.beta, self.gamma = grid.T
+    
+    def forecast(self, history: np.ndarray, horizon: int) -> Tuple[np.ndarray, np.ndarray]:
+        products, days = history.shape
+        grid = len(self.alpha)
+        phi = self.phi if self.trend else 0.0
+    
+        level, season = self._initial_states(history)
+        level = np.repeat(level[:, None], grid, axis=1)
+        trend = np.zeros((products, grid))
+        season = np.repeat(season[:, None, :], grid, axis=1)
+        sse = np.zeros((products, grid))
+        observed_days = np.zeros(products)
+    
+        for t in range(days):
+            y = history[:, t]
+            observed = ~np.isnan(y)
+            slot = t % SEASON
+            # Zero error before the first sale leaves the initial states untouched
+            error = np.where(observed, y, 0.0)[:, None] - (level + phi * trend + season[:, :, slot])
+            error[~observed] = 0.0
+    
+            level = level + phi * trend + self.alpha * error
+            trend = phi * trend + self.beta * error
+            season[:, :, slot] += self.gamma * error
+            sse += error ** 2
+            observed_days += observed
+    
+        best = np.argmin(sse, axis=1)
+        rows = np.arange(products)
+        steps = np.arange(1, horizon + 1)
+        damping = np.cumsum(phi ** steps) if phi else np.zeros(horizon)
+        slots = (days - 1 + steps) % SEASON
+    
+        forecasts = (
+            level[rows, best][:, None]
+            + trend[rows, best][:, None] * damping[None, :]
+            + season[rows, best][:, slots]
+        )
+        residual_std = np.sqrt(sse[rows, best] / np.maximum(observed_days, 1))
+        return forecasts, residual_std
+    
+    def _initial_states(self, history: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Level from each product's first observed week, season from its
+        deviations (zero without a seasonal component)"""
+        products, days = history.shape
+        first = np.argmax(~np.isnan(history), axis=1)
+        columns = first[:, None] + np.arange(SEASON)
+        first_week = np.take_along_axis(history, np.minimum(columns, days - 1), axis=1)
+        first_week[columns >= days] = np.nan
+        
+        counts = (~np.isnan(first_week)).sum(axis=1)
+        level = np.where(counts > 0, np.nansum(first_week, axis=1) / np.maximum(counts, 1), 0.0)
+    
+        season = np.zeros((products, SEASON))
+        if self.seasonal:
+            deviations = np.nan_to_num(first_week - level[:, None])
+            np.put_along_axis(season, columns % SEASON, deviations, axis=1)
+        return level, season
+
+
+def _trailing_means(history: np.ndarray) -> np.ndarray:
+    """Mean of the SEASON days ending at each column, ignoring NaN"""
+    totals = np.cumsum(np.nan_to_num(history), axis=1)
+    counts = np.cumsum(~np.isnan(history), axis=1)
+    totals[:, SEASON:] = totals[:, SEASON:] - totals[:, :-SEASON]
+    counts[:, SEASON:] = counts[:, SEASON:] - counts[:, :-SEASON]
+    return np.where(counts > 0, totals / np.maximum(counts, 1), np.nan)
+
+
+def _residual_std(errors: np.ndarray) -> np.ndarray:
+    counts = (~np.isnan(errors)).sum(axis=1)
+    return np.sqrt(np.nansum(errors ** 2, axis=1) / np.maximum(counts, 1))
+
+
+# Candidate models, simplest first (ties in the backtest go to the simpler one)
+FORECASTERS: Dict[str, Forecaster] = {}
+
+
+def register_forecaster(forecaster: Forecaster) -> Forecaster:
+    """Make a model available to select_models under its name"""
+    FORECASTERS[forecaster.name] = forecaster
+    return forecaster
+
+
+register_forecaster(NaiveForecaster())
+register_forecaster(ExponentialSmoothing("ses", alphas=(0.1, 0.3, 0.5, 0.8)))
+register_forecaster(ExponentialSmoothing(
+    "holt", alphas=(0.1, 0.3, 0.5), betas=(0.02, 0.1), min_history=2 * SEASON
+))
+register_forecaster(ExponentialSmoothing(
+    "holt_winters", alphas=(0.1, 0.3, 0.5), betas=(0.02, 0.1), gammas=(0.1, 0.3),
+    min_history=3 * SEASON
+))
+
+
+class CatalogForecast(NamedTuple):
+    """Per-product demand forecasts, row-aligned with the history matrix"""
+    model: List[str]
+    next_7_days: np.ndarray
+    next_30_days: np.ndarray
+    lower_7_days: np.ndarray
+    upper_7_days: np.ndarray
+    lower_30_days: np.ndarray
+    upper_30_days: np.ndarray
+
+
+def select_models(
+    history: np.ndarray,
+    models: Sequence[Forecaster],
+    origins: int = 3
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Rolling-origin backtest: index of the best model per product and its
+    RMSE on weekly totals (NaN when no origin could be scored)
+    
+    Each origin holds out one of the last `origins` weeks and fits every
+    model on the days before it. Models are ranked by mean absolute daily
+    error, so weekly shape counts and not only the total. Models that lack
+    the history at any scorable origin are not eligible.
+    """
+    products, days = history.shape
+    observed = np.cumsum(~np.isnan(history), axis=1)
+    daily_errors = np.full((len(models), products, origins), np.nan)
+    weekly_errors = np.full((len(models), products, origins), np.nan)
+    scorable = np.zeros((products, origins), dtype=bool)
+    
+    for k in range(origins):
+        origin = days - (k + 1) * SEASON
+        if origin < 1:
+            break
+        
+        held_out = history[:, origin:origin + SEASON]
+        seen = observed[:, origin - 1]
+        scorable[:, k] = (seen > 0) & ~np.isnan(held_out).all(axis=1)
+        
+        for m, model in enumerate(models):
+            forecasts, _ = model.forecast(history[:, :origin], SEASON)
+            forecasts = np.clip(forecasts, 0, None)
+            eligible = scorable[:, k] & (seen >= model.min_history)
+            errors = forecasts[eligible] - held_out[eligible]
+            daily_errors[m, eligible, k] = np.nanmean(np.abs(errors), axis=1)
+            weekly_errors[m, eligible, k] = np.nansum(errors, axis=1)
+    
+    # A model must be scored wherever the product itself can be
+    eligible = ~(np.isnan(daily_errors) & scorable[None, :, :]).any(axis=2) & scorable.any(axis=1)[None, :]
+    counts = np.maximum(scorable.sum(axis=1), 1)
+    scores = np.where(eligible, np.nansum(daily_errors, axis=2) / counts, np.inf)
+    
+    # argmin keeps the first (simplest) model on ties and when nothing is eligible
+    best = np.argmin(scores, axis=0)
+    rows = np.arange(products)
+    rmse = np.where(
+        eligible[best, rows],
+        np.sqrt(np.nansum(weekly_errors[best, rows] ** 2, axis=1) / counts),
+        np.nan
+    )
+    return best, rmse
+
+
+def forecast_demand(
+    history: np.ndarray,
+    model_names: Sequence[str],
+    origins: int = 3,
+    interval_level: float = 0.9
+) -> CatalogForecast:
+    """Forecast the next 7 and 30 days for every row of a history matrix
+    
+    Intervals are symmetric normal intervals on the period totals, from
+    the larger of the backtest RMSE and the accumulated one-step error.
+    """
+    models = [FORECASTERS[name] for name in model_names]
+    products = history.shape[0]
+    best, backtest_rmse = select_models(history, models, origins)
+    
+    daily = np.zeros((products, 30))
+    residual_std = np.zeros(products)
+    for m, model in enumerate(models):
+        rows = best == m
+        if rows.any():
+            forecasts, std = model.forecast(history[rows], 30)
+            daily[rows] = np.clip(forecasts, 0, None)
+            residual_std[rows] = std
+    
+    next_7_days = daily[:, :7].sum(axis=1)
+    next_30_days = daily.sum(axis=1)
+    weekly_std = np.fmax(np.nan_to_num(backtest_rmse), residual_std * np.sqrt(7))
+    monthly_std = weekly_std * np.sqrt(30 / 7)
+    z = NormalDist().inv_cdf(0.5 + interval_level / 2)
+    
+    return CatalogForecast(
+        model=[models[m].name for m in best],
+        next_7_days=next_7_days,
+        next_30_days=next_30_days,
+        lower_7_days=np.clip(next_7_days - z * weekly_std, 0, None),
+        upper_7_days=next_7_days + z * weekly_std,
+        lower_30_days=np.clip(next_30_days - z * monthly_std, 0, None),
+        upper_30_days=next_30_days + z * monthly_std
+    )
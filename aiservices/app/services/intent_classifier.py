@@ -0,0 +1,520 @@
+"""
+Intent Classifier
+Local fast path for chatbot intent classification. A keyword/regex rule
+table and a small TF-IDF + logistic regression model answer obvious
+messages without an LLM round-trip; classify_intent falls back to the
+LLM when neither is confident enough.
+
+Retrain the shipped model after editing SEED_EXAMPLES (from aiservices/):
+    python -m benchmarks.intent_fastpath --save
+"""
+from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from app.config import settings
+import json
+import logging
+import math
+import random
+import re
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = Path(__file__).with_name("intent_model.json")
+
+INTENTS = [
+    "add_product", "edit_product", "delete_product", "automation",
+    "risk_report", "transaction_summary", "query", "help"
+]
+
+# Ordered rule table: first match wins, so bulk operations are checked
+# before the single-product verbs they share
+INTENT_RULES = [
+    ("automation", re.compile(r"^(kosongkan|kosongin|habiskan)\b"), 0.95),
+    ("automation", re.compile(
+        r"^(hapus|delete|buang|ubah|ganti|update|set|naikkan|turunkan)\b.*\bsemua\b"), 0.93),
+    ("automation", re.compile(
+        r"^(hapus|delete|buang|ubah|update|set)\b.*\byang (mengandung|berisi|expired|kadaluarsa)\b"), 0.9),
+    ("delete_product", re.compile(r"^(hapus|delete|remove|buang)\s+(produk|barang|item)\s+\S+"), 0.93),
+    ("add_product", re.compile(r"^(tambah(kan)?|buat(kan)?|add|create|input)\s+(produk|barang|item)\b"), 0.93),
+    ("edit_product", re.compile(
+        r"^(ubah|ganti|update|edit|perbarui)\s+(harga|stok|nama|deskripsi|kategori|produk)\s+\S+"), 0.9),
+    ("query", re.compile(r"^(tampilkan|lihat|list|show|daftar)\s+(semua\s+)?(produk|barang|item)"), 0.95),
+    ("risk_report", re.compile(r"\b(berisiko|risiko|risk|hampir (habis|expired|kadaluarsa))\b"), 0.9),
+    ("transaction_summary", re.compile(r"\b(ringkas|ringkasan|rangkum|rekap)\b.*\b(transaksi|penjualan)\b"), 0.93),
+    # Store-wide totals only: "total penjualan roti" asks about a product
+    ("transaction_summary", re.compile(
+        r"\btotal (penjualan|pendapatan|omzet|transaksi)(\s+(toko|saya|semua))*"
+        r"\s*(hari|minggu|pekan|bulan|tahun|kuartal|kemarin|sejak|dari|\d|[?!.]|$)"), 0.9),
+    ("help", re.compile(
+        r"^(halo|hai|hi|hello|help|bantuan|tolong bantu|apa yang bisa kamu( lakukan| bantu)?"
+        r"|terima kasih|selamat (pagi|siang|sore|malam))[\s!?.,]*$"), 0.9),
+]
+
+# Greetings and politeness stripped before the rule table, so
+# "Halo, tambahkan produk ..." is matched as the command it carries
+GREETING_PREFIX = re.compile(
+    r"^((halo|hai|hi|hello|selamat (pagi|siang|sore|malam)|tolong( bantu)?|mohon|please)[\s,!.]+)+"
+)
+
+# Labelled examples used to train the shipped model
+SEED_EXAMPLES = [
+    ("Tambahkan produk Roti Tawar harga 15000", "add_product"),
+    ("Tambahkan produk Roti Tawar harga 15000 stok 50", "add_product"),
+    ("tambah produk kopi susu harga 18000", "add_product"),
+    ("buat produk baru nasi goreng 20000", "add_product"),
+    ("saya mau jual es teh manis harga 5000", "add_product"),
+    ("masukkan barang baru gula pasir 1kg harga 16000", "add_product"),
+    ("tolong tambahin donat coklat harga 7000 stok 30", "add_product"),
+    ("add product croissant price 25000", "add_product"),
+    ("input barang sabun cuci 12000", "add_product"),
+    ("daftarkan produk baru kue lapis harga 3000", "add_product"),
+    ("Ubah harga Roti Tawar jadi 12000", "edit_product"),
+    ("Update stok kopi menjadi 100", "edit_product"),
+    ("ganti nama produk roti coklat jadi roti cokelat", "edit_product"),
+    ("edit deskripsi donat jadi donat lembut isi coklat", "edit_product"),
+    ("harga kopi susu sekarang 20000 ya", "edit_product"),
+    ("stok teh botol tambah jadi 40", "edit_product"),
+    ("perbarui harga nasi goreng menjadi 22000", "edit_product"),
+    ("change price of croissant to 27000", "edit_product"),
+    ("ubah kategori gula pasir ke sembako", "edit_product"),
+    ("koreksi stok susu uht jadi 12", "edit_product"),
+    ("Hapus produk Roti Tawar", "delete_product"),
+    ("hapus kopi susu dari daftar", "delete_product"),
+    ("delete produk donat coklat", "delete_product"),
+    ("buang produk es teh manis", "delete_product"),
+    ("tolong hapus barang sabun cuci", "delete_product"),
+    ("remove product croissant", "delete_product"),
+    ("produk nasi goreng dihapus saja", "delete_product"),
+    ("hilangkan item kue lapis dari toko", "delete_product"),
+    ("Kosongkan semua produk yang mengandung tepung", "automation"),
+    ("Hapus semua roti yang expired", "automation"),
+    ("kosongkan stok semua minuman", "automation"),
+    ("set stok semua produk kopi jadi 50", "automation"),
+    ("update stok semua roti menjadi 0", "automation"),
+    ("hapus semua produk kategori snack", "automation"),
+    ("habiskan stok produk yang berisi gula", "automation"),
+    ("semua produk susu stoknya jadi 10", "automation"),
+    ("hapus semua barang yang sudah kadaluarsa", "automation"),
+    ("empty stock for all bread products", "automation"),
+    ("Produk apa yang berisiko tinggi?", "risk_report"),
+    ("Mana yang hampir expired?", "risk_report"),
+    ("cek risiko produk saya", "risk_report"),
+    ("ada produk yang bermasalah?", "risk_report"),
+    ("produk mana yang stoknya hampir habis", "risk_report"),
+    ("barang apa saja yang mau kadaluarsa", "risk_report"),
+    ("tampilkan laporan risiko", "risk_report"),
+    ("which products are at risk", "risk_report"),
+    ("produk mana yang sudah lewat tanggal kedaluwarsa", "risk_report"),
+    ("Ringkas transaksi hari ini", "transaction_summary"),
+    ("Berapa total penjualan minggu ini?", "transaction_summary"),
+    ("ringkasan transaksi bulan ini", "transaction_summary"),
+    ("berapa pendapatan hari ini", "transaction_summary"),
+    ("rekap penjualan kemarin", "transaction_summary"),
+    ("berapa omzet toko bulan ini", "transaction_summary"),
+    ("analisis transaksi minggu lalu", "transaction_summary"),
+    ("summarize today's transactions", "transaction_summary"),
+    ("metode pembayaran apa yang paling sering dipakai", "transaction_summary"),
+    ("jam berapa transaksi paling ramai", "transaction_summary"),
+    ("Berapa penjualan roti minggu ini?", "query"),
+    ("Produk apa yang paling laris?", "query"),
+    ("Tampilkan semua produk", "query"),
+    ("tampilkan semua produk saya", "query"),
+    ("lihat daftar barang", "query"),
+    ("berapa harga kopi susu", "query"),
+    ("stok donat coklat tinggal berapa", "query"),
+    ("produk apa saja yang saya punya", "query"),
+    ("bagaimana tren penjualan teh botol", "query"),
+    ("apa rekomendasi stok untuk minggu depan", "query"),
+    ("show my products", "query"),
+    ("halo", "help"),
+    ("hai, kamu bisa apa saja?", "help"),
+    ("bantuan", "help"),
+    ("help", "help"),
+    ("apa yang bisa kamu lakukan", "help"),
+    ("cara pakai chatbot ini gimana", "help"),
+    ("terima kasih", "help"),
+    ("selamat pagi", "help"),
+    ("tolong tambahkan barang kerupuk udang harga 8000", "add_product"),
+    ("aku mau nambah produk teh tarik 9000", "add_product"),
+    ("buatkan item baru martabak manis harga 30000 stok 10", "add_product"),
+    ("produk baru: pisang goreng 2000", "add_product"),
+    ("tambahin menu kopi gula aren harga 22000", "add_product"),
+    ("masukin produk air mineral 600ml harga 4000 stok 100", "add_product"),
+    ("saya punya barang baru, keripik singkong 10000", "add_product"),
+    ("register a new product called iced latte for 28000", "add_product"),
+    ("new item: chocolate muffin 15000", "add_product"),
+    ("tambah barang baru minyak goreng 2 liter 35000", "add_product"),
+    ("naikkan harga kopi susu jadi 21000", "edit_product"),
+    ("turunkan harga donat jadi 6000", "edit_product"),
+    ("stok roti tawar sekarang 25", "edit_product"),
+    ("tolong ganti harga teh manis ke 6000", "edit_product"),
+    ("ubah stok air mineral jadi 80", "edit_product"),
+    ("harga martabak manis diganti 32000", "edit_product"),
+    ("update harga croissant menjadi 26000", "edit_product"),
+    ("set stock of iced latte to 40", "edit_product"),
+    ("rename produk kopi hitam jadi kopi tubruk", "edit_product"),
+    ("betulkan harga keripik singkong jadi 11000", "edit_product"),
+    ("hapus martabak manis", "delete_product"),
+    ("tolong buang item pisang goreng", "delete_product"),
+    ("hapuskan produk air mineral 600ml", "delete_product"),
+    ("delete item chocolate muffin", "delete_product"),
+    ("produk teh tarik tidak dijual lagi, hapus ya", "delete_product"),
+    ("keluarkan kopi gula aren dari menu", "delete_product"),
+    ("hapus barang keripik singkong", "delete_product"),
+    ("saya mau menghapus produk croissant", "delete_product"),
+    ("remove the iced latte product", "delete_product"),
+    ("buang barang minyak goreng dari daftar", "delete_product"),
+    ("kosongkan stok semua produk roti", "automation"),
+    ("naikkan harga semua minuman 10 persen", "automation"),
+    ("set stok semua snack jadi 20", "automation"),
+    ("hapus semua produk yang mengandung kacang", "automation"),
+    ("stok semua barang kategori minuman jadi 0", "automation"),
+    ("kosongin semua produk yang berisi susu", "automation"),
+    ("turunkan harga semua roti 2000", "automation"),
+    ("hapus semua item yang sudah expired", "automation"),
+    ("update all drinks stock to 30", "automation"),
+    ("delete all expired products", "automation"),
+    ("produk apa yang stoknya mau habis", "risk_report"),
+    ("ada barang yang sebentar lagi kadaluarsa?", "risk_report"),
+    ("laporan produk berisiko dong", "risk_report"),
+    ("barang mana yang tidak laku dan menumpuk", "risk_report"),
+    ("cek produk yang hampir expired", "risk_report"),
+    ("apa saja risiko stok toko saya", "risk_report"),
+    ("show me risky products", "risk_report"),
+    ("products expiring soon", "risk_report"),
+    ("produk mana yang perlu diwaspadai", "risk_report"),
+    ("tampilkan produk dengan risiko tinggi", "risk_report"),
+    ("rekap transaksi minggu ini", "transaction_summary"),
+    ("berapa total pendapatan bulan lalu", "transaction_summary"),
+    ("ringkasan penjualan 7 hari terakhir", "transaction_summary"),
+    ("omzet toko hari ini berapa", "transaction_summary"),
+    ("berapa jumlah transaksi kemarin", "transaction_summary"),
+    ("laporan penjualan bulan ini dong", "transaction_summary"),
+    ("rata-rata nilai transaksi minggu ini berapa", "transaction_summary"),
+    ("how much revenue did i make this month", "transaction_summary"),
+    ("sales summary for last week", "transaction_summary"),
+    ("analisa pendapatan toko bulan lalu", "transaction_summary"),
+    ("berapa stok kopi hitam", "query"),
+    ("harga donat coklat berapa", "query"),
+    ("roti apa saja yang ada", "query"),
+    ("berapa penjualan kopi susu bulan ini", "query"),
+    ("produk mana yang paling banyak terjual", "query"),
+    ("bagaimana tren penjualan roti tawar", "query"),
+    ("list semua minuman", "query"),
+    ("ada berapa produk di toko saya", "query"),
+    ("what is the price of iced latte", "query"),
+    ("prediksi penjualan martabak minggu depan", "query"),
+    ("hai", "help"),
+    ("hello", "help"),
+    ("makasih ya", "help"),
+    ("kamu bisa bantu apa", "help"),
+    ("bagaimana cara menambah produk", "help"),
+    ("fitur apa saja yang ada", "help"),
+    ("selamat malam", "help"),
+    ("ok terima kasih banyak", "help"),
+    ("what can you do", "help"),
+    ("saya bingung cara pakainya", "help"),
+]
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercased word unigrams and bigrams plus character trigrams, which
+    share features between affixed forms (hapus/hapuskan, stok/stoknya)"""
+    words = _TOKEN_RE.findall(text.lower())
+    trigrams = [
+        padded[i:i + 3]
+        for padded in (f"<{word}>" for word in words if len(word) > 2)
+        for i in range(len(padded) - 2)
+    ]
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])] + trigrams
+
+
+class IntentModel:
+    """Multinomial logistic regression over L2-normalized TF-IDF features
+
+    Logits are divided by a temperature fitted on held-out predictions, so
+    confidences can be compared against the fast-path threshold.
+    """
+
+    def __init__(self, classes: List[str], vocabulary: Dict[str, int], idf, weights, bias, temperature: float = 1.0):
+        self.classes = classes
+        self.vocabulary = vocabulary
+        self.idf = np.asarray(idf, dtype=float)
+        self.weights = np.asarray(weights, dtype=float)
+        self.bias = np.asarray(bias, dtype=float)
+        self.temperature = temperature
+
+    def _features(self, texts: List[str]) -> np.ndarray:
+        X = np.zeros((len(texts), len(self.vocabulary)))
+        for row, text in enumerate(texts):
+            for token in _tokenize(text):
+                col = self.vocabulary.get(token)
+                if col is not None:
+                    X[row, col] += 1.0
+        X *= self.idf
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        return X / np.where(norms == 0, 1.0, norms)
+
+    def logits(self, texts: List[str]) -> np.ndarray:
+        return self._features(texts) @ self.weights.T + self.bias
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        return _softmax(self.logits(texts) / self.temperature)
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        proba = self.predict_proba([text])[0]
+        best = int(proba.argmax())
+        return self.classes[best], float(proba[best])
+
+    @classmethod
+    def train(
+        cls,
+        examples: List[Tuple[str, str]],
+        epochs: int = 400,
+        learning_rate: float = 2.0,
+        l2: float = 1e-3
+    ) -> "IntentModel":
+        texts = [text for text, _ in examples]
+        classes = sorted({label for _, label in examples})
+
+        vocabulary: Dict[str, int] = {}
+        document_frequency: Dict[str, int] = {}
+        for text in texts:
+            for token in set(_tokenize(text)):
+                document_frequency[token] = document_frequency.get(token, 0) + 1
+        for token in sorted(document_frequency):
+            vocabulary[token] = len(vocabulary)
+
+        n_docs = len(texts)
+        idf = np.array([
+            math.log((1 + n_docs) / (1 + document_frequency[token])) + 1
+            for token in sorted(document_frequency)
+        ])
+
+        model = cls(classes, vocabulary, idf, np.zeros((len(classes), len(vocabulary))), np.zeros(len(classes)))
+        X = model._features(texts)
+        Y = np.zeros((n_docs, len(classes)))
+        Y[np.arange(n_docs), [classes.index(label) for _, label in examples]] = 1.0
+
+        # Full-batch gradient descent; the corpus is tiny
+        for _ in range(epochs):
+            error = _softmax(model.logits(texts)) - Y
+            model.weights -= learning_rate * (error.T @ X / n_docs + l2 * model.weights)
+            model.bias -= learning_rate * error.mean(axis=0)
+
+        return model
+
+    @classmethod
+    def train_calibrated(cls, examples: List[Tuple[str, str]], folds: int = 4) -> "IntentModel":
+        """Train on every example with a temperature fitted on held-out scores
+
+        Each of `folds` stratified holdout splits trains a model that scores
+        examples it never saw; the final model keeps the temperature that
+        minimizes their log loss.
+        """
+        held_out_logits, held_out_labels = [], []
+        for fold in range(folds):
+            train, holdout = holdout_split(examples, ratio=1 / folds, seed=fold)
+            model = cls.train(train)
+            held_out_logits.append(model.logits([text for text, _ in holdout]))
+            held_out_labels.extend(model.classes.index(label) for _, label in holdout)
+        logits = np.vstack(held_out_logits)
+        labels = np.array(held_out_labels)
+
+        def log_loss(temperature: float) -> float:
+            proba = _softmax(logits / temperature)
+            return float(-np.log(proba[np.arange(len(labels)), labels] + 1e-12).mean())
+
+        model = cls.train(examples)
+        model.temperature = float(min(np.geomspace(0.05, 2.0, 80), key=log_loss))
+        return model
+
+    def to_dict(self) -> Dict:
+        return {
+            "version": 2,
+            "classes": self.classes,
+            "vocabulary": self.vocabulary,
+            "idf": np.round(self.idf, 6).tolist(),
+            "weights": np.round(self.weights, 6).tolist(),
+            "bias": np.round(self.bias, 6).tolist(),
+            "temperature": round(self.temperature, 6)
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "IntentModel":
+        return cls(
+            data["classes"], data["vocabulary"], data["idf"], data["weights"], data["bias"],
+            data.get("temperature", 1.0)
+        )
+
+
+def _softmax(logits: np.ndarray) -> np.ndarray:
+    logits = logits - logits.max(axis=1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=1, keepdims=True)
+
+
+def load_model(path: Path = MODEL_PATH) -> IntentModel:
+    """Load the shipped model, training from the seed corpus if it is missing"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return IntentModel.from_dict(json.load(f))
+    except FileNotFoundError:
+        logger.warning(f"Intent model not found at {path}; training from seed examples")
+        return IntentModel.train_calibrated(SEED_EXAMPLES)
+
+
+def match_rules(message: str) -> Optional[Tuple[str, float]]:
+    """Return (intent, confidence) for the first matching rule"""
+    text = message.strip().lower()
+    # The command after a greeting first, then the message as a whole
+    for candidate in dict.fromkeys((GREETING_PREFIX.sub("", text), text)):
+        for intent, pattern, confidence in INTENT_RULES:
+            if candidate and pattern.search(candidate):
+                return intent, confidence
+    return None
+
+
+class IntentClassifier:
+    """Rule table + local model in front of the LLM classifier"""
+
+    # Confidence buckets for tracking model agreement with the LLM
+    BUCKETS = [0.0, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
+
+    def __init__(self, threshold: float = 0.85, enabled: bool = True, audit_rate: float = 0.0):
+        self.threshold = threshold
+        self.enabled = enabled
+        self.audit_rate = audit_rate
+        self._model: Optional[IntentModel] = None
+        self._random = random.Random()
+        self.total = 0
+        self.rule_hits = 0
+        self.model_hits = 0
+        self.llm_fallbacks = 0
+        self.audits = 0
+        self._agreement = {b: [0, 0] for b in self.BUCKETS[:-1]}
+
+    @property
+    def model(self) -> IntentModel:
+        if self._model is None:
+            self._model = load_model()
+        return self._model
+
+    def predict(self, message: str) -> Dict:
+        """Best local guess regardless of threshold"""
+        rule = match_rules(message)
+        if rule:
+            return {"intent": rule[0], "confidence": rule[1], "source": "rule"}
+        intent, confidence = self.model.predict(message)
+        return {"intent": intent, "confidence": confidence, "source": "model"}
+
+    def classify(self, message: str) -> Tuple[Optional[Dict], Optional[Dict]]:
+        """Return (local classification, or None when the LLM should decide;
+        the local prediction to pass to record_llm_label, None when disabled)
+
+        A confident prediction is sent to the LLM anyway with probability
+        audit_rate, so agreement above the threshold is measured too.
+        """
+        self.total += 1
+        if not self.enabled:
+            self.llm_fallbacks += 1
+            return None, None
+
+        prediction = self.predict(message)
+        if prediction["confidence"] >= self.threshold:
+            if self.audit_rate and self._random.random() < self.audit_rate:
+                self.audits += 1
+                return None, prediction
+            if prediction["source"] == "rule":
+                self.rule_hits += 1
+            else:
+                self.model_hits += 1
+            return prediction, prediction
+
+        self.llm_fallbacks += 1
+        return None, prediction
+
+    def record_llm_label(self, prediction: Dict, llm_intent: str):
+        """Compare a local prediction from classify against the LLM's answer
+        for accuracy tracking"""
+        for low, high in zip(self.BUCKETS, self.BUCKETS[1:]):
+            if low <= prediction["confidence"] < high or (high == 1.0 and prediction["confidence"] == 1.0):
+                self._agreement[low][0] += 1
+                self._agreement[low][1] += int(prediction["intent"] == llm_intent)
+                break
+
+    def stats(self) -> Dict:
+        """Fast path counters and agreement with the LLM per confidence bucket
+
+        Only messages the LLM classified are compared: every fallback below
+        the threshold, and above it only the audit_rate sample of confident
+        hits. With audit_rate 0 the buckets above the threshold stay empty,
+        and the below-threshold buckets say nothing about answered messages.
+        """
+        bypassed = self.rule_hits + self.model_hits
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "total": self.total,
+            "rule_hits": self.rule_hits,
+            "model_hits": self.model_hits,
+            "llm_fallbacks": self.llm_fallbacks,
+            "audits": self.audits,
+            "audit_rate": self.audit_rate,
+            "bypass_rate": bypassed / self.total if self.total else 0.0,
+            "llm_agreement_by_confidence": {
+                f"{low:.1f}-{high:.1f}": {
+                    "samples": seen,
+                    "accuracy": agreed / seen if seen else None
+                }
+                for (low, (seen, agreed)), high in zip(self._agreement.items(), self.BUCKETS[1:])
+            }
+        }
+
+
+def evaluate(
+    examples: List[Tuple[str, str]],
+    model: IntentModel,
+    thresholds: List[float]
+) -> List[Dict]:
+    """Accuracy and LLM bypass rate of the fast path at each threshold"""
+    results = []
+    for threshold in thresholds:
+        classifier = IntentClassifier(threshold=threshold)
+        classifier._model = model
+        answered = correct = 0
+        for text, label in examples:
+            prediction, _ = classifier.classify(text)
+            if prediction is not None:
+                answered += 1
+                correct += int(prediction["intent"] == label)
+        results.append({
+            "threshold": threshold,
+            "bypass_rate": answered / len(examples) if examples else 0.0,
+            "accuracy": correct / answered if answered else None
+        })
+    return results
+
+
+def holdout_split(examples: List[Tuple[str, str]], ratio: float = 0.25, seed: int = 7):
+    """Stratified train/holdout split of the seed corpus"""
+    rng = random.Random(seed)
+    train, holdout = [], []
+    for intent in INTENTS:
+        group = [e for e in examples if e[1] == intent]
+        rng.shuffle(group)
+        cut = max(1, int(len(group) * ratio))
+        holdout.extend(group[:cut])
+        train.extend(group[cut:])
+    return train, holdout
+
+
+intent_classifier = IntentClassifier(
+    threshold=settings.intent_fastpath_threshold,
+    enabled=settings.intent_fastpath_enabled,
+    audit_rate=settings.intent_fastpath_audit_rate
+)
+
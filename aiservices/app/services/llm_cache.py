@@ -0,0 +1,223 @@
+"""
+LLM Response Cache
+Content-addressed completion cache with an in-process LRU/TTL layer
+and an optional shared backend (SQLite or Redis)
+"""
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from app.config import settings
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """In-process LRU cache whose entries also expire after a TTL"""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple[float, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: Optional[float] = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def delete(self, key: str):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+class SQLiteCacheBackend:
+    """Shared cache backend stored in a local SQLite file"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            return row[0]
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, time.time() + ttl_seconds)
+            )
+            self._conn.commit()
+
+
+class RedisCacheBackend:
+    """Shared cache backend on any Redis-compatible server"""
+
+    name = "redis"
+
+    def __init__(self, url: str):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("llm_cache_backend=redis requires the 'redis' package") from e
+
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[str]:
+        value = self._client.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set(self, key: str, value: str, ttl_seconds: float):
+        self._client.set(key, value, ex=max(1, int(ttl_seconds)))
+
+
+def _create_backend(name: str):
+    """Build the configured shared backend, or None for in-process only"""
+    if name == "sqlite":
+        return SQLiteCacheBackend(settings.llm_cache_sqlite_path)
+    if name == "redis":
+        return RedisCacheBackend(settings.llm_cache_redis_url)
+    return None
+
+
+class LLMResponseCache:
+    """Two-level cache for LLM completions keyed on the full request content"""
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl_seconds: float = 3600,
+        backend=None,
+        enabled: bool = True
+    ):
+        self.enabled = enabled
+        self.local = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.backend = backend
+        self.backend_hits = 0
+        self.backend_errors = 0
+
+    @staticmethod
+    def make_key(**parts) -> str:
+        """Hash the request parts into a stable content address"""
+        payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+        return "llm:" + hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+
+        value = self.local.get(key)
+        if value is not None or self.backend is None:
+            return value
+
+        try:
+            value = await asyncio.to_thread(self.backend.get, key)
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"LLM cache backend read failed: {e}")
+            return None
+
+        if value is not None:
+            self.backend_hits += 1
+            self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: str):
+        if not self.enabled or value is None:
+            return
+
+        self.local.set(key, value)
+        if self.backend is None:
+            return
+
+        try:
+            await asyncio.to_thread(self.backend.set, key, value, self.local.ttl_seconds)
+        except Exception as e:
+            self.backend_errors += 1
+            logger.warning(f"LLM cache backend write failed: {e}")
+
+    def clear(self):
+        self.local.clear()
+
+    def stats(self) -> Dict:
+        stats = self.local.stats()
+        stats.update({
+            "enabled": self.enabled,
+            "backend": self.backend.name if self.backend else "none",
+            "backend_hits": self.backend_hits,
+            "backend_errors": self.backend_errors
+        })
+        return stats
+
+
+llm_cache = LLMResponseCache(
+    max_entries=settings.llm_cache_max_entries,
+    ttl_seconds=settings.llm_cache_ttl_seconds,
+    backend=_create_backend(settings.llm_cache_backend) if settings.llm_cache_enabled else None,
+    enabled=settings.llm_cache_enabled
+)
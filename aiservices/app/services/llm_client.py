@@ -1,22 +1,99 @@
 from openai import AsyncOpenAI
 from app.config import settings
-from typing import Optional, List, Dict
+from app.services.llm_cache import llm_cache
+from typing import Optional, List, Dict, Awaitable, Callable, AsyncIterator
+import asyncio
 
 client = AsyncOpenAI(api_key=settings.openai_api_key)
 
+
+class SingleFlight:
+    """Coalesce concurrent identical calls into one in-flight request"""
+    
+    def __init__(self):
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self.calls = 0
+        self.shared = 0
+    
+    async def do(self, key: str, fn: Callable[[], Awaitable]):
+        """Run fn once per key; concurrent callers await the same result"""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            # Run as its own task so one caller disconnecting does not
+            # cancel the request the other callers are waiting on
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+    
+    def stats(self) -> Dict:
+        return {
+            "in_flight": len(self._inflight),
+            "calls": self.calls,
+            "shared": self.shared
+        }
+
+
+inflight_requests = SingleFlight()
+
+
 async def get_embedding(text: str):
     """Generate embedding for text"""
-    res = await client.embeddings.create(
-        model=settings.embedding_model,
-        input=text
-    )
-    return res.data[0].embedding
+    async def _create():
+        res = await client.embeddings.create(
+            model=settings.embedding_model,
+            input=text
+        )
+        return res.data[0].embedding
+    
+    key = llm_cache.make_key(kind="embedding", model=settings.embedding_model, input=text)
+    return await inflight_requests.do(key, _create)
+
+
+def _build_request(
+    prompt: str,
+    max_tokens: Optional[int],
+    system_prompt: Optional[str],
+    conversation_history: Optional[List[Dict]],
+    temperature: Optional[float],
+    json_mode: bool = False
+) -> tuple[Dict, str]:
+    """Assemble chat completion arguments and their cache key"""
+    messages = []
+    
+    # Add system prompt if provided
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    
+    # Add conversation history if provided
+    if conversation_history:
+        messages.extend(conversation_history)
+    
+    # Add current user message
+    messages.append({"role": "user", "content": prompt})
+    
+    request = {
+        "model": settings.llm_model,
+        "messages": messages,
+        "max_tokens": max_tokens or settings.max_tokens,
+        "temperature": settings.temperature if temperature is None else temperature
+    }
+    if json_mode:
+        request["response_format"] = {"type": "json_object"}
+    return request, llm_cache.make_key(**request)
+
 
 async def generate_text(
     prompt: str,
     max_tokens: int = None,
     system_prompt: Optional[str] = None,
-    conversation_history: Optional[List[Dict]] = None
+    conversation_history: Optional[List[Dict]] = None,
+    temperature: Optional[float] = None,
+    use_cache: bool = True,
+    json_mode: bool = False
 ):
     """
     Generate text from prompt using LLM
@@ -26,25 +103,64 @@ async def generate_text(
         max_tokens: Maximum tokens to generate
         system_prompt: Optional system message for context
         conversation_history: Optional list of previous messages
+        temperature: Sampling temperature (defaults to settings.temperature)
+        use_cache: Serve repeated requests from the response cache
+        json_mode: Constrain the completion to a single JSON object
     """
-    messages = []
+    request, cache_key = _build_request(
+        prompt, max_tokens, system_prompt, conversation_history, temperature, json_mode
+    )
     
-    # Add system prompt if provided
-    if system_prompt:
-        messages.append({"role": "system", "content": system_prompt})
+    # Identical requests are answered from the cache without a network call
+    if use_cache:
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            return cached
     
-    # Add conversation history if provided
-    if conversation_history:
-        messages.extend(conversation_history)
+    async def _complete():
+        res = await client.chat.completions.create(**request)
+        content = res.choices[0].message.content
+        if use_cache:
+            await llm_cache.set(cache_key, content)
+        return content
     
-    # Add current user message
-    messages.append({"role": "user", "content": prompt})
+    # Concurrent identical requests share a single completion call
+    return await inflight_requests.do(cache_key, _complete)
+
+
+async def generate_text_stream(
+    prompt: str,
+    max_tokens: int = None,
+    system_prompt: Optional[str] = None,
+    conversation_history: Optional[List[Dict]] = None,
+    temperature: Optional[float] = None,
+    use_cache: bool = True
+) -> AsyncIterator[str]:
+    """
+    Stream generated text from the LLM as chunks arrive
     
-    res = await client.chat.completions.create(
-        model=settings.llm_model,
-        messages=messages,
-        max_tokens=max_tokens or settings.max_tokens,
-        temperature=settings.temperature
+    Takes the same arguments as generate_text. A cached completion is
+    yielded as a single chunk; a fresh one is cached once fully received.
+    """
+    request, cache_key = _build_request(
+        prompt, max_tokens, system_prompt, conversation_history, temperature
     )
-    return res.choices[0].message.content
-
+    
+    if use_cache:
+        cached = await llm_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+    
+    parts = []
+    stream = await client.chat.completions.create(**request, stream=True)
+    async for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+    
+    if use_cache:
+        await llm_cache.set(cache_key, "".join(parts))
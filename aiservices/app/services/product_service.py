@@ -1,10 +1,18 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import Table, MetaData, delete, exists, inspect, select, update
 from typing import List, Optional
-from datetime import datetime
-from app.models.product import Product
+from datetime import datetime, timedelta
+from app.models.product import Product, ProductTrend, ProductTrendWeekly, ProductTrendMonthly, ProductRisk, ProductRiskSnapshot
 from app.schemas.product import ProductCreate, ProductUpdate
+from app.config import settings
+from app.database import SessionLocal
+from app.services.risk_refresh import enqueue_risk_refresh
+import asyncio
+import logging
 
-async def create_product(db: Session, product: ProductCreate) -> Product:
+logger = logging.getLogger(__name__)
+
+async def create_product(db: AsyncSession, product: ProductCreate) -> Product:
     """Create a new product"""
     db_product = Product(
         merchant_id=int(product.merchant_id),
@@ -17,51 +25,60 @@ async def create_product(db: Session, product: ProductCreate) -> Product:
         category=product.category
     )
     db.add(db_product)
-    db.commit()
-    db.refresh(db_product)
+    await db.flush()
+    await enqueue_risk_refresh(db, [db_product.id])
+    await db.commit()
+    await db.refresh(db_product)
     return db_product
 
 
-def get_product(db: Session, product_id: int) -> Optional[Product]:
+async def get_product(db: AsyncSession, product_id: int) -> Optional[Product]:
     """Get a single product by ID"""
-    return db.query(Product).filter(Product.id == product_id).first()
+    return await db.scalar(select(Product).where(
+        Product.id == product_id,
+        Product.deleted_at.is_(None)
+    ))
 
 
-def get_products(
-    db: Session, 
+async def get_products(
+    db: AsyncSession, 
     merchant_id: str, 
     skip: int = 0, 
     limit: int = 100,
     category: Optional[str] = None
 ) -> List[Product]:
     """Get all products for a merchant"""
-    query = db.query(Product).filter(Product.merchant_id == int(merchant_id))
+    query = select(Product).where(
+        Product.merchant_id == int(merchant_id),
+        Product.deleted_at.is_(None)
+    )
     
     if category:
-        query = query.filter(Product.category == category)
+        query = query.where(Product.category == category)
     
-    return query.offset(skip).limit(limit).all()
+    return (await db.scalars(query.offset(skip).limit(limit))).all()
 
 
-def get_product_by_id(
-    db: Session,
+async def get_product_by_id(
+    db: AsyncSession,
     product_id: int,
     merchant_id: int
 ) -> Optional[Product]:
     """Get a single product by ID for a specific merchant (ensures isolation)"""
-    return db.query(Product).filter(
+    return await db.scalar(select(Product).where(
         Product.id == product_id,
-        Product.merchant_id == merchant_id
-    ).first()
+        Product.merchant_id == merchant_id,
+        Product.deleted_at.is_(None)
+    ))
 
 
 async def update_product(
-    db: Session, 
+    db: AsyncSession, 
     product_id: int, 
     product_update: ProductUpdate
 ) -> Optional[Product]:
     """Update a product"""
-    db_product = get_product(db, product_id)
+    db_product = await get_product(db, product_id)
     if not db_product:
         return None
     
@@ -71,53 +88,141 @@ async def update_product(
         setattr(db_product, field, value)
     
     db_product.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(db_product)
+    await enqueue_risk_refresh(db, [product_id])
+    await db.commit()
+    await db.refresh(db_product)
     return db_product
 
 
-def delete_product(db: Session, product_id: int) -> bool:
-    """Delete a product"""
-    db_product = get_product(db, product_id)
+async def delete_product(db: AsyncSession, product_id: int) -> bool:
+    """Soft-delete a product by setting its tombstone"""
+    db_product = await get_product(db, product_id)
     if not db_product:
         return False
     
-    db.delete(db_product)
-    db.commit()
+    db_product.deleted_at = datetime.utcnow()
+    await enqueue_risk_refresh(db, [product_id])
+    await db.commit()
     return True
 
 
-def get_products_by_ingredient(
-    db: Session,
+async def restore_products(db: AsyncSession, merchant_id: str, product_ids: List[int]) -> int:
+    """Clear the tombstones of soft-deleted products in one bulk update"""
+    if not product_ids:
+        return 0
+    
+    result = await db.execute(
+        update(Product)
+        .where(
+            Product.merchant_id == int(merchant_id),
+            Product.id.in_(product_ids),
+            Product.deleted_at.isnot(None)
+        )
+        .values(deleted_at=None, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    await enqueue_risk_refresh(db, product_ids)
+    await db.commit()
+    return result.rowcount
+
+
+async def purge_deleted_products(
+    db: AsyncSession,
+    older_than: timedelta,
+    batch_size: int = 500
+) -> int:
+    """Hard-delete tombstoned products older than the retention window
+    
+    Runs in batches of `batch_size`, committing after each one. Products
+    still referenced by transaction items are kept so sales history stays
+    intact.
+    """
+    cutoff = datetime.utcnow() - older_than
+    referenced = await db.run_sync(_transaction_items_reference)
+    purged = 0
+    
+    while True:
+        query = select(Product.id).where(
+            Product.deleted_at.isnot(None),
+            Product.deleted_at < cutoff
+        )
+        if referenced is not None:
+            query = query.where(~exists().where(referenced.c.product_id == Product.id))
+        
+        ids = list((await db.scalars(query.limit(batch_size))).all())
+        if not ids:
+            return purged
+        
+        await db.execute(delete(ProductTrend).where(ProductTrend.product_id.in_(ids)))
+        await db.execute(delete(ProductTrendWeekly).where(ProductTrendWeekly.product_id.in_(ids)))
+        await db.execute(delete(ProductTrendMonthly).where(ProductTrendMonthly.product_id.in_(ids)))
+        await db.execute(delete(ProductRisk).where(ProductRisk.product_id.in_(ids)))
+        await db.execute(delete(ProductRiskSnapshot).where(ProductRiskSnapshot.product_id.in_(ids)))
+        result = await db.execute(delete(Product).where(Product.id.in_(ids)))
+        purged += result.rowcount
+        await db.commit()
+
+
+def _transaction_items_reference(session) -> Optional[Table]:
+    """The Go backend's transaction_items table, if it exists in this database"""
+    conn = session.connection()
+    if not inspect(conn).has_table("transaction_items"):
+        return None
+    return Table("transaction_items", MetaData(), autoload_with=conn)
+
+
+async def run_tombstone_compaction():
+    """Background job that periodically purges old product tombstones"""
+    retention = timedelta(days=settings.tombstone_retention_days)
+    
+    while True:
+        await asyncio.sleep(settings.tombstone_compaction_interval_seconds)
+        
+        try:
+            async with SessionLocal() as db:
+                purged = await purge_deleted_products(
+                    db, retention, settings.tombstone_compaction_batch_size
+                )
+            if purged:
+                logger.info(f"Purged {purged} soft-deleted products")
+        except Exception as e:
+            logger.error(f"Tombstone compaction failed: {e}")
+
+
+async def get_products_by_ingredient(
+    db: AsyncSession,
     merchant_id: str,
     ingredient: str
 ) -> List[Product]:
     """Get products by ingredient"""
-    return db.query(Product).filter(
+    return (await db.scalars(select(Product).where(
         Product.merchant_id == int(merchant_id),
-        Product.ingredients.ilike(f"%{ingredient}%")
-    ).all()
+        Product.ingredients.ilike(f"%{ingredient}%"),
+        Product.deleted_at.is_(None)
+    ))).all()
 
 
-def search_products_by_name(
-    db: Session,
+async def search_products_by_name(
+    db: AsyncSession,
     merchant_id: str,
     name: str
 ) -> List[Product]:
     """Search products by name"""
-    return db.query(Product).filter(
+    return (await db.scalars(select(Product).where(
         Product.merchant_id == int(merchant_id),
-        Product.name.ilike(f"%{name}%")
-    ).all()
+        Product.name.ilike(f"%{name}%"),
+        Product.deleted_at.is_(None)
+    ))).all()
 
 
-def search_products_by_category(
-    db: Session,
+async def search_products_by_category(
+    db: AsyncSession,
     merchant_id: str,
     category: str
 ) -> List[Product]:
     """Search products by category"""
-    return db.query(Product).filter(
+    return (await db.scalars(select(Product).where(
         Product.merchant_id == int(merchant_id),
-        Product.category.ilike(f"%{category}%")
-    ).all()
+        Product.category.ilike(f"%{category}%"),
+        Product.deleted_at.is_(None)
+    ))).all()
@@ -6,15 +6,17 @@ from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from reportlab.lib.units import cm
 from io import BytesIO
-from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
+from datetime import date, datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from app.models.product import Product
+from app.services import trend_rollups
 import os
 
 class ReportService:
     
     @staticmethod
-    def generate_sales_report(db: Session, merchant_id: str, days: int = 30):
+    async def generate_sales_report(db: AsyncSession, merchant_id: str, days: int = 30):
         """Generate sales report for last N days"""
         buffer = BytesIO()
         p = canvas.Canvas(buffer, pagesize=A4)
@@ -35,6 +37,14 @@ class ReportService:
         p.drawString(2*cm, height - 6*cm, "Total Transaksi: - (data dari Go backend)")
         p.drawString(2*cm, height - 6.5*cm, "Total Pendapatan: - (data dari Go backend)")
         
+        # Product sales recorded for trends, read from the merchant daily rollup
+        today = date.today()
+        quantity, revenue = await trend_rollups.merchant_sales_totals(
+            db, merchant_id, today - timedelta(days=days), today
+        )
+        p.drawString(2*cm, height - 7.5*cm, f"Produk Terjual: {quantity} unit")
+        p.drawString(2*cm, height - 8*cm, f"Pendapatan Produk: Rp{revenue:,.0f}")
+        
         # Footer
         p.setFont("Helvetica-Oblique", 8)
         p.drawString(2*cm, 2*cm, f"Generated by Smartgement AI - {datetime.now().strftime('%Y')}")
@@ -43,7 +53,7 @@ class ReportService:
         return buffer.getvalue()
     
     @staticmethod
-    def generate_inventory_report(db: Session, merchant_id: str):
+    async def generate_inventory_report(db: AsyncSession, merchant_id: str):
         """Generate product inventory report"""
         buffer = BytesIO()
         p = canvas.Canvas(buffer, pagesize=A4)
@@ -57,7 +67,10 @@ class ReportService:
         p.drawString(2*cm, height - 3*cm, f"Tanggal: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
         
         # Get products
-        products = db.query(Product).filter(Product.merchant_id == merchant_id).all()
+        products = (await db.scalars(select(Product).where(
+            Product.merchant_id == merchant_id,
+            Product.deleted_at.is_(None)
+        ))).all()
         
         y = height - 5*cm
         p.setFont("Helvetica-Bold", 10)
@@ -96,7 +109,7 @@ class ReportService:
         return buffer.getvalue()
     
     @staticmethod
-    def generate_summary_report(db: Session, merchant_id: str):
+    async def generate_summary_report(db: AsyncSession, merchant_id: str):
         """Generate business summary report"""
         buffer = BytesIO()
         p = canvas.Canvas(buffer, pagesize=A4)
@@ -110,7 +123,10 @@ class ReportService:
         p.drawString(2*cm, height - 3*cm, f"Tanggal: {datetime.now().strftime('%d/%m/%Y %H:%M')}")
         
         # Get summary data
-        products = db.query(Product).filter(Product.merchant_id == merchant_id).all()
+        products = (await db.scalars(select(Product).where(
+            Product.merchant_id == merchant_id,
+            Product.deleted_at.is_(None)
+        ))).all()
         total_products = len(products)
         total_stock = sum(p.stock for p in products)
         total_value = sum(p.stock * p.price for p in products)
@@ -0,0 +1,140 @@
+"""
+Risk Refresh Queue
+Product IDs whose risk inputs changed, waiting in the risk_refresh_queue
+table for the background risk worker. Writers enqueue in the transaction
+that changes the product, so nothing is lost on restart and every process
+sees the same queue; the worker in risk_services claims due rows in
+batches and rewrites the stored assessments.
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Iterable, List, Sequence
+from sqlalchemy import delete, or_, select, tuple_, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.models.product import RiskRefreshQueue
+
+logger = logging.getLogger(__name__)
+
+# Wakes this process's worker early; other processes find the rows by polling
+_wakeup = asyncio.Event()
+
+
+def _enqueue_upsert(dialect: str, rows: List[dict]):
+    """INSERT queue rows; a product already queued is made due again with
+    its attempts reset and its version bumped"""
+    if dialect == "mysql":
+        stmt = mysql_insert(RiskRefreshQueue).values(rows)
+        return stmt.on_duplicate_key_update(
+            version=RiskRefreshQueue.version + 1,
+            attempts=0,
+            retry_at=None
+        )
+    if dialect == "sqlite":
+        stmt = sqlite_insert(RiskRefreshQueue).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[RiskRefreshQueue.product_id],
+            set_={"version": RiskRefreshQueue.version + 1, "attempts": 0, "retry_at": None}
+        )
+    raise NotImplementedError(f"Risk refresh queueing is not supported on {dialect}")
+
+
+async def enqueue_risk_refresh(db: AsyncSession, product_ids: Iterable[int]) -> None:
+    """Schedule products for reassessment (duplicates collapse)
+    
+    Runs in the caller's transaction: the products are queued when the
+    caller commits the write that changed them, and not at all if it rolls back.
+    """
+    product_ids = sorted({int(product_id) for product_id in product_ids})
+    if not product_ids:
+        return
+    
+    dialect = db.get_bind().dialect.name
+    now = datetime.utcnow()
+    chunk_size = settings.risk_refresh_batch_size
+    for start in range(0, len(product_ids), chunk_size):
+        await db.execute(_enqueue_upsert(dialect, [
+            dict(product_id=product_id, version=1, attempts=0, queued_at=now, retry_at=None)
+            for product_id in product_ids[start:start + chunk_size]
+        ]))
+    _wakeup.set()
+
+
+async def claim_due(db: AsyncSession, limit: int) -> List[Row]:
+    """Claim up to `limit` due products, oldest first
+    
+    Returns (product_id, version, attempts) rows. Claimed rows are not due
+    again for risk_refresh_claim_seconds, so other processes skip them
+    while this one works; a process that dies leaves them to the next.
+    """
+    now = datetime.utcnow()
+    rows = (await db.execute(
+        select(RiskRefreshQueue.product_id, RiskRefreshQueue.version, RiskRefreshQueue.attempts)
+        .where(or_(RiskRefreshQueue.retry_at.is_(None), RiskRefreshQueue.retry_at <= now))
+        .order_by(RiskRefreshQueue.queued_at, RiskRefreshQueue.product_id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )).all()
+    if rows:
+        await db.execute(
+            update(RiskRefreshQueue)
+            .where(RiskRefreshQueue.product_id.in_([row.product_id for row in rows]))
+            .values(retry_at=now + timedelta(seconds=settings.risk_refresh_claim_seconds))
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+    return rows
+
+
+async def complete(db: AsyncSession, rows: Sequence[Row]) -> None:
+    """Remove refreshed products from the queue, keeping any that were
+    queued again while they were being refreshed"""
+    if rows:
+        await db.execute(
+            delete(RiskRefreshQueue)
+            .where(tuple_(RiskRefreshQueue.product_id, RiskRefreshQueue.version).in_(
+                [(row.product_id, row.version) for row in rows]
+            ))
+            .execution_options(synchronize_session=False)
+        )
+    await db.commit()
+
+
+async def retry_later(db: AsyncSession, row: Row) -> bool:
+    """Make a product whose reassessment failed due again after a backoff delay
+    
+    Returns False, dropping the product until the next daily sweep, once
+    it has failed risk_refresh_max_attempts times.
+    """
+    attempts = row.attempts + 1
+    current = (
+        (RiskRefreshQueue.product_id == row.product_id)
+        & (RiskRefreshQueue.version == row.version)
+    )
+    if attempts >= settings.risk_refresh_max_attempts:
+        await db.execute(delete(RiskRefreshQueue).where(current))
+        await db.commit()
+        return False
+    
+    delay = settings.risk_refresh_retry_seconds * 2 ** (attempts - 1)
+    await db.execute(
+        update(RiskRefreshQueue)
+        .where(current)
+        .values(attempts=attempts, retry_at=datetime.utcnow() + timedelta(seconds=delay))
+    )
+    await db.commit()
+    return True
+
+
+async def wait_for_pending(timeout: float) -> bool:
+    """Wait until this process queues something; False if the timeout passed first"""
+    try:
+        await asyncio.wait_for(_wakeup.wait(), timeout)
+        _wakeup.clear()
+        return True
+    except asyncio.TimeoutError:
+        return False
@@ -1,23 +1,42 @@
-from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime, timedelta
-from app.models.product import Product, ProductRisk
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import delete, func, insert, or_, select, union
+from sqlalchemy.engine import Row
+from typing import Dict, List, Sequence, Tuple
+from datetime import datetime, date, time, timedelta
+import asyncio
+import logging
+import numpy as np
+from app.config import settings
+from app.database import SessionLocal
+from app.models.product import Product, ProductRisk, ProductRiskSnapshot, ProductTrend
 from app.schemas.product import RiskAssessment, RiskResponse, HighRiskProductSummary, ProductResponse
-from app.services.trend_service import analyze_product_trend
+from app.services import risk_refresh, trend_engine, trend_rollups
+from app.services.trend_service import TrendWindow
 
+logger = logging.getLogger(__name__)
 
-def assess_product_risk(db: Session, product_id: int) -> RiskResponse:
-    """Comprehensive risk assessment for a product"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
-        raise ValueError("Product not found")
+
+def evaluate_risk_rules(
+    product: Product,
+    average_daily_sales: float,
+    has_recent_sales: bool,
+    trend_direction: str,
+    now: datetime
+) -> List[RiskAssessment]:
+    """Apply every risk rule to one product
     
+    Args:
+        product: Product with stock, price and expiration date loaded
+        average_daily_sales: Average sales per calendar day over 30 days
+        has_recent_sales: Whether anything sold in those 30 days
+        trend_direction: Demand direction over 60 days
+        now: Reference time for expiration checks
+    """
     risks = []
-    risk_scores = []
     
     # 1. Expiration Risk
     if product.expiration_date:
-        days_until_expiration = (product.expiration_date - datetime.utcnow()).days
+        days_until_expiration = (product.expiration_date - now).days
         
         if days_until_expiration < 0:
             risks.append(RiskAssessment(
@@ -27,7 +46,6 @@ def assess_product_risk(db: Session, product_id: int) -> RiskResponse:
                 reason=f"Product expired {abs(days_until_expiration)} days ago",
                 recommendation="Remove from inventory immediately. Do not sell."
             ))
-            risk_scores.append(100.0)
         elif days_until_expiration <= 3:
             risks.append(RiskAssessment(
                 risk_type="expiration",
@@ -36,7 +54,6 @@ def assess_product_risk(db: Session, product_id: int) -> RiskResponse:
                 reason=f"Product expires in {days_until_expiration} days",
                 recommendation="Urgent: Run clearance sale or donation. Use for in-house production if applicable."
             ))
-            risk_scores.append(80.0)
         elif days_until_expiration <= 7:
             risks.append(RiskAssessment(
                 risk_type="expiration",
@@ -45,7 +62,6 @@ def assess_product_risk(db: Session, product_id: int) -> RiskResponse:
                 reason=f"Product expires in {days_until_expiration} days",
                 recommendation="Offer discounts or promotions to move inventory quickly."
             ))
-            risk_scores.append(50.0)
         elif days_until_expiration <= 14:
             risks.append(RiskAssessment(
                 risk_type="expiration",
@@ -54,159 +70,418 @@ def assess_product_risk(db: Session, product_id: int) -> RiskResponse:
                 reason=f"Product expires in {days_until_expiration} days",
                 recommendation="Monitor closely. Plan promotions if stock is high."
             ))
-            risk_scores.append(25.0)
     
     # 2. Stock Risk (based on demand)
-    try:
-        trend_analysis = analyze_product_trend(db, product_id, days=30)
-        avg_daily_sales = trend_analysis.average_daily_sales
+    if average_daily_sales > 0:
+        days_of_stock = product.stock / average_daily_sales
         
-        if avg_daily_sales > 0:
-            days_of_stock = product.stock / avg_daily_sales
-            
-            if days_of_stock < 3:
-                risks.append(RiskAssessment(
-                    risk_type="stock",
-                    risk_level="high",
-                    risk_score=75.0,
-                    reason=f"Only {days_of_stock:.1f} days of stock remaining based on demand",
-                    recommendation=f"Reorder immediately. Stock will run out in {days_of_stock:.0f} days at current sales rate."
-                ))
-                risk_scores.append(75.0)
-            elif days_of_stock < 7:
-                risks.append(RiskAssessment(
-                    risk_type="stock",
-                    risk_level="medium",
-                    risk_score=45.0,
-                    reason=f"{days_of_stock:.1f} days of stock remaining",
-                    recommendation="Plan reorder soon to avoid stockout."
-                ))
-                risk_scores.append(45.0)
-        elif trend_analysis.trend_direction != "no_data" and product.stock == 0:
+        if days_of_stock < 3:
             risks.append(RiskAssessment(
                 risk_type="stock",
-                risk_level="critical",
-                risk_score=90.0,
-                reason="Product is out of stock with historical demand",
-                recommendation="Restock immediately. Customers are looking for this product."
+                risk_level="high",
+                risk_score=75.0,
+                reason=f"Only {days_of_stock:.1f} days of stock remaining based on demand",
+                recommendation=f"Reorder immediately. Stock will run out in {days_of_stock:.0f} days at current sales rate."
             ))
-            risk_scores.append(90.0)
-    except Exception:
-        pass  # No trend data available
-    
-    # 3. Trend Risk (declining popularity)
-    try:
-        trend_analysis = analyze_product_trend(db, product_id, days=60)
-        
-        if trend_analysis.trend_direction == "decreasing":
+        elif days_of_stock < 7:
             risks.append(RiskAssessment(
-                risk_type="trend",
+                risk_type="stock",
                 risk_level="medium",
-                risk_score=40.0,
-                reason="Product demand is declining",
-                recommendation="Consider refreshing product, adjusting pricing, or running promotions. May be seasonal effect."
+                risk_score=45.0,
+                reason=f"{days_of_stock:.1f} days of stock remaining",
+                recommendation="Plan reorder soon to avoid stockout."
             ))
-            risk_scores.append(40.0)
-    except Exception:
-        pass
+    elif has_recent_sales and product.stock == 0:
+        risks.append(RiskAssessment(
+            risk_type="stock",
+            risk_level="critical",
+            risk_score=90.0,
+            reason="Product is out of stock with historical demand",
+            recommendation="Restock immediately. Customers are looking for this product."
+        ))
+    
+    # 3. Trend Risk (declining popularity)
+    if trend_direction == "decreasing":
+        risks.append(RiskAssessment(
+            risk_type="trend",
+            risk_level="medium",
+            risk_score=40.0,
+            reason="Product demand is declining",
+            recommendation="Consider refreshing product, adjusting pricing, or running promotions. May be seasonal effect."
+        ))
     
     # 4. Financial Risk (high value inventory not moving)
     inventory_value = product.stock * product.price
-    if inventory_value > 1000000:  # Adjust threshold as needed
-        try:
-            trend_analysis = analyze_product_trend(db, product_id, days=30)
-            if trend_analysis.average_daily_sales < 1:
-                risks.append(RiskAssessment(
-                    risk_type="financial",
-                    risk_level="high",
-                    risk_score=70.0,
-                    reason=f"High inventory value (Rp {inventory_value:,.0f}) with low turnover",
-                    recommendation="Significant capital locked in slow-moving inventory. Consider discounts or return to supplier if possible."
-                ))
-                risk_scores.append(70.0)
-        except Exception:
-            pass
-    
-    # Calculate overall risk
-    if not risks:
-        overall_risk_score = 0.0
-        overall_risk_level = "low"
-    else:
-        overall_risk_score = max(risk_scores)
-        if overall_risk_score >= 80:
-            overall_risk_level = "critical"
-        elif overall_risk_score >= 60:
-            overall_risk_level = "high"
-        elif overall_risk_score >= 30:
-            overall_risk_level = "medium"
-        else:
-            overall_risk_level = "low"
+    if inventory_value > 1000000 and average_daily_sales < 1:  # Adjust threshold as needed
+        risks.append(RiskAssessment(
+            risk_type="financial",
+            risk_level="high",
+            risk_score=70.0,
+            reason=f"High inventory value (Rp {inventory_value:,.0f}) with low turnover",
+            recommendation="Significant capital locked in slow-moving inventory. Consider discounts or return to supplier if possible."
+        ))
     
-    # Save risk assessment to database
-    db.query(ProductRisk).filter(ProductRisk.product_id == product_id).delete()
-    
-    for risk in risks:
-        db_risk = ProductRisk(
-            product_id=product_id,
-            risk_type=risk.risk_type,
-            risk_level=risk.risk_level,
-            risk_score=risk.risk_score,
-            reason=risk.reason,
-            recommendation=risk.recommendation
-        )
-        db.add(db_risk)
-    
-    db.commit()
+    return risks
+
+
+def _overall_risk(risks: List[RiskAssessment]) -> Tuple[float, str]:
+    """Overall score is the highest individual risk score"""
+    if not risks:
+        return 0.0, "low"
     
+    overall_risk_score = max(r.risk_score for r in risks)
+    if overall_risk_score >= 80:
+        return overall_risk_score, "critical"
+    elif overall_risk_score >= 60:
+        return overall_risk_score, "high"
+    elif overall_risk_score >= 30:
+        return overall_risk_score, "medium"
+    return overall_risk_score, "low"
+
+
+def _build_risk_response(
+    product: Product,
+    risks: List[RiskAssessment],
+    now: datetime
+) -> RiskResponse:
+    overall_risk_score, overall_risk_level = _overall_risk(risks)
     return RiskResponse(
-        product_id=product_id,
+        product_id=product.id,
         product_name=product.name,
         overall_risk_level=overall_risk_level,
         overall_risk_score=overall_risk_score,
         risks=risks,
-        assessed_at=datetime.utcnow()
+        assessed_at=now
+    )
+
+
+def _risk_rows(product_id: int, risks: List[RiskAssessment], now: datetime) -> List[Dict]:
+    """ProductRisk insert parameters for one product's assessment"""
+    return [
+        {
+            "product_id": product_id,
+            "risk_type": risk.risk_type,
+            "risk_level": risk.risk_level,
+            "risk_score": risk.risk_score,
+            "reason": risk.reason,
+            "recommendation": risk.recommendation,
+            "calculated_at": now
+        }
+        for risk in risks
+    ]
+
+
+async def assess_product_risk(db: AsyncSession, product_id: int) -> RiskResponse:
+    """Comprehensive risk assessment for a product"""
+    product = await db.scalar(select(Product).where(
+        Product.id == product_id,
+        Product.deleted_at.is_(None)
+    ))
+    if not product:
+        raise ValueError("Product not found")
+    
+    # One 60-day load serves both the 30- and 60-day statistics
+    now = datetime.utcnow()
+    window = await TrendWindow.load(db, product, days=60)
+    recent = window.analyze(30, include_data_points=False)
+    longer = window.analyze(60, include_data_points=False)
+    
+    risks = evaluate_risk_rules(
+        product,
+        average_daily_sales=recent.average_daily_sales,
+        has_recent_sales=recent.average_daily_sales > 0,
+        trend_direction=longer.trend_direction if longer.average_daily_sales > 0 else "no_data",
+        now=now
+    )
+    
+    # Save risk assessment to database
+    await _store_assessments(db, [(product, risks)], [], now)
+    await db.commit()
+    
+    return _build_risk_response(product, risks, now)
+
+
+async def _assess_products(
+    db: AsyncSession,
+    products: Sequence[Product],
+    now: datetime
+) -> List[Tuple[Product, List[RiskAssessment]]]:
+    """Evaluate the risk rules for many products at once
+    
+    Reads rollup totals for the 30 and 60-day windows and the daily rows
+    of the window's edge weeks, then evaluates every product in memory.
+    """
+    if not products:
+        return []
+    
+    # Window totals come from the rollups; only the first and last week of
+    # the 60-day window are read day by day, for the trend direction
+    today = date.today()
+    product_ids = [product.id for product in products]
+    start_date = today - timedelta(days=60)
+    recent_totals = await trend_rollups.product_sales_totals(db, product_ids, today - timedelta(days=30), today)
+    window_totals = await trend_rollups.product_sales_totals(db, product_ids, start_date, today)
+    edge_weeks = await db.execute(
+        select(ProductTrend.product_id, ProductTrend.date, ProductTrend.quantity_sold)
+        .where(
+            ProductTrend.product_id.in_(product_ids),
+            or_(
+                ProductTrend.date.between(start_date, start_date + timedelta(days=6)),
+                ProductTrend.date >= today - timedelta(days=6)
+            )
+        )
     )
+    daily = trend_engine.dense_daily(edge_weeks, product_ids, start_date, 61)
+    recent = np.array([recent_totals.get(product_id, (0, 0.0))[0] for product_id in product_ids])
+    average_daily_sales = recent / 31
+    has_recent_sales = recent > 0
+    has_sales = np.array([window_totals.get(product_id, (0, 0.0))[0] > 0 for product_id in product_ids])
+    trend_directions = np.where(has_sales, trend_engine.trend_directions(daily), "no_data")
+    
+    return [
+        (product, evaluate_risk_rules(
+            product,
+            average_daily_sales=float(average_daily_sales[row]),
+            has_recent_sales=bool(has_recent_sales[row]),
+            trend_direction=trend_directions[row],
+            now=now
+        ))
+        for row, product in enumerate(products)
+    ]
+
+
+async def _store_assessments(
+    db: AsyncSession,
+    assessed: Sequence[Tuple[Product, List[RiskAssessment]]],
+    removed_ids: Sequence[int],
+    now: datetime
+) -> None:
+    """Replace the stored risks and snapshots of assessed products and drop
+    those of removed ones (caller commits)"""
+    product_ids = [product.id for product, _ in assessed] + list(removed_ids)
+    if not product_ids:
+        return
+    
+    for model in (ProductRisk, ProductRiskSnapshot):
+        await db.execute(
+            delete(model)
+            .where(model.product_id.in_(product_ids))
+            .execution_options(synchronize_session=False)
+        )
+    
+    rows = [row for product, risks in assessed for row in _risk_rows(product.id, risks, now)]
+    if rows:
+        await db.execute(insert(ProductRisk), rows)
+    if assessed:
+        snapshots = []
+        for product, risks in assessed:
+            overall_risk_score, overall_risk_level = _overall_risk(risks)
+            snapshots.append({
+                "product_id": product.id,
+                "merchant_id": product.merchant_id,
+                "overall_risk_level": overall_risk_level,
+                "overall_risk_score": overall_risk_score,
+                "assessed_at": now
+            })
+        await db.execute(insert(ProductRiskSnapshot), snapshots)
+
+
+async def assess_merchant_risks(
+    db: AsyncSession,
+    merchant_id: str
+) -> List[Tuple[Product, RiskResponse]]:
+    """Assess every product of a merchant in one pass
+    
+    Evaluates the whole catalog with a handful of queries and replaces the
+    merchant's stored assessments in one transaction.
+    """
+    now = datetime.utcnow()
+    products = (await db.scalars(
+        select(Product)
+        .where(Product.merchant_id == merchant_id, Product.deleted_at.is_(None))
+        .order_by(Product.id)
+    )).all()
+    
+    assessed = await _assess_products(db, products, now)
+    await _store_assessments(db, assessed, [], now)
+    await db.commit()
+    
+    return [(product, _build_risk_response(product, risks, now)) for product, risks in assessed]
 
 
-def get_high_risk_products(db: Session, merchant_id: str) -> HighRiskProductSummary:
-    """Get all high-risk products for a merchant"""
-    products = db.query(Product).filter(Product.merchant_id == merchant_id).all()
+async def refresh_product_risks(db: AsyncSession, product_ids: Sequence[int]) -> int:
+    """Reassess the given products and store the results
     
-    high_risk_products = []
-    critical_risk_products = []
+    Deleted or unknown products lose their stored risks. Returns the
+    number of products assessed.
+    """
+    now = datetime.utcnow()
+    products = (await db.scalars(
+        select(Product)
+        .where(Product.id.in_(product_ids), Product.deleted_at.is_(None))
+        .order_by(Product.id)
+    )).all()
+    live_ids = {product.id for product in products}
     
-    for product in products:
+    assessed = await _assess_products(db, products, now)
+    await _store_assessments(db, assessed, [pid for pid in product_ids if pid not in live_ids], now)
+    await db.commit()
+    return len(assessed)
+
+
+async def stale_product_ids(db: AsyncSession, assessed_before: datetime) -> List[int]:
+    """Live products without a snapshot from `assessed_before` on, plus
+    deleted products that still have one"""
+    snapshot = ProductRiskSnapshot
+    live = (
+        select(Product.id)
+        .outerjoin(snapshot, snapshot.product_id == Product.id)
+        .where(
+            Product.deleted_at.is_(None),
+            or_(snapshot.product_id.is_(None), snapshot.assessed_at < assessed_before)
+        )
+    )
+    deleted = (
+        select(snapshot.product_id)
+        .join(Product, Product.id == snapshot.product_id)
+        .where(Product.deleted_at.isnot(None))
+    )
+    return list((await db.scalars(union(live, deleted))).all())
+
+
+async def _refresh_individually(rows: Sequence[Row]):
+    """Reassess claimed products one at a time so one bad product cannot
+    hold back the rest; failures back off and are eventually dropped"""
+    dropped = []
+    for row in rows:
         try:
-            risk_response = assess_product_risk(db, product.id)
+            async with SessionLocal() as db:
+                await refresh_product_risks(db, [row.product_id])
+                await risk_refresh.complete(db, [row])
+        except Exception as e:
+            logger.warning(f"Risk refresh of product {row.product_id} failed: {e}")
+            async with SessionLocal() as db:
+                if not await risk_refresh.retry_later(db, row):
+                    dropped.append(row.product_id)
+    if dropped:
+        logger.error(
+            f"Giving up on risk refresh of products {dropped} after "
+            f"{settings.risk_refresh_max_attempts} attempts; the daily sweep will retry them"
+        )
+
+
+async def drain_refresh_queue() -> int:
+    """Reassess every due product in the queue; returns how many were claimed"""
+    claimed = 0
+    while True:
+        async with SessionLocal() as db:
+            batch = await risk_refresh.claim_due(db, settings.risk_refresh_batch_size)
+        if not batch:
+            return claimed
+        claimed += len(batch)
+        try:
+            async with SessionLocal() as db:
+                await refresh_product_risks(db, [row.product_id for row in batch])
+                await risk_refresh.complete(db, batch)
+        except Exception as e:
+            logger.warning(f"Risk refresh of {len(batch)} products failed, retrying one by one: {e}")
+            await _refresh_individually(batch)
+
+
+async def run_risk_worker():
+    """Background job that keeps product_risks and the risk snapshots current
+    
+    Reassesses queued products in batches, polling the shared queue so
+    products queued by other processes or before a restart are picked up.
+    At startup and then daily at midnight UTC it also queues every product
+    not assessed that day, since expiry dates and sales windows move with
+    the calendar.
+    """
+    next_sweep = datetime.utcnow()
+    
+    while True:
+        try:
+            now = datetime.utcnow()
+            if now >= next_sweep:
+                today_start = datetime.combine(now.date(), time.min)
+                async with SessionLocal() as db:
+                    await risk_refresh.enqueue_risk_refresh(db, await stale_product_ids(db, today_start))
+                    await db.commit()
+                next_sweep = today_start + timedelta(days=1)
             
-            if risk_response.overall_risk_level in ["high", "critical"]:
-                high_risk_products.append(product)
-                
-                if risk_response.overall_risk_level == "critical":
-                    critical_risk_products.append(product)
-        except Exception:
-            continue
-    
-    # Convert to ProductResponse
-    product_responses = [
-        ProductResponse.model_validate(p) for p in high_risk_products
-    ]
+            await drain_refresh_queue()
+            
+            timeout = min(settings.risk_refresh_poll_seconds, (next_sweep - datetime.utcnow()).total_seconds())
+            if await risk_refresh.wait_for_pending(max(timeout, 0)):
+                # Let bursts of writes coalesce into one batch
+                await asyncio.sleep(settings.risk_refresh_debounce_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Risk refresh failed: {e}")
+            await asyncio.sleep(settings.risk_refresh_debounce_seconds)
+
+
+async def _assess_unassessed(db: AsyncSession, merchant_id: str) -> int:
+    """Assess the merchant's live products the worker has not reached yet
+    (new products, or every product right after deploy)"""
+    missing = (await db.scalars(
+        select(Product.id)
+        .outerjoin(ProductRiskSnapshot, ProductRiskSnapshot.product_id == Product.id)
+        .where(
+            Product.merchant_id == int(merchant_id),
+            Product.deleted_at.is_(None),
+            ProductRiskSnapshot.product_id.is_(None)
+        )
+    )).all()
+    if not missing:
+        return 0
+    return await refresh_product_risks(db, list(missing))
+
+
+async def get_high_risk_products(db: AsyncSession, merchant_id: str) -> HighRiskProductSummary:
+    """Get all high-risk products for a merchant from the stored snapshots"""
+    await _assess_unassessed(db, merchant_id)
+    rows = (await db.execute(
+        select(Product, ProductRiskSnapshot.overall_risk_level)
+        .join(ProductRiskSnapshot, ProductRiskSnapshot.product_id == Product.id)
+        .where(
+            ProductRiskSnapshot.merchant_id == int(merchant_id),
+            ProductRiskSnapshot.overall_risk_level.in_(("high", "critical")),
+            Product.deleted_at.is_(None)
+        )
+        .order_by(Product.id)
+    )).all()
     
     return HighRiskProductSummary(
-        total_high_risk=len(high_risk_products),
-        total_critical_risk=len(critical_risk_products),
-        products=product_responses
+        total_high_risk=len(rows),
+        total_critical_risk=sum(1 for _, level in rows if level == "critical"),
+        products=[ProductResponse.model_validate(product) for product, _ in rows]
     )
 
 
-def generate_risk_report(db: Session, merchant_id: str) -> dict:
-    """Generate comprehensive risk report for merchant"""
-    products = db.query(Product).filter(Product.merchant_id == merchant_id).all()
+async def generate_risk_report(db: AsyncSession, merchant_id: str) -> dict:
+    """Generate comprehensive risk report for merchant from the stored snapshots"""
+    await _assess_unassessed(db, merchant_id)
+    snapshots = (await db.execute(
+        select(
+            Product.id, Product.name,
+            ProductRiskSnapshot.overall_risk_level, ProductRiskSnapshot.overall_risk_score
+        )
+        .join(ProductRiskSnapshot, ProductRiskSnapshot.product_id == Product.id)
+        .where(ProductRiskSnapshot.merchant_id == int(merchant_id), Product.deleted_at.is_(None))
+        .order_by(Product.id)
+    )).all()
+    total_products = await db.scalar(
+        select(func.count())
+        .select_from(Product)
+        .where(Product.merchant_id == int(merchant_id), Product.deleted_at.is_(None))
+    )
     
     report = {
         "merchant_id": merchant_id,
         "generated_at": datetime.utcnow().isoformat(),
-        "total_products": len(products),
+        "total_products": total_products,
         "risk_breakdown": {
             "critical": 0,
             "high": 0,
@@ -215,30 +490,36 @@ def generate_risk_report(db: Session, merchant_id: str) -> dict:
         },
         "top_risks": []
     }
+    for snapshot in snapshots:
+        report["risk_breakdown"][snapshot.overall_risk_level] += 1
     
-    all_risks = []
-    
-    for product in products:
-        try:
-            risk_response = assess_product_risk(db, product.id)
-            
-            # Count by level
-            report["risk_breakdown"][risk_response.overall_risk_level] += 1
-            
-            # Collect for sorting
-            if risk_response.overall_risk_score > 0:
-                all_risks.append({
-                    "product_id": product.id,
-                    "product_name": product.name,
-                    "risk_level": risk_response.overall_risk_level,
-                    "risk_score": risk_response.overall_risk_score,
-                    "risks": [r.model_dump() for r in risk_response.risks]
-                })
-        except Exception:
-            continue
-    
-    # Sort by risk score and take top 10
-    all_risks.sort(key=lambda x: x["risk_score"], reverse=True)
-    report["top_risks"] = all_risks[:10]
+    # Top 10 by risk score, with the individual risks of just those products
+    top = sorted(
+        (snapshot for snapshot in snapshots if snapshot.overall_risk_score > 0),
+        key=lambda snapshot: snapshot.overall_risk_score,
+        reverse=True
+    )[:10]
+    risks: Dict[int, List[dict]] = {snapshot.id: [] for snapshot in top}
+    if top:
+        for risk in (await db.scalars(
+            select(ProductRisk).where(ProductRisk.product_id.in_(risks)).order_by(ProductRisk.id)
+        )).all():
+            risks[risk.product_id].append(RiskAssessment(
+                risk_type=risk.risk_type,
+                risk_level=risk.risk_level,
+                risk_score=risk.risk_score,
+                reason=risk.reason,
+                recommendation=risk.recommendation
+            ).model_dump())
     
+    report["top_risks"] = [
+        {
+            "product_id": snapshot.id,
+            "product_name": snapshot.name,
+            "risk_level": snapshot.overall_risk_level,
+            "risk_score": snapshot.overall_risk_score,
+            "risks": risks[snapshot.id]
+        }
+        for snapshot in top
+    ]
     return report
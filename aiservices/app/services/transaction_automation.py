@@ -2,7 +2,8 @@
 Transaction Automation Service
 Handles transaction creation via natural language
 """
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
 from app.models.product import Product
 from app.services.llm_client import generate_text
 import json
@@ -71,9 +72,12 @@ class TransactionAutomationService:
             }
         }
     
-    async def match_products(self, db: Session, merchant_id: str, items: List[Dict]) -> List[Dict]:
+    async def match_products(self, db: AsyncSession, merchant_id: str, items: List[Dict]) -> List[Dict]:
         """Match product names to database products"""
-        products = db.query(Product).filter(Product.merchant_id == merchant_id).all()
+        products = (await db.scalars(select(Product).where(
+            Product.merchant_id == merchant_id,
+            Product.deleted_at.is_(None)
+        ))).all()
         
         matched_items = []
         for item in items:
@@ -104,7 +108,7 @@ class TransactionAutomationService:
         
         return matched_items
     
-    async def create_transaction_data(self, db: Session, merchant_id: str, description: str) -> Dict:
+    async def create_transaction_data(self, db: AsyncSession, merchant_id: str, description: str) -> Dict:
         """Parse description and prepare transaction data"""
         # Parse the request
         parse_result = await self.parse_transaction_request(description)
@@ -150,7 +154,7 @@ class TransactionAutomationService:
             }
         }
     
-    async def batch_add_products(self, db: Session, merchant_id: str, description: str) -> Dict:
+    async def batch_add_products(self, db: AsyncSession, merchant_id: str, description: str) -> Dict:
         """Add multiple products from package/batch description"""
         prompt = f"""
         Parse this product batch request:
@@ -0,0 +1,397 @@
+"""
+Transaction Statistics
+SQL aggregates over the Go backend's transactions and the per-merchant
+daily rollup (merchant_daily_stats) that answers past days without
+touching raw transaction rows
+"""
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import asyncio
+import logging
+from time import monotonic
+from sqlalchemy import DateTime, Float, Integer, String, case, column, extract, func, or_, select, table
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.config import settings
+from app.database import SessionLocal
+from app.models.product import MerchantDailyStats, SyncWatermark
+
+logger = logging.getLogger(__name__)
+
+# The Go backend owns these tables; only the columns read here are declared
+transactions = table(
+    "transactions",
+    column("id", Integer),
+    column("merchant_id", Integer),
+    column("total_amount", Float),
+    column("payment_method", String),
+    column("customer_name", String),
+    column("status", String),
+    column("created_at", DateTime),
+    column("updated_at", DateTime)
+)
+transaction_items = table(
+    "transaction_items",
+    column("transaction_id", Integer),
+    column("product_name", String),
+    column("quantity", Integer)
+)
+
+WATERMARK = "merchant_daily_stats"
+
+# One refresh at a time per process; monotonic time the last one finished
+_refresh_lock = asyncio.Lock()
+_last_refresh: Optional[float] = None
+
+
+def day_start(day: date) -> datetime:
+    return datetime.combine(day, time.min)
+
+
+def transaction_filters(
+    merchant_id: str,
+    date_from: Optional[str],
+    date_to: Optional[str],
+    payment_method: Optional[str] = None
+) -> list:
+    """WHERE clauses for a merchant's transactions
+    
+    Inclusive ISO date bounds become a half-open created_at range, so the
+    (merchant_id, created_at) index bounds the scan on both sides.
+    """
+    t = transactions.c
+    filters = [t.merchant_id == int(merchant_id)]
+    if date_from:
+        filters.append(t.created_at >= day_start(date.fromisoformat(date_from)))
+    if date_to:
+        filters.append(t.created_at < day_start(date.fromisoformat(date_to) + timedelta(days=1)))
+    if payment_method:
+        filters.append(t.payment_method == payment_method)
+    return filters
+
+
+def empty_statistics() -> Dict[str, Any]:
+    return {
+        "transaction_count": 0,
+        "completed_count": 0,
+        "revenue": 0.0,
+        "hour_counts": [0] * 24,
+        "payment_methods": {},
+        "items": {}
+    }
+
+
+def merge_statistics(parts: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum statistics of disjoint sets of transactions (days, or rollup and live)"""
+    merged = empty_statistics()
+    for part in parts:
+        merged["transaction_count"] += part["transaction_count"]
+        merged["completed_count"] += part["completed_count"]
+        merged["revenue"] += part["revenue"]
+        merged["hour_counts"] = [a + b for a, b in zip(merged["hour_counts"], part["hour_counts"])]
+        for key in ("payment_methods", "items"):
+            for name, count in part[key].items():
+                merged[key][name] = merged[key].get(name, 0) + count
+    return merged
+
+
+def _as_date(value) -> date:
+    """DATE() comes back as a date on MySQL and as a string on SQLite"""
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+async def aggregate_statistics(
+    db: AsyncSession,
+    filters: list,
+    by_day: bool = False
+) -> Dict[Optional[date], Dict[str, Any]]:
+    """Counts, completed revenue, hour and payment method histograms and
+    item quantities of the matching transactions, in three GROUP BY queries
+    
+    Keyed by DATE(created_at) with by_day, else under None.
+    """
+    t = transactions.c
+    completed = t.status == "completed"
+    day = func.date(t.created_at)
+    keys = [day] if by_day else []
+    statistics: Dict[Optional[date], Dict[str, Any]] = {}
+    
+    def entry(row) -> Dict[str, Any]:
+        key = _as_date(row[0]) if by_day else None
+        if key not in statistics:
+            statistics[key] = empty_statistics()
+        return statistics[key]
+    
+    for row in (await db.execute(
+        select(
+            *keys,
+            t.payment_method,
+            func.count(),
+            func.sum(case((completed, 1), else_=0)),
+            func.sum(case((completed, t.total_amount), else_=0))
+        )
+        .where(*filters)
+        .group_by(*keys, t.payment_method)
+    )).all():
+        stats = entry(row)
+        method, count, completed_count, revenue = row[len(keys):]
+        stats["transaction_count"] += int(count)
+        stats["completed_count"] += int(completed_count or 0)
+        stats["revenue"] += float(revenue or 0)
+        if completed_count:
+            name = method or "unknown"
+            stats["payment_methods"][name] = stats["payment_methods"].get(name, 0) + int(completed_count)
+    
+    hour = extract("hour", t.created_at)
+    for row in (await db.execute(
+        select(*keys, hour, func.count()).where(*filters).group_by(*keys, hour)
+    )).all():
+        hour_value, count = row[len(keys):]
+        if hour_value is not None:
+            entry(row)["hour_counts"][int(hour_value)] += int(count)
+    
+    items = transaction_items.c
+    for row in (await db.execute(
+        select(*keys, items.product_name, func.sum(items.quantity))
+        .select_from(transactions)
+        .join(transaction_items, items.transaction_id == t.id)
+        .where(*filters, completed)
+        .group_by(*keys, items.product_name)
+    )).all():
+        name, quantity = row[len(keys):]
+        entry(row)["items"][name or "unknown"] = int(quantity or 0)
+    
+    return statistics
+
+
+async def revenue_halves(db: AsyncSession, filters: list) -> Tuple[float, float]:
+    """Revenue of the older and the newer half of completed transactions"""
+    t = transactions.c
+    ranked = (
+        select(
+            t.total_amount,
+            func.row_number().over(order_by=(t.created_at, t.id)).label("position"),
+            func.count().over().label("completed")
+        )
+        .where(*filters, t.status == "completed")
+        .subquery()
+    )
+    older, newer = (await db.execute(
+        select(
+            func.sum(case((ranked.c.position * 2 <= ranked.c.completed, ranked.c.total_amount), else_=0)),
+            func.sum(case((ranked.c.position * 2 > ranked.c.completed, ranked.c.total_amount), else_=0))
+        )
+    )).one()
+    return float(older or 0), float(newer or 0)
+
+
+async def revenue_halves_by_day(
+    db: AsyncSession,
+    merchant_id: str,
+    days: Sequence[Tuple[date, Dict[str, Any]]]
+) -> Tuple[float, float]:
+    """revenue_halves from per-day statistics (date ordered)
+    
+    Only the day holding the middle transaction is read row by row.
+    """
+    total_completed = sum(stats["completed_count"] for _, stats in days)
+    total_revenue = sum(stats["revenue"] for _, stats in days)
+    remaining = total_completed // 2
+    older = 0.0
+    for day, stats in days:
+        if remaining >= stats["completed_count"]:
+            remaining -= stats["completed_count"]
+            older += stats["revenue"]
+            continue
+        if remaining:
+            t = transactions.c
+            first = (
+                select(t.total_amount)
+                .where(
+                    t.merchant_id == int(merchant_id),
+                    t.created_at >= day_start(day),
+                    t.created_at < day_start(day + timedelta(days=1)),
+                    t.status == "completed"
+                )
+                .order_by(t.created_at, t.id)
+                .limit(remaining)
+                .subquery()
+            )
+            older += float(await db.scalar(select(func.sum(first.c.total_amount))) or 0)
+        break
+    return older, total_revenue - older
+
+
+def _stats_upsert(dialect: str, rows: List[Dict[str, Any]]):
+    """INSERT daily stats rows, replacing rows that already exist"""
+    columns = [
+        "transaction_count", "completed_count", "revenue",
+        "hour_counts", "payment_methods", "items", "refreshed_at"
+    ]
+    if dialect == "mysql":
+        stmt = mysql_insert(MerchantDailyStats).values(rows)
+        return stmt.on_duplicate_key_update({name: stmt.inserted[name] for name in columns})
+    if dialect == "sqlite":
+        stmt = sqlite_insert(MerchantDailyStats).values(rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[MerchantDailyStats.merchant_id, MerchantDailyStats.date],
+            set_={name: stmt.excluded[name] for name in columns}
+        )
+    raise NotImplementedError(f"Daily stats upserts are not supported on {dialect}")
+
+
+async def refresh_daily_stats(db: AsyncSession) -> int:
+    """Recompute merchant_daily_stats for every day with transactions
+    created or updated since the watermark; returns the days refreshed
+    
+    Whole days are recomputed, so rereading transactions is harmless: the
+    watermark is rewound by a small overlap to catch late commits. Changed
+    transactions are read in pages of transaction_stats_page_size, each
+    committed with the watermark advanced past it, so memory stays bounded
+    and an interrupted refresh resumes where it stopped.
+    """
+    async with _refresh_lock:
+        watermark = await db.get(SyncWatermark, WATERMARK)
+        since = (
+            watermark.value - timedelta(seconds=settings.transaction_stats_overlap_seconds)
+            if watermark else datetime.min
+        )
+        refreshed = 0
+        after = (since, 0)
+        while True:
+            changed = await _changed_page(db, *after)
+            if not changed:
+                break
+            refreshed += await _refresh_days(db, changed)
+            
+            after = changed[-1].updated_at, changed[-1].id
+            if watermark is None:
+                watermark = SyncWatermark(name=WATERMARK, value=after[0])
+                db.add(watermark)
+            elif after[0] > watermark.value:
+                watermark.value = after[0]
+            await db.commit()
+            if len(changed) < settings.transaction_stats_page_size:
+                break
+    
+    global _last_refresh
+    _last_refresh = monotonic()
+    return refreshed
+
+
+async def refresh_if_stale(db: AsyncSession) -> int:
+    """refresh_daily_stats for the request path
+    
+    Skipped when a refresh finished within
+    transaction_stats_max_staleness_seconds or one is running, so requests
+    never queue behind a refresh; the background job keeps the rollup
+    caught up between them.
+    """
+    fresh = (
+        _last_refresh is not None
+        and monotonic() - _last_refresh < settings.transaction_stats_max_staleness_seconds
+    )
+    if fresh or _refresh_lock.locked():
+        return 0
+    return await refresh_daily_stats(db)
+
+
+async def daily_stats_cover(db: AsyncSession, last_day: date) -> bool:
+    """Whether merchant_daily_stats holds every transaction created through
+    last_day, as far as the watermark knows
+    
+    False before the first refresh and while one is still paging through
+    the history (the startup catch-up on a fresh deploy), when the rollup
+    would read as partial totals.
+    """
+    watermark = await db.get(SyncWatermark, WATERMARK)
+    if watermark is None:
+        return False
+    t = transactions.c
+    pending = await db.scalar(
+        select(t.id)
+        .where(t.updated_at > watermark.value, t.created_at < day_start(last_day + timedelta(days=1)))
+        .limit(1)
+    )
+    return pending is None
+
+
+async def _changed_page(db: AsyncSession, updated_at: datetime, transaction_id: int) -> list:
+    """Next page of (merchant_id, day, updated_at, id) of transactions
+    updated at or after updated_at, in (updated_at, id) order, skipping
+    those at updated_at with an id up to transaction_id"""
+    t = transactions.c
+    # Grouped in Python rather than in SQL so the planner keeps to the updated_at index
+    return (await db.execute(
+        select(t.merchant_id, func.date(t.created_at).label("day"), t.updated_at, t.id)
+        .where(t.updated_at >= updated_at, or_(t.updated_at > updated_at, t.id > transaction_id))
+        .order_by(t.updated_at, t.id)
+        .limit(settings.transaction_stats_page_size)
+    )).all()
+
+
+async def _refresh_days(db: AsyncSession, changed: list) -> int:
+    """Upsert the merchant days of a page of changed transactions"""
+    days_by_merchant: Dict[int, set] = {}
+    for row in changed:
+        days_by_merchant.setdefault(int(row.merchant_id), set()).add(_as_date(row.day))
+    
+    now = datetime.utcnow()
+    rows = []
+    for merchant_id, days in days_by_merchant.items():
+        # One range scan of the merchant's index per page
+        statistics = await aggregate_statistics(
+            db,
+            transaction_filters(str(merchant_id), min(days).isoformat(), max(days).isoformat()),
+            by_day=True
+        )
+        for day in sorted(days):
+            stats = statistics.get(day, empty_statistics())
+            rows.append(dict(stats, merchant_id=merchant_id, date=day, refreshed_at=now))
+    
+    dialect = db.get_bind().dialect.name
+    for start in range(0, len(rows), settings.trend_bulk_chunk_size):
+        await db.execute(_stats_upsert(dialect, rows[start:start + settings.trend_bulk_chunk_size]))
+    return len(rows)
+
+
+async def rollup_statistics(
+    db: AsyncSession,
+    merchant_id: str,
+    first_day: Optional[date],
+    last_day: date
+) -> List[Tuple[date, Dict[str, Any]]]:
+    """Date-ordered daily statistics from merchant_daily_stats"""
+    query = select(MerchantDailyStats).where(
+        MerchantDailyStats.merchant_id == int(merchant_id),
+        MerchantDailyStats.date <= last_day
+    )
+    if first_day is not None:
+        query = query.where(MerchantDailyStats.date >= first_day)
+    
+    return [
+        (row.date, {
+            "transaction_count": row.transaction_count or 0,
+            "completed_count": row.completed_count or 0,
+            "revenue": row.revenue or 0.0,
+            "hour_counts": row.hour_counts or [0] * 24,
+            "payment_methods": row.payment_methods or {},
+            "items": row.items or {}
+        })
+        for row in (await db.scalars(query.order_by(MerchantDailyStats.date))).all()
+    ]
+
+
+async def run_daily_stats_refresh():
+    """Background job that keeps merchant_daily_stats caught up"""
+    while True:
+        try:
+            async with SessionLocal() as db:
+                refreshed = await refresh_daily_stats(db)
+            if refreshed:
+                logger.info(f"Refreshed {refreshed} merchant daily stats rows")
+        except Exception as e:
+            logger.error(f"Daily stats refresh failed: {e}")
+    
+        await asyncio.sleep(settings.transaction_stats_refresh_seconds)
@@ -1,85 +1,140 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import text, func
-from datetime import datetime, timedelta
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from datetime import date, datetime, timedelta
 from typing import Dict, List, Any, Optional
 import json
+import logging
+from app.config import settings
+from app.services import date_windows, transaction_stats
+from app.services.llm_cache import LLMResponseCache, TTLCache
 from app.services.llm_client import generate_text
+from app.services.transaction_stats import transaction_items, transactions
+
+logger = logging.getLogger(__name__)
+
+# (merchant, period, payment method) -> (statistics fingerprint, LLM summary)
+summary_cache = TTLCache(
+    max_entries=settings.transaction_summary_cache_max_entries,
+    ttl_seconds=settings.transaction_summary_cache_ttl_seconds
+)
+
+
+async def _transaction_samples(db: AsyncSession, filters: list, limit: int) -> List[Dict[str, Any]]:
+    """The `limit` most recent transactions with their items"""
+    t = transactions.c
+    rows = (await db.execute(
+        select(t.id, t.total_amount, t.payment_method, t.customer_name, t.status, t.created_at)
+        .where(*filters)
+        .order_by(t.created_at.desc(), t.id.desc())
+        .limit(limit)
+    )).all()
+    samples = [dict(row._mapping, items=[]) for row in rows]
+    if not samples:
+        return samples
+    
+    by_id = {sample["id"]: sample for sample in samples}
+    items = transaction_items.c
+    for transaction_id, product_name, quantity in (await db.execute(
+        select(items.transaction_id, items.product_name, items.quantity)
+        .where(items.transaction_id.in_(by_id))
+    )).all():
+        by_id[transaction_id]["items"].append(f"{product_name} ({quantity})")
+    return samples
+
+
+async def _rollup_statistics(
+    db: AsyncSession,
+    merchant_id: str,
+    date_from: Optional[str],
+    date_to: Optional[str]
+):
+    """Statistics and revenue halves for a date range: past days from
+    merchant_daily_stats, today from live transactions
+    
+    Past days are read live too until the rollup covers them, so a summary
+    during the first refresh is slower rather than short.
+    """
+    try:
+        await transaction_stats.refresh_if_stale(db)
+    except Exception as e:
+        # Serve the rollup as last refreshed rather than fail the summary
+        await db.rollback()
+        logger.warning(f"Daily stats refresh failed: {e}")
+    
+    today = date.today()
+    first_day = date.fromisoformat(date_from) if date_from else None
+    last_day = date.fromisoformat(date_to) if date_to else today
+    
+    days = []
+    if first_day is None or first_day < today:
+        past_last_day = min(last_day, today - timedelta(days=1))
+        if await transaction_stats.daily_stats_cover(db, past_last_day):
+            days = await transaction_stats.rollup_statistics(db, merchant_id, first_day, past_last_day)
+        else:
+            live_days = await transaction_stats.aggregate_statistics(
+                db,
+                transaction_stats.transaction_filters(
+                    merchant_id, date_from, past_last_day.isoformat()
+                ),
+                by_day=True
+            )
+            days = sorted(live_days.items())
+    if (first_day is None or first_day <= today) and last_day >= today:
+        live = (await transaction_stats.aggregate_statistics(
+            db, transaction_stats.transaction_filters(merchant_id, today.isoformat(), today.isoformat())
+        )).get(None)
+        if live:
+            days.append((today, live))
+    
+    stats = transaction_stats.merge_statistics([day_stats for _, day_stats in days])
+    return stats, await transaction_stats.revenue_halves_by_day(db, merchant_id, days)
 
 
 async def generate_transaction_summary(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
     date_from: Optional[str] = None,
     date_to: Optional[str] = None,
     payment_method: Optional[str] = None,
-    limit: int = 100
+    limit: int = 100,
+    include_samples: bool = False
 ) -> Dict[str, Any]:
-    """Generate AI-powered transaction summary"""
-    
-    # Build query
-    query = """
-        SELECT 
-            t.id, t.total_amount, t.payment_method, t.customer_name,
-            t.status, t.created_at,
-            GROUP_CONCAT(CONCAT(ti.product_name, ' (', ti.quantity, ')') SEPARATOR ', ') as items
-        FROM transactions t
-        LEFT JOIN transaction_items ti ON t.id = ti.transaction_id
-        WHERE t.merchant_id = :merchant_id
-    """
-    
-    params = {"merchant_id": int(merchant_id)}
-    
-    # Add filters
-    if date_from:
-        query += " AND DATE(t.created_at) >= :date_from"
-        params["date_from"] = date_from
-    
-    if date_to:
-        query += " AND DATE(t.created_at) <= :date_to"
-        params["date_to"] = date_to
+    """Generate AI-powered transaction summary
     
+    Statistics cover every matching transaction: past days come from the
+    merchant_daily_stats rollup and today from live rows (a payment method
+    filter reads live rows throughout). The LLM summary is reused while the
+    statistics are unchanged. Up to `limit` recent transactions are fetched
+    only when include_samples is set.
+    """
+    filters = transaction_stats.transaction_filters(merchant_id, date_from, date_to, payment_method)
     if payment_method:
-        query += " AND t.payment_method = :payment_method"
-        params["payment_method"] = payment_method
-    
-    query += " GROUP BY t.id ORDER BY t.created_at DESC LIMIT :limit"
-    params["limit"] = limit
-    
-    # Execute query
-    result = db.execute(text(query), params)
-    transactions = [dict(row._mapping) for row in result]
-    
-    # Calculate statistics
-    total_transactions = len(transactions)
-    completed_transactions = [t for t in transactions if t['status'] == 'completed']
-    total_revenue = sum(float(t['total_amount']) for t in completed_transactions)
-    average_transaction = total_revenue / len(completed_transactions) if completed_transactions else 0
+        stats = (await transaction_stats.aggregate_statistics(db, filters)).get(None)
+        stats = stats or transaction_stats.empty_statistics()
+        first_half_rev, second_half_rev = await transaction_stats.revenue_halves(db, filters)
+    else:
+        stats, (first_half_rev, second_half_rev) = await _rollup_statistics(db, merchant_id, date_from, date_to)
     
-    # Payment method breakdown
-    payment_methods = {}
-    for t in completed_transactions:
-        method = t['payment_method'] or 'unknown'
-        payment_methods[method] = payment_methods.get(method, 0) + 1
+    total_transactions = stats["transaction_count"]
+    completed_count = stats["completed_count"]
+    total_revenue = stats["revenue"]
+    average_transaction = total_revenue / completed_count if completed_count else 0
+    payment_methods = stats["payment_methods"]
     
     # Generate insights
     insights = []
     
-    # Peak time analysis
-    if transactions:
-        hours = {}
-        for t in transactions:
-            hour = t['created_at'].hour
-            hours[hour] = hours.get(hour, 0) + 1
-        
-        if hours:
-            peak_hour = max(hours.items(), key=lambda x: x[1])
-            insights.append({
-                "type": "peak_hour",
-                "title": "Peak Sales Hour",
-                "description": f"Most transactions occur at {peak_hour[0]}:00 with {peak_hour[1]} sales",
-                "value": f"{peak_hour[0]}:00",
-                "confidence": 0.9
-            })
+    # Peak time analysis (earliest hour on ties)
+    hours = {hour: count for hour, count in enumerate(stats["hour_counts"]) if count}
+    if hours:
+        peak_hour = max(hours.items(), key=lambda x: x[1])
+        insights.append({
+            "type": "peak_hour",
+            "title": "Peak Sales Hour",
+            "description": f"Most transactions occur at {peak_hour[0]}:00 with {peak_hour[1]} sales",
+            "value": f"{peak_hour[0]}:00",
+            "confidence": 0.9
+        })
     
     # Payment method preference
     if payment_methods:
@@ -98,12 +153,8 @@ async def generate_transaction_summary(
         })
     
     # Revenue trend
-    if len(completed_transactions) >= 2:
-        # Simple trend: compare first half vs second half
-        mid = len(completed_transactions) // 2
-        first_half_rev = sum(float(t['total_amount']) for t in completed_transactions[:mid])
-        second_half_rev = sum(float(t['total_amount']) for t in completed_transactions[mid:])
-        
+    if completed_count >= 2:
+        # Simple trend: compare the older half of completed transactions with the newer half
         if second_half_rev > first_half_rev * 1.1:
             trend = "increasing"
             description = "Revenue is trending upward"
@@ -122,6 +173,17 @@ async def generate_transaction_summary(
             "confidence": 0.75
         })
     
+    # Best seller
+    if stats["items"]:
+        top_item = max(stats["items"].items(), key=lambda x: x[1])
+        insights.append({
+            "type": "popular_product",
+            "title": "Best Selling Product",
+            "description": f"{top_item[0]} sold {top_item[1]} units",
+            "value": top_item[0],
+            "confidence": 0.9
+        })
+    
     # Generate natural language summary using LLM
     period_desc = "all time"
     if date_from and date_to:
@@ -135,7 +197,7 @@ async def generate_transaction_summary(
     context = f"""
     Transaction Summary for Merchant {merchant_id} ({period_desc}):
     - Total Transactions: {total_transactions}
-    - Completed: {len(completed_transactions)}
+    - Completed: {completed_count}
     - Total Revenue: Rp{total_revenue:,.2f}
     - Average Transaction: Rp{average_transaction:,.2f}
     - Payment Methods: {json.dumps(payment_methods)}
@@ -151,13 +213,28 @@ async def generate_transaction_summary(
     
     Summary:"""
     
-    try:
-        summary_text = await generate_text(prompt, max_tokens=200)
-    except Exception as e:
-        # Fallback summary if LLM fails
-        summary_text = f"Anda memiliki {total_transactions} transaksi dengan total pendapatan Rp{total_revenue:,.2f}. Rata-rata nilai transaksi adalah Rp{average_transaction:,.2f}."
+    # A transaction landing in the period changes the fingerprint, so the
+    # period's cached summary is replaced rather than served stale
+    cache_key = f"{merchant_id}:{period_desc}:{payment_method or ''}"
+    fingerprint = LLMResponseCache.make_key(
+        total_transactions=total_transactions,
+        completed_count=completed_count,
+        total_revenue=round(total_revenue, 2),
+        payment_methods=payment_methods,
+        insights=insights
+    )
+    cached = summary_cache.get(cache_key)
+    if cached is not None and cached[0] == fingerprint:
+        summary_text = cached[1]
+    else:
+        try:
+            summary_text = await generate_text(prompt, max_tokens=200)
+            summary_cache.set(cache_key, (fingerprint, summary_text))
+        except Exception as e:
+            # Fallback summary if LLM fails (not cached)
+            summary_text = f"Anda memiliki {total_transactions} transaksi dengan total pendapatan Rp{total_revenue:,.2f}. Rata-rata nilai transaksi adalah Rp{average_transaction:,.2f}."
     
-    return {
+    result = {
         "summary": summary_text,
         "total_transactions": total_transactions,
         "total_revenue": total_revenue,
@@ -165,43 +242,29 @@ async def generate_transaction_summary(
         "insights": insights,
         "period": period_desc
     }
+    if include_samples:
+        result["samples"] = await _transaction_samples(db, filters, limit)
+    return result
 
 
 async def analyze_transaction_query(
-    db: Session,
+    db: AsyncSession,
     merchant_id: str,
     query: str
 ) -> Dict[str, Any]:
-    """Analyze natural language query about transactions"""
-    
-    # Determine query intent and time period
-    query_lower = query.lower()
-    
-    # Extract time period
-    date_from = None
-    date_to = None
-    
-    today = datetime.now().date()
-    
-    if "hari ini" in query_lower or "today" in query_lower:
-        date_from = today.isoformat()
-        date_to = today.isoformat()
-    elif "kemarin" in query_lower or "yesterday" in query_lower:
-        yesterday = today - timedelta(days=1)
-        date_from = yesterday.isoformat()
-        date_to = yesterday.isoformat()
-    elif "minggu ini" in query_lower or "this week" in query_lower:
-        week_start = today - timedelta(days=today.weekday())
-        date_from = week_start.isoformat()
-        date_to = today.isoformat()
-    elif "bulan ini" in query_lower or "this month" in query_lower:
-        date_from = today.replace(day=1).isoformat()
-        date_to = today.isoformat()
+    """Analyze natural language query about transactions
+    
+    The period is parsed locally; a query naming none covers the last
+    transaction_query_default_days days rather than all time.
+    """
+    first_day, last_day = date_windows.parse_date_window(
+        query, datetime.now().date(), settings.transaction_query_default_days
+    )
     
     # Generate summary with detected time period
     return await generate_transaction_summary(
         db=db,
         merchant_id=merchant_id,
-        date_from=date_from,
-        date_to=date_to
+        date_from=first_day.isoformat() if first_day else None,
+        date_to=last_day.isoformat() if last_day else None
     )
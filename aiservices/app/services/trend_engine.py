@@ -0,0 +1,202 @@
+"""
+Trend Statistics Engine
+Vectorized NumPy statistics over product_trends sales series
+
+Statistics run on dense calendar arrays: one element per day of the
+window, zero on days without a product_trends row.
+"""
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Sequence
+import numpy as np
+
+# datetime64[D] counts days from 1970-01-01, which was a Thursday (Monday == 0)
+EPOCH_WEEKDAY = 3
+
+
+class SalesSeries:
+    """Date-ordered daily sales of one product as NumPy columns"""
+    
+    __slots__ = ("dates", "quantity", "revenue", "popularity")
+    
+    def __init__(
+        self,
+        dates: np.ndarray,
+        quantity: np.ndarray,
+        revenue: Optional[np.ndarray] = None,
+        popularity: Optional[np.ndarray] = None
+    ):
+        self.dates = dates
+        self.quantity = quantity
+        self.revenue = revenue
+        self.popularity = popularity
+    
+    @classmethod
+    def from_rows(cls, rows: Iterable) -> "SalesSeries":
+        """Build from rows with date and quantity_sold (revenue and
+        popularity_score are picked up when present)"""
+        rows = list(rows)
+        dates = np.array([r.date for r in rows], dtype="datetime64[D]")
+        quantity = np.array([r.quantity_sold or 0 for r in rows], dtype=np.int64)
+    
+        revenue = popularity = None
+        if rows and hasattr(rows[0], "revenue"):
+            revenue = np.array([r.revenue or 0.0 for r in rows], dtype=np.float64)
+        if rows and hasattr(rows[0], "popularity_score"):
+            popularity = np.array([r.popularity_score or 0.0 for r in rows], dtype=np.float64)
+        return cls(dates, quantity, revenue, popularity)
+    
+    def __len__(self) -> int:
+        return len(self.quantity)
+    
+    def __getitem__(self, index: slice) -> "SalesSeries":
+        """Slice every column at once (views, no copy)"""
+        return SalesSeries(*(
+            column[index] if column is not None else None
+            for column in (self.dates, self.quantity, self.revenue, self.popularity)
+        ))
+    
+    def since(self, start_date: date) -> "SalesSeries":
+        """Rows dated on or after start_date"""
+        start = np.searchsorted(self.dates, np.datetime64(start_date, "D"), side="left")
+        return self[start:]
+    
+    def dense(self, start: date, days: int) -> np.ndarray:
+        """Daily quantities for `days` calendar days from start, zero on days
+        without a row"""
+        values = np.zeros(days, dtype=np.int64)
+        offsets = (self.dates - np.datetime64(start, "D")).astype(np.int64)
+        inside = (offsets >= 0) & (offsets < days)
+        values[offsets[inside]] = self.quantity[inside]
+        return values
+    
+    def date_list(self, indices: Optional[np.ndarray] = None) -> List[date]:
+        """Dates as datetime.date objects, optionally for selected rows"""
+        dates = self.dates if indices is None else self.dates[indices]
+        return dates.astype(object).tolist()
+
+
+def split_by_product(rows: Iterable) -> Dict[int, SalesSeries]:
+    """Group (product_id, date, quantity_sold, ...) rows sorted by product
+    then date into one series per product"""
+    rows = list(rows)
+    if not rows:
+        return {}
+    
+    product_ids = np.array([r.product_id for r in rows], dtype=np.int64)
+    series = SalesSeries.from_rows(rows)
+    
+    # Boundaries where the product id changes
+    starts = np.flatnonzero(np.r_[True, product_ids[1:] != product_ids[:-1]])
+    ends = np.r_[starts[1:], len(product_ids)]
+    return {
+        int(product_ids[start]): series[start:end]
+        for start, end in zip(starts, ends)
+    }
+
+
+def dense_daily(rows: Iterable, product_ids: Sequence[int], start: date, days: int) -> np.ndarray:
+    """Zero-filled products x days quantity matrix from (product_id, date,
+    quantity_sold) query rows
+    
+    Rows are scattered into place in one step, without per-day objects.
+    Rows for other products or outside the window are ignored.
+    """
+    daily = np.zeros((len(product_ids), days), dtype=np.int64)
+    columns = list(zip(*rows))
+    if not columns:
+        return daily
+    
+    positions = {product_id: row for row, product_id in enumerate(product_ids)}
+    row_index = np.array([positions.get(product_id, -1) for product_id in columns[0]], dtype=np.int64)
+    offsets = (np.array(columns[1], dtype="datetime64[D]") - np.datetime64(start, "D")).astype(np.int64)
+    quantity = np.array([q or 0 for q in columns[2]], dtype=np.int64)
+    
+    inside = (row_index >= 0) & (offsets >= 0) & (offsets < days)
+    np.add.at(daily, (row_index[inside], offsets[inside]), quantity[inside])
+    return daily
+
+
+def calendar_dates(start: date, offsets: np.ndarray) -> List[date]:
+    """Dates of day offsets into a dense window"""
+    return (np.datetime64(start, "D") + offsets).astype(object).tolist()
+
+
+def top_k_indices(values: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest values, largest first
+    
+    Ties keep their original order, matching a stable descending sort.
+    """
+    n = len(values)
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    
+    # argpartition finds the k-th largest value without a full sort
+    threshold = values[np.argpartition(values, n - k)[n - k]]
+    above = np.flatnonzero(values > threshold)
+    ties = np.flatnonzero(values == threshold)[:k - len(above)]
+    
+    selected = np.concatenate([above, ties])
+    return selected[np.lexsort((selected, -values[selected]))]
+
+
+def peak_indices(daily: np.ndarray) -> np.ndarray:
+    """Top 20% of calendar days (at least one), among days with sales"""
+    top = top_k_indices(daily, max(1, len(daily) // 5))
+    return top[daily[top] > 0]
+
+
+def trend_directions(daily: np.ndarray) -> np.ndarray:
+    """Compare the first and last calendar week of each row of a dense
+    products x days matrix"""
+    if daily.shape[1] < 7:
+        return np.full(daily.shape[0], "insufficient_data", dtype=object)
+    
+    # Weekly totals stay exact in integers; comparing them equals comparing means
+    first_week = daily[:, :7].sum(axis=1)
+    last_week = daily[:, -7:].sum(axis=1)
+    return np.select(
+        [last_week > first_week * 1.2, last_week < first_week * 0.8],
+        ["increasing", "decreasing"],
+        default="stable"
+    ).astype(object)
+
+
+def trend_direction(daily: np.ndarray) -> str:
+    """Compare the first and last calendar week of a dense sales series"""
+    return trend_directions(daily[np.newaxis, :])[0]
+
+
+def weekday_averages(dates: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """Average sales for each weekday that has data"""
+    weekdays = (dates.astype(np.int64) + EPOCH_WEEKDAY) % 7
+    counts = np.bincount(weekdays, minlength=7)
+    totals = np.bincount(weekdays, weights=values, minlength=7)
+    present = counts > 0
+    return totals[present] / counts[present]
+
+
+def coefficient_of_variation(values: np.ndarray) -> float:
+    """Sample standard deviation over the mean (0 when undefined)"""
+    if len(values) == 0:
+        return 0.0
+    mean = values.mean()
+    if mean <= 0:
+        return 0.0
+    std = values.std(ddof=1) if len(values) > 1 else 0.0
+    return float(std / mean)
+
+
+def has_weekly_seasonality(daily: np.ndarray, start: date) -> bool:
+    """Whether weekday averages of a dense series vary by more than 30% of
+    their mean (needs two full weeks)"""
+    if len(daily) < 14:
+        return False
+    
+    dates = np.datetime64(start, "D") + np.arange(len(daily))
+    return coefficient_of_variation(weekday_averages(dates, daily)) > 0.3
+
+
+def average_daily_sales(daily: np.ndarray) -> float:
+    """Mean sales per calendar day of a dense series"""
+    return int(daily.sum()) / len(daily) if len(daily) else 0.0
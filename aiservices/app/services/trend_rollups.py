@@ -0,0 +1,312 @@
+"""
+Trend Rollups
+Weekly and monthly product sales and daily merchant sales, kept in step
+with product_trends so long windows read a few coarse rows instead of
+every day
+"""
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+from sqlalchemy import Integer, String, cast, delete, func, literal, or_, select, union_all
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+from app.database import SessionLocal
+from app.models.product import (
+    Product, ProductTrend, ProductTrendWeekly, ProductTrendMonthly, MerchantTrendDaily, SyncWatermark
+)
+
+logger = logging.getLogger(__name__)
+
+# Set by the first full rebuild; until then the rollups lack older history
+WATERMARK = "trend_rollups"
+
+
+def week_start(day: date) -> date:
+    """Monday of the ISO week containing day"""
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def increment_upsert(dialect: str, model, keys: Sequence[str], values=None, from_select=None, **updates):
+    """INSERT rows into an additive sales table, adding quantity_sold and
+    revenue to rows whose key already exists
+    
+    Pass `values` (one row or a list) or `from_select` as (columns, select).
+    Extra MySQL-only `updates` are applied alongside the increments.
+    """
+    if dialect == "mysql":
+        stmt = mysql_insert(model)
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(model)
+    else:
+        raise NotImplementedError(f"Sale upserts are not supported on {dialect}")
+    
+    stmt = stmt.values(values) if from_select is None else stmt.from_select(*from_select)
+    
+    if dialect == "mysql":
+        return stmt.on_duplicate_key_update(
+            **updates,
+            quantity_sold=model.quantity_sold + stmt.inserted.quantity_sold,
+            revenue=model.revenue + stmt.inserted.revenue
+        )
+    return stmt.on_conflict_do_update(
+        index_elements=[getattr(model, key) for key in keys],
+        set_={
+            "quantity_sold": model.quantity_sold + stmt.excluded.quantity_sold,
+            "revenue": model.revenue + stmt.excluded.revenue
+        }
+    )
+
+
+def sale_increments(dialect: str, product_id: int, sale_date: date, quantity: int) -> list:
+    """Rollup upserts for one sale, priced and attributed from products
+    
+    Each statement selects from the product row, so a sale for an unknown
+    product touches no rollup.
+    """
+    revenue = quantity * func.coalesce(Product.price, 0.0)
+    columns = ["quantity_sold", "revenue"]
+    
+    def from_product(*selected):
+        return select(*selected, literal(quantity), revenue).where(Product.id == product_id)
+    
+    return [
+        increment_upsert(dialect, ProductTrendWeekly, ["product_id", "week_start"], from_select=(
+            ["product_id", "week_start", *columns],
+            from_product(Product.id, literal(week_start(sale_date)))
+        )),
+        increment_upsert(dialect, ProductTrendMonthly, ["product_id", "month_start"], from_select=(
+            ["product_id", "month_start", *columns],
+            from_product(Product.id, literal(month_start(sale_date)))
+        )),
+        increment_upsert(dialect, MerchantTrendDaily, ["merchant_id", "date"], from_select=(
+            ["merchant_id", "date", *columns],
+            from_product(Product.merchant_id, literal(sale_date))
+        ))
+    ]
+
+
+def bulk_increments(
+    dialect: str,
+    rows: Iterable[dict],
+    merchants: Dict[int, int],
+    chunk_size: int
+) -> list:
+    """Chunked rollup upserts for already aggregated product/day rows
+    
+    Rows carry product_id, date, quantity_sold and revenue; merchants maps
+    product_id to merchant_id.
+    """
+    weekly = defaultdict(lambda: [0, 0.0])
+    monthly = defaultdict(lambda: [0, 0.0])
+    merchant_daily = defaultdict(lambda: [0, 0.0])
+    for row in rows:
+        for totals, key in (
+            (weekly, (row["product_id"], week_start(row["date"]))),
+            (monthly, (row["product_id"], month_start(row["date"]))),
+            (merchant_daily, (merchants[row["product_id"]], row["date"]))
+        ):
+            totals[key][0] += row["quantity_sold"]
+            totals[key][1] += row["revenue"]
+    
+    statements = []
+    for model, keys, totals in (
+        (ProductTrendWeekly, ["product_id", "week_start"], weekly),
+        (ProductTrendMonthly, ["product_id", "month_start"], monthly),
+        (MerchantTrendDaily, ["merchant_id", "date"], merchant_daily)
+    ):
+        values = [
+            {keys[0]: owner, keys[1]: period, "quantity_sold": quantity, "revenue": revenue}
+            for (owner, period), (quantity, revenue) in totals.items()
+        ]
+        for start in range(0, len(values), chunk_size):
+            statements.append(increment_upsert(dialect, model, keys, values[start:start + chunk_size]))
+    return statements
+
+
+class RollupPlan(NamedTuple):
+    """Coarsest pieces covering a date range"""
+    months: List[date]
+    weeks: List[date]
+    days: List[Tuple[date, date]]  # inclusive runs of single days
+
+
+def plan_range(start: date, end: date) -> RollupPlan:
+    """Cover [start, end] with whole months, then whole ISO weeks, then days"""
+    months, weeks, days = [], [], []
+    day = start
+    while day <= end:
+        next_month = (month_start(day) + timedelta(days=32)).replace(day=1)
+        month_after = (next_month + timedelta(days=32)).replace(day=1)
+        week_end = day + timedelta(days=6)
+        if day.day == 1 and next_month - timedelta(days=1) <= end:
+            months.append(day)
+            day = next_month
+        # A week running into the next month must not split a whole month
+        elif day.weekday() == 0 and week_end <= end and not (
+            week_end >= next_month and month_after - timedelta(days=1) <= end
+        ):
+            weeks.append(day)
+            day += timedelta(days=7)
+        else:
+            if days and days[-1][1] == day - timedelta(days=1):
+                days[-1] = (days[-1][0], day)
+            else:
+                days.append((day, day))
+            day += timedelta(days=1)
+    return RollupPlan(months, weeks, days)
+
+
+async def product_sales_totals(
+    db: AsyncSession,
+    product_ids: Sequence[int],
+    start: date,
+    end: date
+) -> Dict[int, Tuple[int, float]]:
+    """Quantity and revenue per product over [start, end]
+    
+    Reads monthly and weekly rollups wherever they cover the range and
+    daily rows only for the edges, all in one query. Before the first
+    rebuild it reads daily rows throughout.
+    """
+    if not product_ids:
+        return {}
+    
+    plan = plan_range(start, end) if await rollups_ready(db) else RollupPlan([], [], [(start, end)])
+    parts = []
+    for model, period, periods in (
+        (ProductTrendMonthly, ProductTrendMonthly.month_start, plan.months),
+        (ProductTrendWeekly, ProductTrendWeekly.week_start, plan.weeks)
+    ):
+        if periods:
+            parts.append(
+                select(model.product_id, func.sum(model.quantity_sold), func.sum(model.revenue))
+                .where(model.product_id.in_(product_ids), period.in_(periods))
+                .group_by(model.product_id)
+            )
+    if plan.days:
+        parts.append(
+            select(ProductTrend.product_id, func.sum(ProductTrend.quantity_sold), func.sum(ProductTrend.revenue))
+            .where(
+                ProductTrend.product_id.in_(product_ids),
+                or_(*(ProductTrend.date.between(first, last) for first, last in plan.days))
+            )
+            .group_by(ProductTrend.product_id)
+        )
+    
+    totals: Dict[int, Tuple[int, float]] = {}
+    for product_id, quantity, revenue in (await db.execute(union_all(*parts))).all():
+        previous_quantity, previous_revenue = totals.get(product_id, (0, 0.0))
+        totals[product_id] = (previous_quantity + int(quantity or 0), previous_revenue + float(revenue or 0.0))
+    return totals
+
+
+async def merchant_sales_totals(
+    db: AsyncSession,
+    merchant_id: int,
+    start: date,
+    end: date
+) -> Tuple[int, float]:
+    """Quantity and revenue of all a merchant's products over [start, end]"""
+    if await rollups_ready(db):
+        query = select(func.sum(MerchantTrendDaily.quantity_sold), func.sum(MerchantTrendDaily.revenue)).where(
+            MerchantTrendDaily.merchant_id == merchant_id,
+            MerchantTrendDaily.date.between(start, end)
+        )
+    else:
+        query = (
+            select(func.sum(ProductTrend.quantity_sold), func.sum(ProductTrend.revenue))
+            .join(Product, Product.id == ProductTrend.product_id)
+            .where(Product.merchant_id == merchant_id, ProductTrend.date.between(start, end))
+        )
+    quantity, revenue = (await db.execute(query)).one()
+    return int(quantity or 0), float(revenue or 0.0)
+
+
+async def rollups_ready(db: AsyncSession) -> bool:
+    """Whether a full rebuild has loaded the history into the rollups"""
+    return await db.get(SyncWatermark, WATERMARK) is not None
+
+
+def _period_start(dialect: str, column, period: str):
+    """SQL expression for the Monday / first of month of a date column"""
+    if dialect == "mysql":
+        offset = func.weekday(column) if period == "week" else func.dayofmonth(column) - 1
+        return func.subdate(column, offset)
+    if dialect == "sqlite":
+        if period == "month":
+            return func.date(column, "start of month")
+        weekday = (cast(func.strftime("%w", column), Integer) + 6) % 7
+        return func.date(column, literal("-").concat(cast(weekday, String)).concat(" days"))
+    raise NotImplementedError(f"Rollup rebuild is not supported on {dialect}")
+
+
+async def rebuild_rollups(db: AsyncSession, merchant_id: Optional[int] = None) -> Dict[str, int]:
+    """Recompute rollups from product_trends (all merchants, or one)
+    
+    For backfills and imports that write product_trends directly. Runs as
+    one transaction per call; a full rebuild marks the rollups ready.
+    """
+    dialect = db.get_bind().dialect.name
+    products = select(Product.id)
+    if merchant_id is not None:
+        products = products.where(Product.merchant_id == merchant_id)
+    
+    await db.execute(delete(ProductTrendWeekly).where(ProductTrendWeekly.product_id.in_(products)))
+    await db.execute(delete(ProductTrendMonthly).where(ProductTrendMonthly.product_id.in_(products)))
+    merchant_daily = delete(MerchantTrendDaily)
+    if merchant_id is not None:
+        merchant_daily = merchant_daily.where(MerchantTrendDaily.merchant_id == merchant_id)
+    await db.execute(merchant_daily)
+    
+    sales = (
+        select(
+            ProductTrend.product_id, Product.merchant_id, ProductTrend.date,
+            ProductTrend.quantity_sold, ProductTrend.revenue
+        )
+        .join(Product, Product.id == ProductTrend.product_id)
+    )
+    if merchant_id is not None:
+        sales = sales.where(Product.merchant_id == merchant_id)
+    sales = sales.subquery()
+    
+    counts = {}
+    for model, owner_key, period_key, owner, period in (
+        (ProductTrendWeekly, "product_id", "week_start", sales.c.product_id, _period_start(dialect, sales.c.date, "week")),
+        (ProductTrendMonthly, "product_id", "month_start", sales.c.product_id, _period_start(dialect, sales.c.date, "month")),
+        (MerchantTrendDaily, "merchant_id", "date", sales.c.merchant_id, sales.c.date)
+    ):
+        result = await db.execute(model.__table__.insert().from_select(
+            [owner_key, period_key, "quantity_sold", "revenue"],
+            select(owner, period, func.sum(sales.c.quantity_sold), func.sum(sales.c.revenue))
+            .group_by(owner, period)
+        ))
+        counts[model.__tablename__] = result.rowcount
+    
+    if merchant_id is None:
+        watermark = await db.get(SyncWatermark, WATERMARK)
+        if watermark is None:
+            db.add(SyncWatermark(name=WATERMARK, value=datetime.utcnow()))
+        else:
+            watermark.value = datetime.utcnow()
+    await db.commit()
+    return counts
+
+
+async def run_rollup_backfill():
+    """One-off startup job: load existing product_trends history into the
+    rollups unless a full rebuild has already done so"""
+    try:
+        async with SessionLocal() as db:
+            if await rollups_ready(db):
+                return
+            logger.info("Backfilling sales rollups from product_trends")
+            counts = await rebuild_rollups(db)
+        logger.info(f"Sales rollups backfilled: {counts}")
+    except Exception as e:
+        logger.error(f"Sales rollup backfill failed: {e}")
@@ -1,213 +1,461 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
-from typing import List
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple, Union
 from datetime import datetime, date, timedelta
+from pydantic import ValidationError
+from app.config import settings
 from app.models.product import Product, ProductTrend
-from app.schemas.product import RecordSaleRequest, TrendAnalysisResponse, TrendDataPoint, DemandPrediction
-import statistics
+from app.schemas.product import (
+    RecordSaleRequest, TrendAnalysisResponse, TrendDataPoint, DemandPrediction, BatchTrendError,
+    BulkSaleResult, BulkSaleRowError
+)
+from app.services import forecasting, trend_engine, trend_rollups
+from app.services.risk_refresh import enqueue_risk_refresh
+from app.services.trend_engine import SalesSeries
 
+# Days of history behind a demand prediction
+PREDICTION_DAYS = 60
 
-def record_sale(db: Session, sale: RecordSaleRequest) -> ProductTrend:
+
+class RecordedSale(NamedTuple):
+    trend_id: int
+    date: date
+
+
+def _trend_upsert(dialect: str, values):
+    """INSERT product/day sales rows, adding to rows that already exist
+    
+    Increments happen inside the statement, so concurrent sales of the
+    same product never lose an update. `values` is one row or a list.
+    """
+    return trend_rollups.increment_upsert(
+        dialect, ProductTrend, ["product_id", "date"], values,
+        # LAST_INSERT_ID(id) reports the existing row's id when updating
+        id=func.LAST_INSERT_ID(ProductTrend.id)
+    )
+
+
+async def record_sale(db: AsyncSession, sale: RecordSaleRequest) -> RecordedSale:
     """Record a product sale for trend tracking"""
     sale_date = sale.date or date.today()
+    dialect = db.get_bind().dialect.name
+    
+    # Revenue is priced in the same statement, so no separate reads are needed
+    price = select(Product.price).where(Product.id == sale.product_id).scalar_subquery()
+    stmt = _trend_upsert(dialect, dict(
+        product_id=sale.product_id,
+        date=sale_date,
+        quantity_sold=sale.quantity,
+        revenue=sale.quantity * func.coalesce(price, 0.0),
+        popularity_score=sale.quantity,  # Simple popularity metric
+        created_at=datetime.utcnow()
+    ))
     
-    # Check if trend record exists for this date
-    existing_trend = db.query(ProductTrend).filter(
-        ProductTrend.product_id == sale.product_id,
-        ProductTrend.date == sale_date
-    ).first()
-    
-    if existing_trend:
-        # Update existing record
-        existing_trend.quantity_sold += sale.quantity
-        product = db.query(Product).filter(Product.id == sale.product_id).first()
-        if product:
-            existing_trend.revenue += sale.quantity * product.price
-        db.commit()
-        db.refresh(existing_trend)
-        return existing_trend
+    if dialect == "mysql":
+        trend_id = (await db.execute(stmt)).lastrowid
+    else:
+        trend_id = (await db.execute(stmt.returning(ProductTrend.id))).scalar_one()
+    for rollup in trend_rollups.sale_increments(dialect, sale.product_id, sale_date, sale.quantity):
+        await db.execute(rollup)
+    await enqueue_risk_refresh(db, [sale.product_id])
+    await db.commit()
+    return RecordedSale(trend_id, sale_date)
+
+
+def _validation_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}" if detail["loc"] else detail["msg"]
+        for detail in error.errors()
+    )
+
+
+async def _enumerate_rows(rows: Union[Iterable, AsyncIterable]) -> AsyncIterator[Tuple[int, Any]]:
+    """Number the rows of a list or of an async stream such as a request body"""
+    if isinstance(rows, AsyncIterable):
+        index = 0
+        async for row in rows:
+            yield index, row
+            index += 1
     else:
-        # Create new record
-        product = db.query(Product).filter(Product.id == sale.product_id).first()
-        revenue = sale.quantity * product.price if product else 0.0
+        for index, row in enumerate(rows):
+            yield index, row
+
+
+async def record_sales_bulk(db: AsyncSession, rows: Union[Iterable, AsyncIterable]) -> BulkSaleResult:
+    """Record a batch of sales in one transaction
+    
+    Rows are RecordSaleRequest dicts or raw JSON lines, from a list or an
+    async stream that is read once without being held in memory. Each is
+    validated on its own, then sales are summed per product and day, priced
+    with one query and written with chunked multi-row upserts. The result
+    matches recording the accepted rows one by one.
+    """
+    today = date.today()
+    accepted: List[bool] = []
+    errors: List[BulkSaleRowError] = []
+    row_products: Dict[int, int] = {}
+    
+    # (product_id, date) -> [quantity, first sale's quantity]
+    totals: Dict[Tuple[int, date], List[int]] = {}
+    async for index, row in _enumerate_rows(rows):
+        try:
+            if isinstance(row, (str, bytes)):
+                sale = RecordSaleRequest.model_validate_json(row)
+            else:
+                sale = RecordSaleRequest.model_validate(row)
+        except ValidationError as e:
+            accepted.append(False)
+            errors.append(BulkSaleRowError(index=index, error=_validation_message(e)))
+            continue
         
-        trend = ProductTrend(
-            product_id=sale.product_id,
+        accepted.append(True)
+        row_products[index] = sale.product_id
+        key = (sale.product_id, sale.date or today)
+        if key in totals:
+            totals[key][0] += sale.quantity
+        else:
+            totals[key] = [sale.quantity, sale.quantity]
+    
+    chunk_size = settings.trend_bulk_chunk_size
+    product_ids = sorted({product_id for product_id, _ in totals})
+    prices = {}
+    merchants = {}
+    for start in range(0, len(product_ids), chunk_size):
+        for product_id, price, merchant_id in (await db.execute(
+            select(Product.id, Product.price, Product.merchant_id)
+            .where(Product.id.in_(product_ids[start:start + chunk_size]))
+        )).all():
+            prices[product_id] = price
+            merchants[product_id] = merchant_id
+    
+    for index, product_id in row_products.items():
+        if product_id not in prices:
+            accepted[index] = False
+            errors.append(BulkSaleRowError(index=index, error="Product not found"))
+    errors.sort(key=lambda e: e.index)
+    
+    now = datetime.utcnow()
+    values = [
+        dict(
+            product_id=product_id,
             date=sale_date,
-            quantity_sold=sale.quantity,
-            revenue=revenue,
-            popularity_score=sale.quantity  # Simple popularity metric
+            quantity_sold=quantity,
+            revenue=quantity * (prices[product_id] or 0.0),
+            popularity_score=first_quantity,  # Same as the first single-sale insert
+            created_at=now
         )
-        db.add(trend)
-        db.commit()
-        db.refresh(trend)
-        return trend
+        for (product_id, sale_date), (quantity, first_quantity) in totals.items()
+        if product_id in prices
+    ]
+    
+    dialect = db.get_bind().dialect.name
+    try:
+        for start in range(0, len(values), chunk_size):
+            await db.execute(_trend_upsert(dialect, values[start:start + chunk_size]))
+        for rollup in trend_rollups.bulk_increments(dialect, values, merchants, chunk_size):
+            await db.execute(rollup)
+        await enqueue_risk_refresh(db, {value["product_id"] for value in values})
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    
+    accepted_count = sum(accepted)
+    return BulkSaleResult(
+        accepted=accepted,
+        accepted_count=accepted_count,
+        rejected_count=len(accepted) - accepted_count,
+        trend_rows=len(values),
+        errors=errors
+    )
 
 
-def analyze_product_trend(
-    db: Session,
-    product_id: int,
-    days: int = 30
-) -> TrendAnalysisResponse:
-    """Analyze product trend over specified period"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    if not product:
-        raise ValueError("Product not found")
+class TrendWindow:
+    """A product's date-ordered sales, loaded once for several analyses
     
-    # Get trend data
-    start_date = date.today() - timedelta(days=days)
-    trends = db.query(ProductTrend).filter(
-        ProductTrend.product_id == product_id,
-        ProductTrend.date >= start_date
-    ).order_by(ProductTrend.date).all()
+    Load the widest period a caller needs, then analyze() any shorter
+    period from the same in-memory series without another query.
+    """
     
-    if not trends:
-        return TrendAnalysisResponse(
-            product_id=product_id,
-            product_name=product.name,
-            analysis_period_days=days,
-            average_daily_sales=0.0,
-            peak_dates=[],
-            trend_direction="no_data",
-            seasonality_detected=False,
-            data_points=[]
-        )
+    def __init__(self, product: Product, series: SalesSeries, days: int, today: Optional[date] = None):
+        self.product = product
+        self.series = series
+        self.days = days
+        self.today = today or date.today()
     
-    # Calculate metrics
-    total_sales = sum(t.quantity_sold for t in trends)
-    average_daily_sales = total_sales / len(trends) if trends else 0
+    @classmethod
+    async def load(cls, db: AsyncSession, product: Product, days: int) -> "TrendWindow":
+        """Fetch the last `days` days of sales for a product in one query"""
+        today = date.today()
+        rows = (await db.execute(
+            select(
+                ProductTrend.date, ProductTrend.quantity_sold,
+                ProductTrend.revenue, ProductTrend.popularity_score
+            ).where(
+                ProductTrend.product_id == product.id,
+                ProductTrend.date >= today - timedelta(days=days)
+            ).order_by(ProductTrend.date)
+        )).all()
+        return cls(product, SalesSeries.from_rows(rows), days, today)
     
-    # Find peak dates (top 20% of sales days)
-    sorted_trends = sorted(trends, key=lambda t: t.quantity_sold, reverse=True)
-    peak_count = max(1, len(sorted_trends) // 5)
-    peak_dates = [t.date for t in sorted_trends[:peak_count]]
+    @classmethod
+    async def load_many(cls, db: AsyncSession, products: Sequence[Product], days: int) -> Dict[int, "TrendWindow"]:
+        """Fetch the last `days` days of sales for many products in one query"""
+        if not products:
+            return {}
+        
+        today = date.today()
+        rows = (await db.execute(
+            select(
+                ProductTrend.product_id, ProductTrend.date, ProductTrend.quantity_sold,
+                ProductTrend.revenue, ProductTrend.popularity_score
+            ).where(
+                ProductTrend.product_id.in_([product.id for product in products]),
+                ProductTrend.date >= today - timedelta(days=days)
+            ).order_by(ProductTrend.product_id, ProductTrend.date)
+        )).all()
+        
+        by_product = trend_engine.split_by_product(rows)
+        no_sales = SalesSeries.from_rows([])
+        return {
+            product.id: cls(product, by_product.get(product.id, no_sales), days, today)
+            for product in products
+        }
     
-    # Determine trend direction
-    if len(trends) >= 7:
-        first_week_avg = statistics.mean([t.quantity_sold for t in trends[:7]])
-        last_week_avg = statistics.mean([t.quantity_sold for t in trends[-7:]])
+    def series_for(self, days: int) -> SalesSeries:
+        """Sales within the last `days` days, oldest first"""
+        if days > self.days:
+            raise ValueError(f"Trend window holds {self.days} days, cannot analyze {days}")
+        return self.series.since(self.today - timedelta(days=days))
+    
+    def analyze(self, days: int, include_data_points: bool = True) -> TrendAnalysisResponse:
+        """Trend analysis over the last `days` days
         
-        if last_week_avg > first_week_avg * 1.2:
-            trend_direction = "increasing"
-        elif last_week_avg < first_week_avg * 0.8:
-            trend_direction = "decreasing"
-        else:
-            trend_direction = "stable"
-    else:
-        trend_direction = "insufficient_data"
-    
-    # Check for seasonality (simple weekly pattern detection)
-    seasonality_detected = False
-    if len(trends) >= 14:
-        # Group by day of week
-        day_groups = {}
-        for t in trends:
-            day_of_week = t.date.weekday()
-            if day_of_week not in day_groups:
-                day_groups[day_of_week] = []
-            day_groups[day_of_week].append(t.quantity_sold)
+        Pass include_data_points=False when only the aggregates are needed.
+        """
+        product = self.product
+        series = self.series_for(days)
+        
+        if not len(series):
+            return TrendAnalysisResponse(
+                product_id=product.id,
+                product_name=product.name,
+                analysis_period_days=days,
+                average_daily_sales=0.0,
+                peak_dates=[],
+                trend_direction="no_data",
+                seasonality_detected=False,
+                data_points=[]
+            )
+        
+        quantity = series.quantity
         
-        # Check if there's significant variation between days
-        if len(day_groups) >= 5:
-            day_averages = [statistics.mean(sales) for sales in day_groups.values() if sales]
-            if day_averages:
-                std_dev = statistics.stdev(day_averages) if len(day_averages) > 1 else 0
-                mean_sales = statistics.mean(day_averages)
-                if mean_sales > 0 and std_dev / mean_sales > 0.3:
-                    seasonality_detected = True
-    
-    # Prepare data points
-    data_points = [
-        TrendDataPoint(
-            date=t.date,
-            quantity_sold=t.quantity_sold,
-            revenue=t.revenue,
-            popularity_score=t.popularity_score
+        # Statistics cover every calendar day of the window (today included)
+        start_date = self.today - timedelta(days=days)
+        daily = series.dense(start_date, days + 1)
+        
+        # Prepare data points (recorded days only)
+        data_points = [
+            TrendDataPoint(
+                date=day,
+                quantity_sold=quantity_sold,
+                revenue=revenue,
+                popularity_score=popularity_score
+            )
+            for day, quantity_sold, revenue, popularity_score in zip(
+                series.date_list(), quantity.tolist(),
+                series.revenue.tolist(), series.popularity.tolist()
+            )
+        ] if include_data_points else []
+        
+        return TrendAnalysisResponse(
+            product_id=product.id,
+            product_name=product.name,
+            analysis_period_days=days,
+            average_daily_sales=trend_engine.average_daily_sales(daily),
+            # Top 20% of sales days
+            peak_dates=trend_engine.calendar_dates(start_date, trend_engine.peak_indices(daily)),
+            trend_direction=trend_engine.trend_direction(daily),
+            # Simple weekly pattern detection
+            seasonality_detected=trend_engine.has_weekly_seasonality(daily, start_date),
+            data_points=data_points
         )
-        for t in trends
-    ]
+
+
+async def analyze_product_trend(
+    db: AsyncSession,
+    product_id: int,
+    days: int = 30,
+    include_data_points: bool = True
+) -> TrendAnalysisResponse:
+    """Analyze product trend over specified period"""
+    product = await db.scalar(select(Product).where(
+        Product.id == product_id,
+        Product.deleted_at.is_(None)
+    ))
+    if not product:
+        raise ValueError("Product not found")
     
-    return TrendAnalysisResponse(
-        product_id=product_id,
-        product_name=product.name,
-        analysis_period_days=days,
-        average_daily_sales=average_daily_sales,
-        peak_dates=peak_dates,
-        trend_direction=trend_direction,
-        seasonality_detected=seasonality_detected,
-        data_points=data_points
-    )
+    window = await TrendWindow.load(db, product, days)
+    return window.analyze(days, include_data_points)
 
 
-def predict_demand(
-    db: Session,
+async def predict_demand(
+    db: AsyncSession,
     product_id: int
 ) -> DemandPrediction:
     """Predict future demand based on historical trends"""
     # Get last 60 days of data
-    start_date = date.today() - timedelta(days=60)
-    trends = db.query(ProductTrend).filter(
+    today = date.today()
+    start_date = today - timedelta(days=PREDICTION_DAYS)
+    rows = (await db.execute(select(ProductTrend.date, ProductTrend.quantity_sold).where(
         ProductTrend.product_id == product_id,
         ProductTrend.date >= start_date
-    ).order_by(ProductTrend.date).all()
+    ).order_by(ProductTrend.date))).all()
     
-    if not trends or len(trends) < 7:
-        return DemandPrediction(
-            product_id=product_id,
-            predicted_demand_next_7_days=0.0,
-            predicted_demand_next_30_days=0.0,
-            confidence_level="low",
-            recommendation="Not enough historical data for accurate prediction. Continue tracking sales."
-        )
+    product = await db.scalar(select(Product).where(
+        Product.id == product_id,
+        Product.deleted_at.is_(None)
+    ))
+    current_stock = product.stock if product else 0
     
-    # Simple moving average prediction
-    recent_sales = [t.quantity_sold for t in trends[-14:]]  # Last 2 weeks
-    daily_average = statistics.mean(recent_sales)
+    return _predict([product_id], [SalesSeries.from_rows(rows)], [current_stock], today)[0]
+
+
+def _predict(
+    product_ids: Sequence[int],
+    series_list: Sequence[SalesSeries],
+    stocks: Sequence[int],
+    today: date
+) -> List[DemandPrediction]:
+    """Demand predictions for many products from one forecasting pass"""
+    start_date = today - timedelta(days=PREDICTION_DAYS)
+    history = forecasting.demand_history(series_list, start_date, PREDICTION_DAYS + 1)
+    forecast = forecasting.forecast_demand(
+        history,
+        settings.forecast_models,
+        origins=settings.forecast_backtest_origins,
+        interval_level=settings.forecast_interval_level
+    )
     
-    # Adjust for trend
-    if len(trends) >= 14:
-        older_sales = [t.quantity_sold for t in trends[-28:-14]]
-        older_average = statistics.mean(older_sales)
+    predictions = []
+    for row, (product_id, series, current_stock) in enumerate(zip(product_ids, series_list, stocks)):
+        if len(series) < 7:
+            predictions.append(DemandPrediction(
+                product_id=product_id,
+                predicted_demand_next_7_days=0.0,
+                predicted_demand_next_30_days=0.0,
+                confidence_level="low",
+                recommendation="Not enough historical data for accurate prediction. Continue tracking sales."
+            ))
+            continue
         
-        if daily_average > older_average:
-            growth_rate = (daily_average - older_average) / older_average if older_average > 0 else 0
-            daily_average *= (1 + growth_rate * 0.5)  # Conservative growth projection
-    
-    predicted_7_days = daily_average * 7
-    predicted_30_days = daily_average * 30
-    
-    # Determine confidence
-    if len(trends) >= 30:
-        confidence = "high"
-    elif len(trends) >= 14:
-        confidence = "medium"
-    else:
-        confidence = "low"
+        predicted_7_days = float(forecast.next_7_days[row])
+        predicted_30_days = float(forecast.next_30_days[row])
+        daily_average = predicted_7_days / 7
+        
+        # Determine confidence
+        if len(series) >= 30:
+            confidence = "high"
+        elif len(series) >= 14:
+            confidence = "medium"
+        else:
+            confidence = "low"
+        
+        # Generate recommendation
+        if current_stock < predicted_7_days:
+            recommendation = f"Low stock alert! Current stock ({current_stock}) may not cover next week's demand ({predicted_7_days:.0f}). Consider restocking."
+        elif current_stock > predicted_30_days * 2:
+            recommendation = f"Overstock detected. Current stock ({current_stock}) is more than 2 months of predicted demand. Consider promotions."
+        else:
+            days_covered = current_stock / daily_average if daily_average > 0 else 0
+            recommendation = f"Stock level is adequate. Current stock ({current_stock}) should cover {days_covered:.0f} days at current demand rate."
+        
+        predictions.append(DemandPrediction(
+            product_id=product_id,
+            predicted_demand_next_7_days=predicted_7_days,
+            predicted_demand_next_30_days=predicted_30_days,
+            confidence_level=confidence,
+            recommendation=recommendation,
+            forecast_model=forecast.model[row],
+            interval_level=settings.forecast_interval_level,
+            predicted_demand_next_7_days_lower=float(forecast.lower_7_days[row]),
+            predicted_demand_next_7_days_upper=float(forecast.upper_7_days[row]),
+            predicted_demand_next_30_days_lower=float(forecast.lower_30_days[row]),
+            predicted_demand_next_30_days_upper=float(forecast.upper_30_days[row])
+        ))
+    return predictions
+
+
+async def get_batch_products(
+    db: AsyncSession,
+    product_ids: Optional[List[int]] = None,
+    merchant_id: Optional[int] = None
+) -> Tuple[List[Product], List[int]]:
+    """Resolve a batch request to live products, plus requested IDs not found"""
+    query = select(Product).where(Product.deleted_at.is_(None))
+    if product_ids is not None:
+        query = query.where(Product.id.in_(product_ids))
+    if merchant_id is not None:
+        query = query.where(Product.merchant_id == merchant_id)
+    products = list((await db.scalars(query.order_by(Product.id))).all())
     
-    # Generate recommendation
-    product = db.query(Product).filter(Product.id == product_id).first()
-    current_stock = product.stock if product else 0
+    if product_ids is None:
+        return products, []
     
-    if current_stock < predicted_7_days:
-        recommendation = f"Low stock alert! Current stock ({current_stock}) may not cover next week's demand ({predicted_7_days:.0f}). Consider restocking."
-    elif current_stock > predicted_30_days * 2:
-        recommendation = f"Overstock detected. Current stock ({current_stock}) is more than 2 months of predicted demand. Consider promotions."
-    else:
-        recommendation = f"Stock level is adequate. Current stock ({current_stock}) should cover {(current_stock / daily_average):.0f} days at current demand rate."
-    
-    return DemandPrediction(
-        product_id=product_id,
-        predicted_demand_next_7_days=predicted_7_days,
-        predicted_demand_next_30_days=predicted_30_days,
-        confidence_level=confidence,
-        recommendation=recommendation
+    # Keep the caller's order (and report unknown IDs in place)
+    by_id = {product.id: product for product in products}
+    ordered = [by_id[product_id] for product_id in dict.fromkeys(product_ids) if product_id in by_id]
+    missing = [product_id for product_id in dict.fromkeys(product_ids) if product_id not in by_id]
+    return ordered, missing
+
+
+def _batch_results(results: Iterable, missing: List[int]) -> Iterator:
+    yield from results
+    for product_id in missing:
+        yield BatchTrendError(product_id=product_id, error="Product not found")
+
+
+async def analyze_trends_batch(
+    db: AsyncSession,
+    products: Sequence[Product],
+    missing: List[int],
+    days: int = 30,
+    include_data_points: bool = True
+) -> Iterator[Union[TrendAnalysisResponse, BatchTrendError]]:
+    """Trend analysis for many products from a single sales query
+    
+    Sales are loaded up front; the returned iterator computes each
+    product's analysis lazily so results can be streamed as they are ready.
+    """
+    windows = await TrendWindow.load_many(db, products, days)
+    return _batch_results((window.analyze(days, include_data_points) for window in windows.values()), missing)
+
+
+async def predict_demand_batch(
+    db: AsyncSession,
+    products: Sequence[Product],
+    missing: List[int]
+) -> Iterator[Union[DemandPrediction, BatchTrendError]]:
+    """Demand predictions for many products from a single sales query,
+    forecast together in one vectorized pass"""
+    windows = list((await TrendWindow.load_many(db, products, PREDICTION_DAYS)).values())
+    predictions = _predict(
+        [window.product.id for window in windows],
+        [window.series_for(PREDICTION_DAYS) for window in windows],
+        [window.product.stock for window in windows],
+        windows[0].today if windows else date.today()
     )
+    return _batch_results(predictions, missing)
 
 
-def recommend_order_quantity(db: Session, product_id: int) -> dict:
+async def recommend_order_quantity(db: AsyncSession, product_id: int) -> dict:
     """Recommend purchase quantity based on trends"""
-    prediction = predict_demand(db, product_id)
-    product = db.query(Product).filter(Product.id == product_id).first()
+    prediction = await predict_demand(db, product_id)
+    product = await db.scalar(select(Product).where(
+        Product.id == product_id,
+        Product.deleted_at.is_(None)
+    ))
     
     if not product:
         return {"error": "Product not found"}
@@ -215,9 +463,13 @@ def recommend_order_quantity(db: Session, product_id: int) -> dict:
     current_stock = product.stock
     weekly_demand = prediction.predicted_demand_next_7_days
     
+    # Safety stock: the weekly interval's upper margin, scaled to the 2-week cover
+    weekly_upper = prediction.predicted_demand_next_7_days_upper
+    safety_stock = (weekly_upper - weekly_demand) * 2 ** 0.5 if weekly_upper is not None else 0.0
+    
     # Calculate recommended order quantity
-    # Target: 2 weeks of stock
-    target_stock = weekly_demand * 2
+    # Target: 2 weeks of stock plus safety stock
+    target_stock = weekly_demand * 2 + safety_stock
     recommended_order = max(0, target_stock - current_stock)
     
     return {
@@ -225,7 +477,8 @@ def recommend_order_quantity(db: Session, product_id: int) -> dict:
         "product_name": product.name,
         "current_stock": current_stock,
         "weekly_demand": weekly_demand,
+        "safety_stock": safety_stock,
         "target_stock": target_stock,
         "recommended_order_quantity": recommended_order,
-        "reasoning": f"To maintain 2 weeks of inventory based on predicted demand of {weekly_demand:.0f} units per week"
+        "reasoning": f"To maintain 2 weeks of inventory based on predicted demand of {weekly_demand:.0f} units per week, plus {safety_stock:.0f} units of safety stock"
     }
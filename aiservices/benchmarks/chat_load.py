@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+"""
+Concurrent chat load benchmark
+
+Fires concurrent /chatbot/message requests at the app in-process and
+reports throughput and latency. LLM calls are replaced by a fixed-latency
+stub and every SQL statement gets an injected round-trip latency, either
+awaited (async driver) or blocking (what a synchronous driver does to the
+event loop), so the two modes compare like-for-like:
+
+    python -m benchmarks.chat_load --db-mode async
+    python -m benchmarks.chat_load --db-mode blocking
+
+Run from the aiservices directory. Uses a throwaway SQLite database unless
+DATABASE_URL points elsewhere.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'chat_load.sqlite3')}"
+)
+
+import httpx
+from sqlalchemy import event
+from sqlalchemy.util import await_only
+
+from app.database import SessionLocal, engine, init_db
+from app.main import app
+from app.models.product import Product
+from app.services import llm_client
+from app.services.llm_cache import llm_cache
+
+MESSAGES = [
+    "berapa stok roti tawar?",
+    "produk apa yang paling mahal?",
+    "apakah kopi susu masih ada?",
+    "berapa harga teh manis?",
+]
+
+
+def _install_llm_stub(latency: float):
+    """Replace the OpenAI client call with a fixed-latency answer"""
+    class _Message:
+        content = '{"intent": "query", "confidence": 0.9, "arguments": {}}'
+    
+    class _Choice:
+        message = _Message()
+    
+    class _Response:
+        choices = [_Choice()]
+    
+    async def create(**kwargs):
+        await asyncio.sleep(latency)
+        return _Response()
+    
+    llm_client.client.chat.completions.create = create
+    # Every request must reach the stub, not the response cache
+    llm_cache.enabled = False
+
+
+def _install_db_latency(mode: str, latency: float):
+    """Add a network round trip to every statement on the engine"""
+    @event.listens_for(engine.sync_engine, "before_cursor_execute")
+    def _round_trip(conn, cursor, statement, parameters, context, executemany):
+        if mode == "blocking":
+            time.sleep(latency)
+        else:
+            await_only(asyncio.sleep(latency))
+
+
+async def _seed(merchant_id: int, products: int):
+    await init_db()
+    async with SessionLocal() as db:
+        for i in range(products):
+            db.add(Product(
+                merchant_id=merchant_id,
+                name=f"Produk {i}",
+                price=1000 + i,
+                stock=10 + i
+            ))
+        await db.commit()
+
+
+async def run(args):
+    _install_llm_stub(args.llm_latency_ms / 1000)
+    await _seed(args.merchant_id, args.products)
+    _install_db_latency(args.db_mode, args.db_latency_ms / 1000)
+    
+    latencies = []
+    semaphore = asyncio.Semaphore(args.concurrency)
+    
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://benchmark"
+    ) as client:
+        async def one(i: int):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.post("/chatbot/message", json={
+                    "merchant_id": str(args.merchant_id),
+                    "message": f"{MESSAGES[i % len(MESSAGES)]} #{i}"
+                })
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - started)
+    
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.requests)))
+        elapsed = time.perf_counter() - started
+    
+    await engine.dispose()
+    
+    latencies.sort()
+    print(f"db mode:      {args.db_mode} ({args.db_latency_ms} ms/statement)")
+    print(f"llm latency:  {args.llm_latency_ms} ms")
+    print(f"requests:     {args.requests} at concurrency {args.concurrency}")
+    print(f"throughput:   {args.requests / elapsed:.1f} req/s")
+    print(f"latency p50:  {statistics.median(latencies) * 1000:.0f} ms")
+    print(f"latency p95:  {latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--db-mode", choices=["async", "blocking"], default="async")
+    parser.add_argument("--db-latency-ms", type=float, default=5.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--products", type=int, default=50)
+    parser.add_argument("--merchant-id", type=int, default=1)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
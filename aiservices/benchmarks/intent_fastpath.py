@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+Intent fast path evaluation
+
+Trains the intent model without a stratified holdout of SEED_EXAMPLES and
+reports, per confidence threshold, how many holdout messages the fast path
+answers without the LLM and how many of those it gets right. With --save
+it then retrains on every seed example and writes the shipped model:
+
+    python -m benchmarks.intent_fastpath --save
+
+Run from the aiservices directory.
+"""
+import argparse
+import json
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from app.services.intent_classifier import (
+    MODEL_PATH, SEED_EXAMPLES, IntentModel, evaluate, holdout_split
+)
+
+THRESHOLDS = [0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95]
+
+
+def run(args):
+    train, holdout = holdout_split(SEED_EXAMPLES)
+    print("holdout evaluation (model trained without holdout examples):")
+    print(f"{'threshold':>10}{'bypass':>10}{'accuracy':>10}")
+    for row in evaluate(holdout, IntentModel.train_calibrated(train), THRESHOLDS):
+        accuracy = "n/a" if row["accuracy"] is None else f"{row['accuracy']:.2%}"
+        print(f"{row['threshold']:>10.2f}{row['bypass_rate']:>10.2%}{accuracy:>10}")
+    
+    if args.save:
+        model = IntentModel.train_calibrated(SEED_EXAMPLES)
+        with open(MODEL_PATH, "w", encoding="utf-8") as f:
+            json.dump(model.to_dict(), f, ensure_ascii=False, separators=(",", ":"))
+        print(f"saved model with {len(model.vocabulary)} features to {MODEL_PATH}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--save", action="store_true", help="retrain on every seed example and save the model")
+    run(parser.parse_args())
+
+
+if __name__ == "__main__":
+    main()
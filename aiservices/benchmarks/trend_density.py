@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+"""
+Sparse vs dense history benchmark
+
+Seeds two merchants with the same catalog size: one whose products sell
+on a few days a month (sparse product_trends) and one whose products sell
+every day (dense). Times the merchant-wide trend, prediction and risk
+passes for both, which all run on zero-filled calendar arrays, so sparse
+histories should never cost more than dense ones:
+
+    python -m benchmarks.trend_density --products 500 --repeat 5 --check
+
+Run from the aiservices directory. Uses a throwaway SQLite database unless
+DATABASE_URL points elsewhere.
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+os.environ.setdefault(
+    "DATABASE_URL",
+    f"sqlite+aiosqlite:///{os.path.join(tempfile.mkdtemp(), 'trend_density.sqlite3')}"
+)
+
+from sqlalchemy import insert
+
+from app.database import SessionLocal, engine, init_db
+from app.models.product import Product, ProductTrend
+from app.services import risk_services, trend_rollups, trend_service
+
+SPARSE_MERCHANT = 1
+DENSE_MERCHANT = 2
+
+
+async def _seed(products: int, sparse_fill: float, days: int = 90):
+    await init_db()
+    rng = random.Random(0)
+    today = date.today()
+    async with SessionLocal() as db:
+        for merchant_id, fill in ((SPARSE_MERCHANT, sparse_fill), (DENSE_MERCHANT, 1.0)):
+            catalog = [
+                Product(merchant_id=merchant_id, name=f"Produk {i}", price=1000 + i, stock=rng.randint(0, 200))
+                for i in range(products)
+            ]
+            db.add_all(catalog)
+            await db.flush()
+            rows = [
+                {
+                    "product_id": product.id,
+                    "date": today - timedelta(days=offset),
+                    "quantity_sold": rng.randint(1, 20),
+                    "revenue": 0.0,
+                    "popularity_score": 0.0
+                }
+                for product in catalog
+                for offset in range(days)
+                if rng.random() < fill
+            ]
+            await db.execute(insert(ProductTrend), rows)
+        await db.commit()
+        await trend_rollups.rebuild_rollups(db)
+
+
+async def _time(repeat: int, call) -> float:
+    """Median wall time of `repeat` runs in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        async with SessionLocal() as db:
+            started = time.perf_counter()
+            await call(db)
+            timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+async def run(args):
+    await _seed(args.products, args.sparse_fill)
+    
+    def analysis(merchant_id):
+        async def call(db):
+            products, missing = await trend_service.get_batch_products(db, merchant_id=merchant_id)
+            list(await trend_service.analyze_trends_batch(db, products, missing, days=30, include_data_points=False))
+        return call
+    
+    def prediction(merchant_id):
+        async def call(db):
+            products, missing = await trend_service.get_batch_products(db, merchant_id=merchant_id)
+            list(await trend_service.predict_demand_batch(db, products, missing))
+        return call
+    
+    def risk(merchant_id):
+        async def call(db):
+            await risk_services.assess_merchant_risks(db, merchant_id)
+        return call
+    
+    print(f"products per merchant: {args.products}, sparse fill: {args.sparse_fill:.0%} of days")
+    print(f"{'pass':<12}{'sparse ms':>12}{'dense ms':>12}")
+    regressions = []
+    for name, factory in (("analysis", analysis), ("prediction", prediction), ("risk", risk)):
+        sparse = await _time(args.repeat, factory(SPARSE_MERCHANT))
+        dense = await _time(args.repeat, factory(DENSE_MERCHANT))
+        print(f"{name:<12}{sparse:>12.1f}{dense:>12.1f}")
+        if sparse > dense * 1.2:
+            regressions.append(name)
+    
+    await engine.dispose()
+    if args.check and regressions:
+        raise SystemExit(f"sparse histories slower than dense: {', '.join(regressions)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=500)
+    parser.add_argument("--sparse-fill", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", action="store_true", help="exit non-zero if sparse is >20%% slower")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
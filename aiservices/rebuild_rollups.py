@@ -0,0 +1,20 @@
+#!/usr/bin/env python
+"""Rebuild the weekly, monthly and merchant-day sales rollups from product_trends"""
+import argparse
+import asyncio
+from app.database import SessionLocal, engine
+from app.services.trend_rollups import rebuild_rollups
+
+
+async def main(merchant_id):
+    async with SessionLocal() as db:
+        counts = await rebuild_rollups(db, merchant_id)
+    await engine.dispose()
+    for table, rows in counts.items():
+        print(f"{table}: {rows} rows")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--merchant-id", type=int, help="only rebuild this merchant's rollups")
+    asyncio.run(main(parser.parse_args().merchant_id))
@@ -6,14 +6,14 @@ import (
 
 type Transaction struct {
 	ID            uint      `gorm:"primaryKey" json:"id"`
-	MerchantID    uint      `gorm:"not null;index" json:"merchant_id"`
+	MerchantID    uint      `gorm:"not null;index:idx_transactions_merchant_created,priority:1" json:"merchant_id"`
 	TotalAmount   float64   `gorm:"not null" json:"total_amount"`
 	PaymentMethod string    `gorm:"type:varchar(50)" json:"payment_method"` // cash, card, ewallet
 	CustomerName  string    `gorm:"type:varchar(255)" json:"customer_name"`
 	Notes         string    `gorm:"type:text" json:"notes"`
 	Status        string    `gorm:"type:varchar(20);default:'completed'" json:"status"` // completed, cancelled
-	CreatedAt     time.Time `json:"created_at"`
-	UpdatedAt     time.Time `json:"updated_at"`
+	CreatedAt     time.Time `gorm:"index:idx_transactions_merchant_created,priority:2" json:"created_at"`
+	UpdatedAt     time.Time `gorm:"index" json:"updated_at"` // AI services rollup watermark
 
 	// Relations
 	Items []TransactionItem `gorm:"foreignKey:TransactionID" json:"items,omitempty"`
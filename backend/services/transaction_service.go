@@ -118,10 +118,15 @@ func (s *TransactionService) GetTodaySales(merchantID uint) (map[string]interfac
 	var totalAmount float64
 	var count int64
 
-	today := time.Now().Format("2006-01-02")
+	now := time.Now()
+	today := now.Format("2006-01-02")
+
+	// Half-open range on created_at so idx_transactions_merchant_created is used
+	dayStart := time.Date(now.Year(), now.Month(), now.Day(), 0, 0, 0, 0, now.Location())
+	dayEnd := dayStart.AddDate(0, 0, 1)
 
 	err := s.DB.Model(&models.Transaction{}).
-		Where("merchant_id = ? AND DATE(created_at) = ? AND status = 'completed'", merchantID, today).
+		Where("merchant_id = ? AND created_at >= ? AND created_at < ? AND status = 'completed'", merchantID, dayStart, dayEnd).
 		Select("COALESCE(SUM(total_amount), 0)").
 		Scan(&totalAmount).Error
 
@@ -130,7 +135,7 @@ func (s *TransactionService) GetTodaySales(merchantID uint) (map[string]interfac
 	}
 
 	s.DB.Model(&models.Transaction{}).
-		Where("merchant_id = ? AND DATE(created_at) = ? AND status = 'completed'", merchantID, today).
+		Where("merchant_id = ? AND created_at >= ? AND created_at < ? AND status = 'completed'", merchantID, dayStart, dayEnd).
 		Count(&count)
 
 	return map[string]interface{}{
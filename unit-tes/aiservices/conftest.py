@@ -1,9 +1,9 @@
 """Pytest configuration and fixtures for AI services tests"""
 import pytest
+import pytest_asyncio
 import sys
 from pathlib import Path
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from unittest.mock import AsyncMock, MagicMock
 
 # Add aiservices to path
@@ -17,7 +17,7 @@ from app.models.product import Product, ChatHistory, AutomationHistory
 @pytest.fixture(autouse=True)
 def mock_llm_global(monkeypatch):
     """Global mock for LLM to prevent real API calls"""
-    async def fake_generate_text(prompt, system_prompt=None):
+    async def fake_generate_text(prompt, system_prompt=None, **kwargs):
         # Default response for any LLM call
         if "intent" in prompt.lower() or "classify" in prompt.lower():
             return '{"intent": "query", "confidence": 0.8}'
@@ -32,24 +32,32 @@ def mock_llm_global(monkeypatch):
         else:
             return "Berikut adalah informasi yang Anda minta."
     
-    from app.services import llm_client
-    monkeypatch.setattr(llm_client, "generate_text", fake_generate_text)
+    # Services import generate_text by name, so patch each module's binding
+    from app.routers import ai_generate
+    from app.services import (
+        automation_service, chatbot_service, education_service, llm_client,
+        transaction_automation, transaction_summary_service
+    )
+    for module in (
+        llm_client, ai_generate, automation_service, chatbot_service,
+        education_service, transaction_automation, transaction_summary_service
+    ):
+        monkeypatch.setattr(module, "generate_text", fake_generate_text)
     return fake_generate_text
 
 
-@pytest.fixture(scope="function")
-def test_db():
+@pytest_asyncio.fixture(scope="function")
+async def test_db():
     """Create an in-memory SQLite database for testing"""
-    engine = create_engine("sqlite:///:memory:")
-    Base.metadata.create_all(engine)
-    
-    TestSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    db = TestSessionLocal()
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     
-    yield db
+    TestSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+    async with TestSessionLocal() as db:
+        yield db
     
-    db.close()
-    Base.metadata.drop_all(engine)
+    await engine.dispose()
 
 
 @pytest.fixture
@@ -58,8 +66,8 @@ def test_merchant_id():
     return "1"
 
 
-@pytest.fixture
-def sample_product(test_db, test_merchant_id):
+@pytest_asyncio.fixture
+async def sample_product(test_db, test_merchant_id):
     """Create a sample product for testing"""
     product = Product(
         merchant_id=int(test_merchant_id),
@@ -71,13 +79,13 @@ def sample_product(test_db, test_merchant_id):
         ingredients="tepung, ragi, gula"
     )
     test_db.add(product)
-    test_db.commit()
-    test_db.refresh(product)
+    await test_db.commit()
+    await test_db.refresh(product)
     return product
 
 
-@pytest.fixture
-def multiple_products(test_db, test_merchant_id):
+@pytest_asyncio.fixture
+async def multiple_products(test_db, test_merchant_id):
     """Create multiple products for testing"""
     products = [
         Product(
@@ -104,12 +112,12 @@ def multiple_products(test_db, test_merchant_id):
     ]
     for product in products:
         test_db.add(product)
-    test_db.commit()
+    await test_db.commit()
     return products
 
 
 # Helper functions for test data
-def create_test_product(db, merchant_id, **kwargs):
+async def create_test_product(db, merchant_id, **kwargs):
     """Helper to create a test product with default values"""
     defaults = {
         "merchant_id": int(merchant_id) if isinstance(merchant_id, str) else merchant_id,
@@ -122,6 +130,6 @@ def create_test_product(db, merchant_id, **kwargs):
     defaults.update(kwargs)
     product = Product(**defaults)
     db.add(product)
-    db.commit()
-    db.refresh(product)
+    await db.commit()
+    await db.refresh(product)
     return product
@@ -1,5 +1,7 @@
 """Unit tests for automation service"""
 import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import select, update
 from app.services import automation_service
 from app.models.product import Product
 
@@ -72,7 +74,8 @@ async def test_execute_automation_empty_stock(test_db, multiple_products, test_m
     assert result["affected_count"] >= 1
     
     # Verify stock is actually set to 0
-    product = test_db.query(Product).filter(Product.name == "Roti Tawar").first()
+    product = await test_db.scalar(select(Product).where(Product.name == "Roti Tawar"))
+    await test_db.refresh(product)
     assert product.stock == 0
 
 
@@ -82,7 +85,7 @@ async def test_execute_automation_requires_confirmation(test_db, multiple_produc
     # Create many products to trigger confirmation requirement
     for i in range(10):
         from conftest import create_test_product
-        create_test_product(test_db, test_merchant_id, name=f"Product {i}", ingredients="tepung")
+        await create_test_product(test_db, test_merchant_id, name=f"Product {i}", ingredients="tepung")
     
     command = "Kosongkan semua produk yang mengandung tepung"
     
@@ -94,6 +97,38 @@ async def test_execute_automation_requires_confirmation(test_db, multiple_produc
     assert result["requires_confirmation"] == True
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [1, 2, 4, 9, 1000])
+async def test_bulk_statements_cover_every_chunk(test_db, multiple_products, test_merchant_id, mock_llm_global, monkeypatch, chunk_size):
+    """Test that chunked bulk updates and their undo touch exactly the affected products"""
+    from conftest import create_test_product
+    
+    monkeypatch.setattr(automation_service.settings, "automation_bulk_chunk_size", chunk_size)
+    for i in range(7):
+        await create_test_product(test_db, test_merchant_id, name=f"Kue {i}", ingredients="tepung", stock=10 + i)
+    other_merchant = await create_test_product(test_db, int(test_merchant_id) + 1, name="Kue Lain", ingredients="tepung")
+    products = (await test_db.scalars(select(Product).where(Product.ingredients.contains("tepung")))).all()
+    stock_before = {p.id: p.stock for p in products}
+    
+    result = await automation_service.execute_automation(
+        test_db, test_merchant_id, "Kosongkan semua produk yang mengandung tepung", confirmed=True
+    )
+    
+    assert result["affected_count"] == 9
+    test_db.expire_all()
+    stocks = {p.id: p.stock for p in (await test_db.scalars(select(Product))).all()}
+    assert all(stocks[product_id] == 0 for product_id in result["affected_product_ids"])
+    assert stocks[other_merchant.id] == stock_before[other_merchant.id]
+    
+    undo = await automation_service.undo_last_operation(test_db, test_merchant_id)
+    
+    assert undo["restored_count"] == 9
+    test_db.expire_all()
+    assert {p.id: p.stock for p in (await test_db.scalars(select(Product).where(
+        Product.ingredients.contains("tepung")
+    ))).all()} == stock_before
+
+
 @pytest.mark.asyncio
 async def test_undo_last_operation(test_db, sample_product, test_merchant_id):
     """Test undo functionality"""
@@ -114,11 +149,11 @@ async def test_undo_last_operation(test_db, sample_product, test_merchant_id):
         }
     )
     test_db.add(history)
-    test_db.commit()
+    await test_db.commit()
     
     # Change the stock
     sample_product.stock = 0
-    test_db.commit()
+    await test_db.commit()
     
     # Undo
     result = await automation_service.undo_last_operation(test_db, test_merchant_id)
@@ -127,10 +162,46 @@ async def test_undo_last_operation(test_db, sample_product, test_merchant_id):
     assert result["restored_count"] >= 1
     
     # Verify stock is restored
-    test_db.refresh(sample_product)
+    await test_db.refresh(sample_product)
     assert sample_product.stock == 50
 
 
+@pytest.mark.asyncio
+async def test_undo_chain_counts_each_product_once(test_db, multiple_products, test_merchant_id):
+    """Test that a product touched by several undone steps is counted once"""
+    from app.models.product import AutomationHistory
+    
+    first, second = multiple_products[:2]
+    snapshot = {str(p.id): {"stock": p.stock, "name": p.name, "price": p.price} for p in (first, second)}
+    test_db.add(AutomationHistory(
+        merchant_id=int(test_merchant_id),
+        operation_type="empty_stock",
+        command="Kosongkan stok",
+        affected_product_ids=[first.id, second.id],
+        previous_state=snapshot,
+        executed_at=datetime.utcnow() - timedelta(minutes=1)
+    ))
+    test_db.add(AutomationHistory(
+        merchant_id=int(test_merchant_id),
+        operation_type="delete",
+        command="Hapus produk",
+        affected_product_ids=[first.id],
+        previous_state={str(first.id): snapshot[str(first.id)]},
+        executed_at=datetime.utcnow()
+    ))
+    first.stock = second.stock = 0
+    first.deleted_at = datetime.utcnow()
+    await test_db.commit()
+    
+    result = await automation_service.undo_last_operation(test_db, test_merchant_id, steps=2)
+    
+    assert result["success"] == True
+    assert result["restored_count"] == 2
+    await test_db.refresh(first)
+    assert first.deleted_at is None
+    assert first.stock == int(snapshot[str(first.id)]["stock"])
+
+
 @pytest.mark.asyncio
 async def test_get_automation_history(test_db, test_merchant_id):
     """Test retrieving automation history"""
@@ -146,10 +217,134 @@ async def test_get_automation_history(test_db, test_merchant_id):
             previous_state={}
         ) 
         test_db.add(history)
-    test_db.commit()
+    await test_db.commit()
     
-    history_list = automation_service.get_automation_history(test_db, test_merchant_id, limit=10)
+    history_list = await automation_service.get_automation_history(test_db, test_merchant_id, limit=10)
     
     assert len(history_list) == 3
     assert all("operation_type" in h for h in history_list)
     assert all("command" in h for h in history_list)
+
+
+@pytest.mark.asyncio
+async def test_execute_automation_with_plan_token(test_db, multiple_products, test_merchant_id, mock_llm_global):
+    """Test that a signed preview plan executes without re-parsing"""
+    command = "Kosongkan semua produk yang mengandung tepung"
+    preview = await automation_service.preview_automation(test_db, test_merchant_id, command)
+    
+    plan = automation_service._load_plan(preview["plan_token"], test_merchant_id, command)
+    assert sorted(product_id for product_id, _ in plan["products"]) == sorted(
+        p.id for p in preview["affected_products"]
+    )
+    
+    result = await automation_service.execute_automation(
+        test_db, test_merchant_id, command, confirmed=True, plan_token=preview["plan_token"]
+    )
+    
+    assert result["success"] == True
+    assert sorted(result["affected_product_ids"]) == sorted(p.id for p in preview["affected_products"])
+
+
+@pytest.mark.asyncio
+async def test_plan_token_rejects_tampering_expiry_and_other_merchants(test_db, multiple_products, test_merchant_id, mock_llm_global, monkeypatch):
+    """Test that invalid plan tokens are rejected"""
+    command = "Kosongkan semua produk yang mengandung tepung"
+    preview = await automation_service.preview_automation(test_db, test_merchant_id, command)
+    token = preview["plan_token"]
+    
+    body, signature = token.split(".")
+    tampered = automation_service._sign_plan({
+        **automation_service._load_plan(token, test_merchant_id, command), "new_stock": 99
+    }).split(".")[0] + "." + signature
+    with pytest.raises(automation_service.PlanSignatureError):
+        automation_service._load_plan(tampered, test_merchant_id, command)
+    with pytest.raises(automation_service.PlanTokenError):
+        automation_service._load_plan("not-a-token", test_merchant_id, command)
+    with pytest.raises(automation_service.PlanTokenError):
+        automation_service._load_plan(token, "999", command)
+    
+    # Bound to the previewed command, whitespace aside
+    automation_service._load_plan(token, test_merchant_id, f"  {command}\n")
+    with pytest.raises(automation_service.PlanTokenError, match="another command"):
+        automation_service._load_plan(token, test_merchant_id, "Hapus semua produk yang mengandung tepung")
+    result = await automation_service.execute_automation(
+        test_db, test_merchant_id, "Hapus semua produk", confirmed=True, plan_token=token
+    )
+    assert result["success"] == False
+    
+    monkeypatch.setattr(automation_service.settings, "automation_plan_ttl_seconds", -1)
+    expired = await automation_service.preview_automation(test_db, test_merchant_id, command)
+    result = await automation_service.execute_automation(
+        test_db, test_merchant_id, command, confirmed=True, plan_token=expired["plan_token"]
+    )
+    
+    assert result["success"] == False
+    assert "kedaluwarsa" in result["error"]
+
+
+@pytest.mark.asyncio
+async def test_plan_token_detects_drift(test_db, multiple_products, test_merchant_id, mock_llm_global):
+    """Test that products changed after the preview abort the execution"""
+    command = "Kosongkan semua produk yang mengandung tepung"
+    preview = await automation_service.preview_automation(test_db, test_merchant_id, command)
+    
+    product = preview["affected_products"][0]
+    product.price += 1000
+    product.updated_at = product.updated_at + timedelta(seconds=5)
+    await test_db.commit()
+    
+    result = await automation_service.execute_automation(
+        test_db, test_merchant_id, command, confirmed=True, plan_token=preview["plan_token"]
+    )
+    
+    assert result["success"] == False
+    assert "berubah" in result["error"]
+
+
+@pytest.mark.asyncio
+async def test_plan_token_detects_changes_within_the_same_second(test_db, multiple_products, test_merchant_id, mock_llm_global):
+    """Test that stock and price changes count as drift even when updated_at
+    is unchanged, as after two writes in one MySQL DATETIME second"""
+    command = "Kosongkan semua produk yang mengandung tepung"
+    
+    for change in ({"stock": 1}, {"price": 1.0}):
+        preview = await automation_service.preview_automation(test_db, test_merchant_id, command)
+        product = preview["affected_products"][0]
+        await test_db.execute(
+            update(Product).where(Product.id == product.id)
+            .values(updated_at=product.updated_at, **change)
+        )
+        await test_db.commit()
+        test_db.expire_all()
+        
+        result = await automation_service.execute_automation(
+            test_db, test_merchant_id, command, confirmed=True, plan_token=preview["plan_token"]
+        )
+        assert result["success"] == False
+        assert "berubah" in result["error"]
+
+
+@pytest.mark.asyncio
+async def test_plan_token_from_another_worker_is_previewed_again(test_db, multiple_products, test_merchant_id, mock_llm_global, monkeypatch):
+    """Test that a token signed with another key executes only when nothing changed"""
+    command = "Kosongkan semua produk yang mengandung tepung"
+    monkeypatch.setattr(automation_service, "_PROCESS_PLAN_SECRET", b"worker-1")
+    preview = await automation_service.preview_automation(test_db, test_merchant_id, command)
+    stale = await automation_service.preview_automation(test_db, test_merchant_id, command)
+    
+    # Another worker, or the same one after a restart
+    monkeypatch.setattr(automation_service, "_PROCESS_PLAN_SECRET", b"worker-2")
+    result = await automation_service.execute_automation(
+        test_db, test_merchant_id, command, confirmed=True, plan_token=preview["plan_token"]
+    )
+    assert result["success"] == True
+    assert sorted(result["affected_product_ids"]) == sorted(p.id for p in preview["affected_products"])
+    
+    # The execution changed the products the older token was made for; a
+    # new request would load them in a fresh session
+    test_db.expire_all()
+    result = await automation_service.execute_automation(
+        test_db, test_merchant_id, command, confirmed=True, plan_token=stale["plan_token"]
+    )
+    assert result["success"] == False
+    assert "berubah" in result["error"]
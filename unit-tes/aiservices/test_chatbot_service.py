@@ -1,5 +1,6 @@
 """Unit tests for chatbot service"""
 import pytest
+from sqlalchemy import select
 from app.services import chatbot_service
 from app.schemas.product import ChatMessage
 from app.models.product import Product
@@ -11,11 +12,10 @@ async def test_classify_intent_add_product(mock_llm_global, monkeypatch):
     message = "Tambahkan produk Roti Tawar harga 15000"
     
     # Override mock to return add_product intent
-    async def mock_add(prompt, system_prompt=None):
+    async def mock_add(prompt, system_prompt=None, **kwargs):
         return '{"intent": "add_product", "confidence": 0.95}'
     
-    import app.services.llm_client as llm
-    monkeypatch.setattr(llm, "generate_text", mock_add)
+    monkeypatch.setattr(chatbot_service, "generate_text", mock_add)
     
     result = await chatbot_service.classify_intent(message)
     
@@ -28,17 +28,64 @@ async def test_classify_intent_automation(mock_llm_global, monkeypatch):
     """Test intent classification for automation"""
     message = "Kosongkan semua produk yang mengandung tepung"
     
-    async def mock_automation(prompt, system_prompt=None):
+    async def mock_automation(prompt, system_prompt=None, **kwargs):
         return '{"intent": "automation", "confidence": 0.95}'
     
-    import app.services.llm_client as llm
-    monkeypatch.setattr(llm, "generate_text", mock_automation)
+    monkeypatch.setattr(chatbot_service, "generate_text", mock_automation)
     
     result = await chatbot_service.classify_intent(message)
     
     assert result["intent"] == "automation"
 
 
+def llm_returning(monkeypatch, response):
+    """Send classify_intent to a fake LLM answering with response"""
+    async def fake_generate_text(prompt, system_prompt=None, **kwargs):
+        return response
+    monkeypatch.setattr(chatbot_service, "generate_text", fake_generate_text)
+    monkeypatch.setattr(chatbot_service.intent_classifier, "classify", lambda message: (None, None))
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("response", [
+    "bukan JSON",
+    '{"intent": "order_pizza", "confidence": 0.9}',
+    '{"intent": "add_product", "confidence": 1.5}',
+    '{"intent": "add_product"}',
+    '{"intent": "delete_product", "confidence": 0.9, "arguments": ["Roti Tawar"]}',
+])
+async def test_classify_intent_falls_back_on_schema_rejected_json(monkeypatch, response):
+    """Test that LLM output failing the command schema falls back to a query"""
+    llm_returning(monkeypatch, response)
+    
+    result = await chatbot_service.classify_intent("Tolong urus produk saya")
+    
+    assert result == {"intent": "query", "confidence": 0.5}
+
+
+@pytest.mark.asyncio
+async def test_classify_intent_drops_invalid_arguments(monkeypatch):
+    """Test that arguments failing their intent's schema are discarded"""
+    llm_returning(monkeypatch, '{"intent": "add_product", "confidence": 0.9, "arguments": {"name": "Kopi", "price": "murah"}}')
+    
+    result = await chatbot_service.classify_intent("Tambah kopi yang murah")
+    
+    assert result == {"intent": "add_product", "confidence": 0.9, "arguments": None}
+
+
+@pytest.mark.asyncio
+async def test_classify_intent_returns_valid_arguments(monkeypatch):
+    """Test that valid arguments come back typed, and only for write intents"""
+    llm_returning(monkeypatch, '```json\n{"intent": "edit_product", "confidence": 0.9, "arguments": {"search_query": "Roti Tawar", "updates": {"price": 12000}}}\n```')
+    
+    result = await chatbot_service.classify_intent("Ubah harga Roti Tawar jadi 12000")
+    assert result["arguments"] == {"search_query": "Roti Tawar", "updates": {"price": 12000}}
+    
+    llm_returning(monkeypatch, '{"intent": "risk_report", "confidence": 0.9, "arguments": {"search_query": "x"}}')
+    result = await chatbot_service.classify_intent("Produk apa yang berisiko?")
+    assert result == {"intent": "risk_report", "confidence": 0.9, "arguments": None}
+
+
 @pytest.mark.asyncio
 async def test_handle_list_products(test_db, multiple_products, test_merchant_id):
     """Test listing products via chatbot"""
@@ -65,11 +112,10 @@ async def test_handle_add_product(test_db, test_merchant_id, mock_llm_global, mo
     message = "Tambahkan produk Kopi Susu harga 20000 stok 30"
     
     # Mock LLM to extract product details
-    async def mock_extract(prompt, system_prompt=None):
+    async def mock_extract(prompt, system_prompt=None, **kwargs):
         return '{"name": "Kopi Susu", "price": 20000, "stock": 30}'
     
-    import app.services.llm_client as llm
-    monkeypatch.setattr(llm, "generate_text", mock_extract)
+    monkeypatch.setattr(chatbot_service, "generate_text", mock_extract)
     
     response, actions = await chatbot_service._handle_add_product(test_db, test_merchant_id, message)
     
@@ -77,7 +123,7 @@ async def test_handle_add_product(test_db, test_merchant_id, mock_llm_global, mo
     assert "Kopi Susu" in response
     
     # Verify product was created
-    product = test_db.query(Product).filter(Product.name == "Kopi Susu").first()
+    product = await test_db.scalar(select(Product).where(Product.name == "Kopi Susu"))
     assert product is not None
     assert product.price == 20000.0
     assert product.stock == 30
@@ -89,18 +135,17 @@ async def test_handle_edit_product(test_db, sample_product, test_merchant_id, mo
     message = "Ubah harga Roti Tawar jadi 12000"
     
     # Mock LLM to extract edit details
-    async def mock_extract(prompt, system_prompt=None):
+    async def mock_extract(prompt, system_prompt=None, **kwargs):
         return '{"search_query": "Roti Tawar", "updates": {"price": 12000}}'
     
-    import app.services.llm_client as llm
-    monkeypatch.setattr(llm, "generate_text", mock_extract)
+    monkeypatch.setattr(chatbot_service, "generate_text", mock_extract)
     
     response, actions = await chatbot_service._handle_edit_product(test_db, test_merchant_id, message)
     
     assert "berhasil diupdate" in response.lower()
     
     # Verify price was updated
-    test_db.refresh(sample_product)
+    await test_db.refresh(sample_product)
     assert sample_product.price == 12000.0
 
 
@@ -110,19 +155,21 @@ async def test_handle_delete_product(test_db, sample_product, test_merchant_id,
     message = "Hapus produk Roti Tawar"
     
     # Mock LLM to extract product name
-    async def mock_extract(prompt, system_prompt=None):
+    async def mock_extract(prompt, system_prompt=None, **kwargs):
         return '{"search_query": "Roti Tawar"}'
     
-    import app.services.llm_client as llm
-    monkeypatch.setattr(llm, "generate_text", mock_extract)
+    monkeypatch.setattr(chatbot_service, "generate_text", mock_extract)
     
     response, actions = await chatbot_service._handle_delete_product(test_db, test_merchant_id, message)
     
     assert "berhasil dihapus" in response.lower()
     assert "Roti Tawar" in response
     
-    # Verify product was deleted
-    product = test_db.query(Product).filter(Product.name == "Roti Tawar").first()
+    # Verify product was deleted (soft delete keeps a tombstone)
+    product = await test_db.scalar(select(Product).where(
+        Product.name == "Roti Tawar",
+        Product.deleted_at.is_(None)
+    ))
     assert product is None
 
 
@@ -0,0 +1,129 @@
+"""Tests for the transaction query date-window parser"""
+from datetime import date
+
+import pytest
+from app.services.date_windows import parse_date_window
+
+TODAY = date(2026, 5, 20)  # a Wednesday
+
+
+@pytest.mark.parametrize("query, first_day, last_day", [
+    ("ringkasan hari ini", date(2026, 5, 20), date(2026, 5, 20)),
+    ("penjualan kemarin", date(2026, 5, 19), date(2026, 5, 19)),
+    ("kemarin lusa", date(2026, 5, 18), date(2026, 5, 18)),
+    ("3 hari yang lalu", date(2026, 5, 17), date(2026, 5, 17)),
+    ("7 hari terakhir", date(2026, 5, 14), date(2026, 5, 20)),
+    ("sales for the last 7 days", date(2026, 5, 14), date(2026, 5, 20)),
+    ("3 bulan terakhir", date(2026, 2, 21), date(2026, 5, 20)),
+    ("minggu ini", date(2026, 5, 18), date(2026, 5, 20)),
+    ("pekan lalu", date(2026, 5, 11), date(2026, 5, 17)),
+    ("2 minggu lalu", date(2026, 5, 4), date(2026, 5, 10)),
+    ("bulan ini", date(2026, 5, 1), date(2026, 5, 20)),
+    ("bulan lalu", date(2026, 4, 1), date(2026, 4, 30)),
+    ("revenue last month", date(2026, 4, 1), date(2026, 4, 30)),
+    ("2 months ago", date(2026, 3, 1), date(2026, 3, 31)),
+    ("kuartal ini", date(2026, 4, 1), date(2026, 5, 20)),
+    ("triwulan lalu", date(2026, 1, 1), date(2026, 3, 31)),
+    ("Q1 2025", date(2025, 1, 1), date(2025, 3, 31)),
+    ("kuartal pertama 2026", date(2026, 1, 1), date(2026, 3, 31)),
+    ("kuartal 4", date(2025, 10, 1), date(2025, 12, 31)),
+    ("tahun lalu", date(2025, 1, 1), date(2025, 12, 31)),
+    ("tahun 2024", date(2024, 1, 1), date(2024, 12, 31)),
+    ("Januari 2026", date(2026, 1, 1), date(2026, 1, 31)),
+    ("penjualan mei", date(2026, 5, 1), date(2026, 5, 20)),
+    ("desember", date(2025, 12, 1), date(2025, 12, 31)),
+    ("5 januari 2026", date(2026, 1, 5), date(2026, 1, 5)),
+    ("January 5, 2026", date(2026, 1, 5), date(2026, 1, 5)),
+    ("05/01/2026", date(2026, 1, 5), date(2026, 1, 5)),
+    ("1-15 januari 2026", date(2026, 1, 1), date(2026, 1, 15)),
+    ("dari 1 maret sampai 10 april", date(2026, 3, 1), date(2026, 4, 10)),
+    ("januari s/d maret 2026", date(2026, 1, 1), date(2026, 3, 31)),
+    ("november sampai februari", date(2025, 11, 1), date(2026, 2, 28)),
+    ("2026-01-05 to 2026-01-09", date(2026, 1, 5), date(2026, 1, 9)),
+    ("sejak 1 mei", date(2026, 5, 1), date(2026, 5, 20)),
+    ("sejak bulan lalu", date(2026, 4, 1), date(2026, 5, 20)),
+    ("sales since last month", date(2026, 4, 1), date(2026, 5, 20)),
+    ("mulai kemarin", date(2026, 5, 19), date(2026, 5, 20)),
+    ("sejak maret", date(2026, 3, 1), date(2026, 5, 20)),
+    ("seminggu terakhir", date(2026, 5, 14), date(2026, 5, 20)),
+    ("sebulan terakhir", date(2026, 4, 21), date(2026, 5, 20)),
+    ("setahun yang lalu", date(2025, 1, 1), date(2025, 12, 31)),
+    ("sales for the past week", date(2026, 5, 14), date(2026, 5, 20)),
+    ("0 hari terakhir", date(2026, 5, 20), date(2026, 5, 20)),
+    ("penjualan 2025", date(2025, 1, 1), date(2025, 12, 31)),
+    ("sales in may", date(2026, 5, 1), date(2026, 5, 20)),
+    ("jun 2025", date(2025, 6, 1), date(2025, 6, 30)),
+    ("jan - mar 2026", date(2026, 1, 1), date(2026, 3, 31)),
+])
+def test_parses_period(query, first_day, last_day):
+    assert parse_date_window(query, TODAY, 30) == (first_day, last_day)
+
+
+@pytest.mark.parametrize("query, first_day, last_day", [
+    # Trailing counts
+    ("2 hari terakhir", date(2026, 5, 19), date(2026, 5, 20)),
+    ("2 minggu terakhir", date(2026, 5, 7), date(2026, 5, 20)),
+    ("2 bulan belakangan", date(2026, 3, 21), date(2026, 5, 20)),
+    ("2 kuartal ke belakang", date(2025, 11, 21), date(2026, 5, 20)),
+    ("2 tahun terakhir", date(2024, 5, 21), date(2026, 5, 20)),
+    ("past 3 days", date(2026, 5, 18), date(2026, 5, 20)),
+    ("previous 2 weeks", date(2026, 5, 7), date(2026, 5, 20)),
+    ("sehari terakhir", date(2026, 5, 20), date(2026, 5, 20)),
+    ("past month", date(2026, 4, 21), date(2026, 5, 20)),
+    ("past year", date(2025, 5, 21), date(2026, 5, 20)),
+    # Whole periods a count ago
+    ("2 hari yang lalu", date(2026, 5, 18), date(2026, 5, 18)),
+    ("2 minggu sebelumnya", date(2026, 5, 4), date(2026, 5, 10)),
+    ("2 bulan lalu", date(2026, 3, 1), date(2026, 3, 31)),
+    ("2 kuartal lalu", date(2025, 10, 1), date(2025, 12, 31)),
+    ("2 years ago", date(2024, 1, 1), date(2024, 12, 31)),
+    ("seminggu yang lalu", date(2026, 5, 11), date(2026, 5, 17)),
+    # Current periods
+    ("this day", date(2026, 5, 20), date(2026, 5, 20)),
+    ("this week", date(2026, 5, 18), date(2026, 5, 20)),
+    ("this month", date(2026, 5, 1), date(2026, 5, 20)),
+    ("this quarter", date(2026, 4, 1), date(2026, 5, 20)),
+    ("tahun ini", date(2026, 1, 1), date(2026, 5, 20)),
+    # Previous periods
+    ("hari sebelumnya", date(2026, 5, 19), date(2026, 5, 19)),
+    ("minggu kemarin", date(2026, 5, 11), date(2026, 5, 17)),
+    ("previous month", date(2026, 4, 1), date(2026, 4, 30)),
+    ("last quarter", date(2026, 1, 1), date(2026, 3, 31)),
+    ("last year", date(2025, 1, 1), date(2025, 12, 31)),
+    # Named days
+    ("day before yesterday", date(2026, 5, 18), date(2026, 5, 18)),
+    ("yesterday", date(2026, 5, 19), date(2026, 5, 19)),
+    ("sales today", date(2026, 5, 20), date(2026, 5, 20)),
+    ("stok sekarang", date(2026, 5, 20), date(2026, 5, 20)),
+])
+def test_parses_every_relative_rule(query, first_day, last_day):
+    assert parse_date_window(query, TODAY, 30) == (first_day, last_day)
+
+
+@pytest.mark.parametrize("query, first_day, last_day", [
+    ("transaksi 15-1 januari 2026", date(2026, 1, 1), date(2026, 1, 15)),
+    ("penjualan 20 - 10 mei", date(2026, 5, 10), date(2026, 5, 20)),
+    ("2026-01-09 to 2026-01-05", date(2026, 1, 5), date(2026, 1, 9)),
+])
+def test_ranges_written_latest_first_are_ordered(query, first_day, last_day):
+    assert parse_date_window(query, TODAY, 30) == (first_day, last_day)
+
+
+@pytest.mark.parametrize("query", [
+    "total penjualan",
+    "transaksi di atas 2000",
+    "31 februari 2026",
+    "May I see my sales summary?",
+    "berapa jan menjual",
+    "transaksi lebih dari 2025",
+    "transaksi 99999999999 hari yang lalu",
+    "transaksi 99999999999 tahun terakhir",
+    "99999999999 minggu terakhir",
+    "sejak 99999999999 bulan lalu",
+])
+def test_unrecognized_period_is_bounded(query):
+    assert parse_date_window(query, TODAY, 30) == (date(2026, 4, 21), TODAY)
+
+
+def test_only_explicit_all_time_is_unbounded():
+    assert parse_date_window("rekap semua transaksi sepanjang waktu", TODAY, 30) == (None, None)
@@ -0,0 +1,116 @@
+"""Tests for the local intent fast path"""
+import pytest
+from app.config import settings
+from app.services import chatbot_service
+from app.services.intent_classifier import (
+    IntentClassifier, SEED_EXAMPLES, intent_classifier, load_model, match_rules
+)
+
+
+@pytest.mark.parametrize("message, intent", [
+    ("Kosongkan semua produk yang mengandung tepung", "automation"),
+    ("hapus semua roti yang expired", "automation"),
+    ("Hapus produk Roti Tawar", "delete_product"),
+    ("Tambahkan produk Roti Tawar harga 15000", "add_product"),
+    ("Ubah harga Roti Tawar jadi 12000", "edit_product"),
+    ("Tampilkan semua produk", "query"),
+    ("Produk apa yang berisiko tinggi?", "risk_report"),
+    ("Ringkas transaksi hari ini", "transaction_summary"),
+    ("Berapa total penjualan minggu ini?", "transaction_summary"),
+    ("total pendapatan?", "transaction_summary"),
+    ("halo", "help"),
+    ("Halo!", "help"),
+    ("tolong bantu", "help"),
+    ("selamat pagi", "help"),
+    # A greeting in front of a command does not hide the command
+    ("Halo, tambahkan produk Roti Tawar harga 15000", "add_product"),
+    ("hai, hapus produk kopi", "delete_product"),
+    ("tolong bantu hapus produk roti", "delete_product"),
+])
+def test_rule_table(message, intent):
+    assert match_rules(message)[0] == intent
+
+
+@pytest.mark.parametrize("message", [
+    "Berapa total penjualan roti minggu ini?",  # per-product sales are a query
+    "total penjualan kopi susu",
+    "halo, bagaimana tren penjualan teh botol",
+])
+def test_rules_leave_ambiguous_messages_alone(message):
+    assert match_rules(message) is None
+
+
+class FixedModel:
+    def __init__(self, intent, confidence):
+        self.result = (intent, confidence)
+    
+    def predict(self, text):
+        return self.result
+
+
+def test_threshold_decides_between_model_and_llm():
+    classifier = IntentClassifier(threshold=0.85)
+    classifier._model = FixedModel("query", 0.84)
+    assert classifier.classify("stok donat berapa") == (None, {"intent": "query", "confidence": 0.84, "source": "model"})
+    
+    classifier._model = FixedModel("query", 0.86)
+    result, prediction = classifier.classify("stok donat berapa")
+    assert result == prediction == {"intent": "query", "confidence": 0.86, "source": "model"}
+    assert classifier.classify("halo")[0]["source"] == "rule"
+    
+    stats = classifier.stats()
+    assert (stats["model_hits"], stats["rule_hits"], stats["llm_fallbacks"]) == (1, 1, 1)
+
+
+def test_disabled_classifier_always_defers():
+    classifier = IntentClassifier(enabled=False)
+    assert classifier.classify("halo") == (None, None)
+
+
+def test_audited_hits_go_to_the_llm_and_fill_the_confident_buckets():
+    classifier = IntentClassifier(threshold=0.85, audit_rate=1.0)
+    classifier._model = FixedModel("query", 0.95)
+    
+    result, prediction = classifier.classify("stok donat berapa")
+    assert result is None and prediction["confidence"] == 0.95
+    classifier.record_llm_label(prediction, "query")
+    
+    classifier._model = FixedModel("query", 0.55)
+    classifier.record_llm_label(classifier.classify("stok donat berapa")[1], "add_product")
+    
+    stats = classifier.stats()
+    assert (stats["audits"], stats["llm_fallbacks"], stats["model_hits"]) == (1, 1, 0)
+    agreement = stats["llm_agreement_by_confidence"]
+    assert agreement["0.9-1.0"] == {"samples": 1, "accuracy": 1.0}
+    assert agreement["0.5-0.6"] == {"samples": 1, "accuracy": 0.0}
+
+
+def test_shipped_model_is_confident_on_its_seed_examples():
+    model = load_model()
+    answered = correct = 0
+    for text, label in SEED_EXAMPLES:
+        intent, confidence = model.predict(text)
+        if confidence >= settings.intent_fastpath_threshold:
+            answered += 1
+            correct += int(intent == label)
+    assert answered >= 0.8 * len(SEED_EXAMPLES)
+    assert correct == answered
+
+
+@pytest.mark.asyncio
+async def test_unconfident_message_falls_back_to_llm(monkeypatch):
+    prompts = []
+    
+    async def fake_generate_text(prompt, **kwargs):
+        prompts.append(prompt)
+        return '{"intent": "query", "confidence": 0.85, "arguments": null}'
+    monkeypatch.setattr(chatbot_service, "generate_text", fake_generate_text)
+    monkeypatch.setattr(intent_classifier, "threshold", 0.85)
+    
+    result = await chatbot_service.classify_intent("Berapa total penjualan roti minggu ini?")
+    assert result["intent"] == "query"
+    assert len(prompts) == 1
+    
+    result = await chatbot_service.classify_intent("Halo, tambahkan produk Roti Tawar harga 15000")
+    assert result["intent"] == "add_product"
+    assert len(prompts) == 1
@@ -0,0 +1,96 @@
+"""Unit tests for the LLM response cache"""
+import pytest
+from app.services import llm_cache as llm_cache_module
+from app.services.llm_cache import LLMResponseCache, SQLiteCacheBackend, TTLCache
+from app.services.llm_client import _build_request
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    
+    def monotonic(self):
+        return self.now
+    
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(llm_cache_module, "time", clock)
+    return clock
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = TTLCache(max_entries=10, ttl_seconds=60)
+    cache.set("a", "first")
+    cache.set("b", "second", ttl_seconds=600)
+    
+    clock.now += 59
+    assert cache.get("a") == "first"
+    
+    clock.now += 2
+    assert cache.get("a") is None
+    assert cache.get("b") == "second"
+    assert len(cache) == 1
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_cache_key_is_stable_and_content_addressed():
+    request, key = _build_request("Halo", None, "sistem", None, None)
+    again, same_key = _build_request("Halo", None, "sistem", None, None)
+    
+    assert again == request
+    assert same_key == key
+    assert LLMResponseCache.make_key(a=1, b="x") == LLMResponseCache.make_key(b="x", a=1)
+    
+    for changed in (
+        _build_request("Halo!", None, "sistem", None, None),
+        _build_request("Halo", None, "lain", None, None),
+        _build_request("Halo", None, "sistem", None, 0.0),
+        _build_request("Halo", None, "sistem", None, None, json_mode=True),
+        _build_request("Halo", None, "sistem", [{"role": "user", "content": "hai"}], None)
+    ):
+        assert changed[1] != key
+
+
+@pytest.mark.asyncio
+async def test_backend_hits_fill_the_local_layer(tmp_path, clock):
+    backend = SQLiteCacheBackend(str(tmp_path / "llm_cache.db"))
+    writer = LLMResponseCache(ttl_seconds=60, backend=backend)
+    await writer.set("key", "jawaban")
+    
+    # Another process sharing the backend
+    reader = LLMResponseCache(ttl_seconds=60, backend=backend)
+    assert await reader.get("key") == "jawaban"
+    assert reader.backend_hits == 1
+    assert reader.local.get("key") == "jawaban"
+    
+    clock.now += 61
+    assert await LLMResponseCache(ttl_seconds=60, backend=backend).get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_disabled_cache_stores_nothing():
+    cache = LLMResponseCache(enabled=False)
+    await cache.set("key", "jawaban")
+    
+    assert await cache.get("key") is None
+    assert len(cache.local) == 0
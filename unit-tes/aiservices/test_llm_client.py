@@ -0,0 +1,73 @@
+"""Unit tests for LLM request coalescing"""
+import asyncio
+
+import pytest
+from app.services.llm_client import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_request():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    calls = []
+    
+    async def complete():
+        calls.append(1)
+        await release.wait()
+        return "jawaban"
+    
+    waiters = [asyncio.ensure_future(flight.do("key", complete)) for _ in range(5)]
+    other = asyncio.ensure_future(flight.do("other", complete))
+    await asyncio.sleep(0)
+    assert flight.stats() == {"in_flight": 2, "calls": 2, "shared": 4}
+    
+    release.set()
+    assert await asyncio.gather(*waiters, other) == ["jawaban"] * 6
+    assert len(calls) == 2
+    
+    # Finished requests are not reused: the response cache serves repeats
+    await flight.do("key", complete)
+    assert len(calls) == 3
+    assert flight.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_error_reaches_every_waiter_and_is_not_kept():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    
+    async def failing():
+        await release.wait()
+        raise RuntimeError("rate limited")
+    
+    waiters = [asyncio.ensure_future(flight.do("key", failing)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*waiters, return_exceptions=True)
+    
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert flight.stats()["in_flight"] == 0
+    
+    async def succeeding():
+        return "jawaban"
+    assert await flight.do("key", succeeding) == "jawaban"
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_the_shared_request():
+    flight = SingleFlight()
+    release = asyncio.Event()
+    
+    async def complete():
+        await release.wait()
+        return "jawaban"
+    
+    first = asyncio.ensure_future(flight.do("key", complete))
+    second = asyncio.ensure_future(flight.do("key", complete))
+    await asyncio.sleep(0)
+    first.cancel()
+    release.set()
+    
+    assert await second == "jawaban"
+    with pytest.raises(asyncio.CancelledError):
+        await first
@@ -1,8 +1,12 @@
 """Unit tests for product service"""
+import asyncio
 import pytest
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, text
 from app.services import product_service
 from app.schemas.product import ProductCreate, ProductUpdate
-from app.models.product import Product
+from app.models.product import Product, ProductTrend
 
 
 @pytest.mark.asyncio
@@ -26,9 +30,10 @@ async def test_create_product(test_db, test_merchant_id):
     assert product.merchant_id == int(test_merchant_id)
 
 
-def test_get_products(test_db, multiple_products, test_merchant_id):
+@pytest.mark.asyncio
+async def test_get_products(test_db, multiple_products, test_merchant_id):
     """Test retrieving products for a merchant"""
-    products = product_service.get_products(test_db, test_merchant_id)
+    products = await product_service.get_products(test_db, test_merchant_id)
     
     assert len(products) == len(multiple_products)
     product_names = [p.name for p in products]
@@ -36,18 +41,20 @@ def test_get_products(test_db, multiple_products, test_merchant_id):
     assert "Kopi Hitam" in product_names
 
 
-def test_get_product_by_id(test_db, sample_product, test_merchant_id):
+@pytest.mark.asyncio
+async def test_get_product_by_id(test_db, sample_product, test_merchant_id):
     """Test getting a specific product by ID"""
-    product = product_service.get_product_by_id(test_db, sample_product.id, int(test_merchant_id))
+    product = await product_service.get_product_by_id(test_db, sample_product.id, int(test_merchant_id))
     
     assert product is not None
     assert product.id == sample_product.id
     assert product.name == sample_product.name
 
 
-def test_get_product_by_id_wrong_merchant(test_db, sample_product):
+@pytest.mark.asyncio
+async def test_get_product_by_id_wrong_merchant(test_db, sample_product):
     """Test that products are isolated by merchant"""
-    product = product_service.get_product_by_id(test_db, sample_product.id, merchant_id=999)
+    product = await product_service.get_product_by_id(test_db, sample_product.id, merchant_id=999)
     
     assert product is None
 
@@ -67,22 +74,27 @@ async def test_update_product(test_db, sample_product):
     assert updated.name == sample_product.name  # Unchanged field
 
 
-def test_delete_product(test_db, sample_product):
+@pytest.mark.asyncio
+async def test_delete_product(test_db, sample_product):
     """Test deleting a product"""
     product_id = sample_product.id
     
-    result = product_service.delete_product(test_db, product_id)
+    result = await product_service.delete_product(test_db, product_id)
     
     assert result == True
     
-    # Verify deletion
-    product = test_db.query(Product).filter(Product.id == product_id).first()
+    # Verify deletion (soft delete keeps a tombstone)
+    product = await product_service.get_product(test_db, product_id)
     assert product is None
+    
+    tombstone = await test_db.get(Product, product_id)
+    assert tombstone.deleted_at is not None
 
 
-def test_get_products_by_ingredient(test_db, multiple_products, test_merchant_id):
+@pytest.mark.asyncio
+async def test_get_products_by_ingredient(test_db, multiple_products, test_merchant_id):
     """Test finding products by ingredient"""
-    products = product_service.get_products_by_ingredient(
+    products = await product_service.get_products_by_ingredient(
         test_db, test_merchant_id, "tepung"
     )
     
@@ -91,18 +103,81 @@ def test_get_products_by_ingredient(test_db, multiple_products, test_merchant_id
         assert "tepung" in product.ingredients.lower()
 
 
-def test_get_products_pagination(test_db, test_merchant_id):
+@pytest.mark.asyncio
+async def test_get_products_pagination(test_db, test_merchant_id):
     """Test product pagination"""
     # Create many products
     for i in range(15):
         from conftest import create_test_product
-        create_test_product(test_db, test_merchant_id, name=f"Product {i}")
+        await create_test_product(test_db, test_merchant_id, name=f"Product {i}")
     
     # Test limit
-    products_limited = product_service.get_products(test_db, test_merchant_id, limit=5)
+    products_limited = await product_service.get_products(test_db, test_merchant_id, limit=5)
     assert len(products_limited) == 5
     
     # Test offset
-    products_offset = product_service.get_products(test_db, test_merchant_id, skip=5, limit=5)
+    products_offset = await product_service.get_products(test_db, test_merchant_id, skip=5, limit=5)
     assert len(products_offset) == 5
     assert products_offset[0].id != products_limited[0].id
+
+
+async def create_tombstones(db, merchant_id, **deleted_days_ago):
+    """Ids of products deleted the given number of days ago, each with a trend row"""
+    from conftest import create_test_product
+    
+    ids = {}
+    for name, days in deleted_days_ago.items():
+        deleted_at = datetime.utcnow() - timedelta(days=days) if days is not None else None
+        ids[name] = (await create_test_product(db, merchant_id, name=name, deleted_at=deleted_at)).id
+        db.add(ProductTrend(product_id=ids[name], date=date.today(), quantity_sold=1, revenue=1000.0))
+    await db.commit()
+    return ids
+
+
+async def remaining_ids(db):
+    db.expire_all()
+    return set((await db.scalars(select(Product.id))).all())
+
+
+@pytest.mark.asyncio
+async def test_purge_keeps_tombstones_within_retention(test_db, test_merchant_id):
+    """Test that only tombstones older than the retention window are purged"""
+    ids = await create_tombstones(test_db, test_merchant_id, live=None, recent=10, old=40, sold=40)
+    await test_db.execute(text("CREATE TABLE transaction_items (id INTEGER PRIMARY KEY, product_id INTEGER)"))
+    await test_db.execute(text("INSERT INTO transaction_items (product_id) VALUES (:id)"), {"id": ids["sold"]})
+    await test_db.commit()
+    
+    purged = await product_service.purge_deleted_products(test_db, timedelta(days=30), batch_size=1)
+    
+    assert purged == 1
+    assert await remaining_ids(test_db) == {ids[name] for name in ("live", "recent", "sold")}
+    trend_ids = set((await test_db.scalars(select(ProductTrend.product_id))).all())
+    assert ids["old"] not in trend_ids
+
+
+@pytest.mark.asyncio
+async def test_compaction_uses_configured_retention(test_db, test_merchant_id, monkeypatch):
+    """Test that the background compaction purges by tombstone_retention_days"""
+    ids = await create_tombstones(test_db, test_merchant_id, recent=3, old=10)
+    monkeypatch.setattr(product_service.settings, "tombstone_retention_days", 5)
+    monkeypatch.setattr(product_service.settings, "tombstone_compaction_interval_seconds", 0)
+    
+    @asynccontextmanager
+    async def session():
+        yield test_db
+    monkeypatch.setattr(product_service, "SessionLocal", session)
+    
+    # Stop the job after its first purge
+    purge_deleted_products = product_service.purge_deleted_products
+    
+    async def purge_once(db, older_than, batch_size):
+        purged = await purge_deleted_products(db, older_than, batch_size)
+        compaction.cancel()
+        return purged
+    monkeypatch.setattr(product_service, "purge_deleted_products", purge_once)
+    
+    compaction = asyncio.create_task(product_service.run_tombstone_compaction())
+    with pytest.raises(asyncio.CancelledError):
+        await compaction
+    
+    assert await remaining_ids(test_db) == {ids["recent"]}
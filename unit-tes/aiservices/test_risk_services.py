@@ -0,0 +1,171 @@
+"""Unit tests for stored risk assessments and the refresh queue"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select
+from app.config import settings
+from app.models.product import ProductRisk, ProductRiskSnapshot, RiskRefreshQueue
+from app.schemas.product import ProductUpdate
+from app.services import product_service, risk_refresh, risk_services
+from conftest import create_test_product
+
+
+@pytest.fixture
+def worker_session(test_db, monkeypatch):
+    """Run the worker's sessions on the test database"""
+    @asynccontextmanager
+    async def session():
+        yield test_db
+    
+    monkeypatch.setattr(risk_services, "SessionLocal", session)
+
+
+async def queued_ids(db):
+    return list((await db.scalars(
+        select(RiskRefreshQueue.product_id).order_by(RiskRefreshQueue.product_id)
+    )).all())
+
+
+async def risky_catalog(db, merchant_id):
+    return [
+        await create_test_product(db, merchant_id, name="Susu", stock=5,
+                                  expiration_date=datetime.utcnow() - timedelta(days=2)),
+        await create_test_product(db, merchant_id, name="Keju", stock=100, price=50000.0),
+        await create_test_product(db, merchant_id, name="Gula", stock=10,
+                                  expiration_date=datetime.utcnow() + timedelta(days=6, hours=12)),
+        await create_test_product(db, merchant_id, name="Garam", stock=10)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_refresh_matches_single_product_assessment(test_db, test_merchant_id):
+    products = await risky_catalog(test_db, test_merchant_id)
+    ids = [product.id for product in products]
+    
+    assert await risk_services.refresh_product_risks(test_db, ids) == len(ids)
+    snapshots = {
+        snapshot.product_id: snapshot
+        for snapshot in (await test_db.scalars(select(ProductRiskSnapshot))).all()
+    }
+    
+    for product_id in ids:
+        single = await risk_services.assess_product_risk(test_db, product_id)
+        assert snapshots[product_id].overall_risk_level == single.overall_risk_level
+        assert snapshots[product_id].overall_risk_score == single.overall_risk_score
+
+
+@pytest.mark.asyncio
+async def test_high_risk_and_report_read_stored_snapshots(test_db, test_merchant_id):
+    expired, valuable, expiring, plain = await risky_catalog(test_db, test_merchant_id)
+    await risk_services.refresh_product_risks(test_db, [expired.id, valuable.id, expiring.id, plain.id])
+    
+    summary = await risk_services.get_high_risk_products(test_db, test_merchant_id)
+    assert [product.id for product in summary.products] == [expired.id, valuable.id]
+    assert (summary.total_high_risk, summary.total_critical_risk) == (2, 1)
+    
+    report = await risk_services.generate_risk_report(test_db, test_merchant_id)
+    assert report["total_products"] == 4
+    assert report["risk_breakdown"] == {"critical": 1, "high": 1, "medium": 1, "low": 1}
+    assert [risk["product_id"] for risk in report["top_risks"]] == [expired.id, valuable.id, expiring.id]
+    assert report["top_risks"][0]["risks"][0]["risk_type"] == "expiration"
+
+
+@pytest.mark.asyncio
+async def test_writes_enqueue_and_deleted_products_lose_risks(test_db, test_merchant_id):
+    products = await risky_catalog(test_db, test_merchant_id)
+    await risk_services.refresh_product_risks(test_db, [product.id for product in products])
+    expired = products[0]
+    
+    await product_service.update_product(test_db, expired.id, ProductUpdate(stock=0))
+    await product_service.delete_product(test_db, products[1].id)
+    assert await queued_ids(test_db) == [expired.id, products[1].id]
+    
+    await risk_services.refresh_product_risks(test_db, [expired.id, products[1].id])
+    stored = set((await test_db.scalars(select(ProductRisk.product_id))).all())
+    assert products[1].id not in stored and expired.id in stored
+    stale = await risk_services.stale_product_ids(test_db, datetime.utcnow() + timedelta(seconds=1))
+    assert sorted(stale) == [expired.id, products[2].id, products[3].id]
+
+
+@pytest.mark.asyncio
+async def test_report_counts_and_assesses_products_without_snapshots(test_db, test_merchant_id):
+    products = await risky_catalog(test_db, test_merchant_id)
+    await risk_services.refresh_product_risks(test_db, [products[0].id])
+    
+    report = await risk_services.generate_risk_report(test_db, test_merchant_id)
+    
+    assert report["total_products"] == 4
+    assert sum(report["risk_breakdown"].values()) == 4
+    snapshots = set((await test_db.scalars(select(ProductRiskSnapshot.product_id))).all())
+    assert snapshots == {product.id for product in products}
+
+
+@pytest.mark.asyncio
+async def test_failing_product_backs_off_without_blocking_the_rest(
+    test_db, test_merchant_id, worker_session, monkeypatch
+):
+    good, bad = (await risky_catalog(test_db, test_merchant_id))[:2]
+    good_id, bad_id = good.id, bad.id
+    refresh = risk_services.refresh_product_risks
+    
+    async def flaky_refresh(db, product_ids):
+        if bad_id in product_ids:
+            raise RuntimeError("constraint violation")
+        return await refresh(db, product_ids)
+    
+    monkeypatch.setattr(risk_services, "refresh_product_risks", flaky_refresh)
+    await risk_refresh.enqueue_risk_refresh(test_db, [good_id, bad_id])
+    await test_db.commit()
+    
+    # The failed product waits out its backoff instead of being claimed again
+    assert await risk_services.drain_refresh_queue() == 2
+    row = await test_db.get(RiskRefreshQueue, bad_id)
+    assert await queued_ids(test_db) == [bad_id] and row.attempts == 1
+    assert await risk_services.drain_refresh_queue() == 0
+    
+    for attempt in range(2, settings.risk_refresh_max_attempts + 1):
+        row.retry_at = datetime.utcnow() - timedelta(seconds=1)
+        await test_db.commit()
+        assert await risk_services.drain_refresh_queue() == 1
+        last = attempt == settings.risk_refresh_max_attempts
+        assert await queued_ids(test_db) == ([] if last else [bad_id])
+        if not last:
+            await test_db.refresh(row)
+            assert row.attempts == attempt
+    
+    snapshots = set((await test_db.scalars(select(ProductRiskSnapshot.product_id))).all())
+    assert snapshots == {good_id}
+
+
+@pytest.mark.asyncio
+async def test_queue_survives_restarts_and_keeps_products_queued_again(
+    test_db, test_merchant_id, worker_session, monkeypatch
+):
+    products = await risky_catalog(test_db, test_merchant_id)
+    ids = [product.id for product in products]
+    await product_service.update_product(test_db, ids[0], ProductUpdate(stock=1))
+    await product_service.delete_product(test_db, ids[1])
+    
+    # A new process has an empty in-memory state but finds the queued rows
+    monkeypatch.setattr(risk_refresh, "_wakeup", asyncio.Event())
+    assert not await risk_refresh.wait_for_pending(0)
+    async with risk_services.SessionLocal() as db:
+        batch = await risk_refresh.claim_due(db, 10)
+    assert [row.product_id for row in batch] == ids[:2]
+    
+    # Claimed rows are skipped by other processes until the claim expires
+    async with risk_services.SessionLocal() as db:
+        assert await risk_refresh.claim_due(db, 10) == []
+    
+    # A write during the refresh queues the product again
+    await product_service.update_product(test_db, ids[0], ProductUpdate(stock=2))
+    await risk_services.refresh_product_risks(test_db, [row.product_id for row in batch])
+    await risk_refresh.complete(test_db, batch)
+    assert await queued_ids(test_db) == [ids[0]]
+    
+    assert await risk_services.drain_refresh_queue() == 1
+    assert await queued_ids(test_db) == []
+    stored = set((await test_db.scalars(select(ProductRiskSnapshot.product_id))).all())
+    assert stored == {ids[0]}
@@ -0,0 +1,386 @@
+"""Unit tests for transaction summary statistics"""
+import random
+from datetime import date, datetime, timedelta
+from time import monotonic
+
+import pytest
+import pytest_asyncio
+from pydantic import ValidationError
+from sqlalchemy import event, text
+from app.models.product import MerchantDailyStats
+from app.schemas.transaction import TransactionSummaryRequest
+from app.services import transaction_stats, transaction_summary_service
+
+
+@pytest_asyncio.fixture
+async def transactions_db(test_db, monkeypatch):
+    """test_db with the Go backend's transaction tables and 1,500 random sales"""
+    prompts = []
+    
+    async def fake_generate_text(prompt, max_tokens=None):
+        prompts.append(prompt)
+        return f"Ringkasan transaksi {len(prompts)}."
+    monkeypatch.setattr(transaction_summary_service, "generate_text", fake_generate_text)
+    transaction_summary_service.summary_cache.clear()
+    monkeypatch.setattr(transaction_stats, "_last_refresh", None)
+    test_db.info["llm_prompts"] = prompts
+    
+    await test_db.execute(text(
+        "CREATE TABLE transactions (id INTEGER PRIMARY KEY, merchant_id INTEGER, total_amount FLOAT,"
+        " payment_method VARCHAR(50), customer_name VARCHAR(255), status VARCHAR(20),"
+        " created_at DATETIME, updated_at DATETIME)"
+    ))
+    await test_db.execute(text(
+        "CREATE TABLE transaction_items (id INTEGER PRIMARY KEY, transaction_id INTEGER,"
+        " product_id INTEGER, product_name VARCHAR(255), quantity INTEGER)"
+    ))
+    # Indexes created by the Go backend's migrations
+    await test_db.execute(text(
+        "CREATE INDEX idx_transactions_merchant_created ON transactions (merchant_id, created_at)"
+    ))
+    await test_db.execute(text(
+        "CREATE INDEX idx_transaction_items_transaction_id ON transaction_items (transaction_id)"
+    ))
+    await test_db.execute(text("CREATE INDEX idx_transactions_updated_at ON transactions (updated_at)"))
+    
+    rng = random.Random(11)
+    start = datetime(2024, 5, 1)
+    rows = []
+    for transaction_id in range(1, 1501):
+        rows.append({
+            "id": transaction_id,
+            "merchant_id": 1 if transaction_id % 10 else 2,
+            "total_amount": float(rng.randint(1, 100) * 1000 + transaction_id * 200),  # grows over time
+            "payment_method": rng.choice(["cash", "cash", "card", "ewallet", None]),
+            "customer_name": f"Pelanggan {transaction_id}",
+            "status": "cancelled" if rng.random() < 0.1 else "completed",
+            "created_at": start + timedelta(minutes=29 * transaction_id)
+        })
+    await insert_transactions(test_db, rows)
+    return test_db, rows
+
+
+def stored_time(value: datetime) -> str:
+    """DATETIME text as SQLAlchemy writes it on SQLite"""
+    return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+
+
+async def insert_transactions(db, rows):
+    """Insert transactions the way the Go backend does, two items each"""
+    await db.execute(text(
+        "INSERT INTO transactions VALUES (:id, :merchant_id, :total_amount, :payment_method,"
+        " :customer_name, :status, :created_at, :updated_at)"
+    ), [
+        dict(row, created_at=stored_time(row["created_at"]), updated_at=stored_time(row["created_at"]))
+        for row in rows
+    ])
+    await db.execute(text(
+        "INSERT INTO transaction_items (transaction_id, product_id, product_name, quantity)"
+        " VALUES (:transaction_id, 1, :product_name, :quantity)"
+    ), [
+        {"transaction_id": row["id"], "product_name": name, "quantity": quantity}
+        for row in rows
+        for name, quantity in (("Roti", 2), ("Kopi", 1))
+    ])
+    await db.commit()
+
+
+@pytest.mark.asyncio
+async def test_summary_totals_are_exact_beyond_limit(transactions_db):
+    db, rows = transactions_db
+    merchant_rows = [row for row in rows if row["merchant_id"] == 1]
+    completed = [row for row in merchant_rows if row["status"] == "completed"]
+    
+    result = await transaction_summary_service.generate_transaction_summary(db, "1", limit=10)
+    
+    assert result["total_transactions"] == len(merchant_rows) > 1000
+    assert result["total_revenue"] == pytest.approx(sum(row["total_amount"] for row in completed))
+    assert result["average_transaction"] == pytest.approx(result["total_revenue"] / len(completed))
+    assert "samples" not in result
+    
+    insights = {insight["type"]: insight for insight in result["insights"]}
+    methods = {}
+    for row in completed:
+        methods[row["payment_method"] or "unknown"] = methods.get(row["payment_method"] or "unknown", 0) + 1
+    assert insights["payment_preference"]["value"] == max(methods.items(), key=lambda x: x[1])[0]
+    
+    hours = {}
+    for row in merchant_rows:
+        hours[row["created_at"].hour] = hours.get(row["created_at"].hour, 0) + 1
+    peak = max(sorted(hours.items()), key=lambda x: x[1])
+    assert insights["peak_hour"]["value"] == f"{peak[0]}:00"
+    mid = len(completed) // 2
+    older = sum(row["total_amount"] for row in completed[:mid])
+    newer = sum(row["total_amount"] for row in completed[mid:])
+    assert newer > older * 1.1
+    assert insights["revenue_trend"]["value"] == "increasing"
+
+
+@pytest.mark.asyncio
+async def test_summary_filters_and_samples(transactions_db):
+    db, rows = transactions_db
+    matching = [
+        row for row in rows
+        if row["merchant_id"] == 1 and row["payment_method"] == "card"
+        and "2024-05-03" <= row["created_at"].date().isoformat() <= "2024-05-10"
+    ]
+    
+    result = await transaction_summary_service.generate_transaction_summary(
+        db, "1", date_from="2024-05-03", date_to="2024-05-10",
+        payment_method="card", limit=5, include_samples=True
+    )
+    
+    assert result["total_transactions"] == len(matching)
+    newest = sorted(matching, key=lambda row: row["created_at"], reverse=True)[:5]
+    assert [sample["id"] for sample in result["samples"]] == [row["id"] for row in newest]
+    assert sorted(result["samples"][0]["items"]) == ["Kopi (1)", "Roti (2)"]
+
+
+@pytest.mark.asyncio
+async def test_summary_queries_search_the_merchant_created_index(transactions_db, monkeypatch):
+    """Every query must bound both merchant_id and created_at through the
+    composite index; a function on created_at would leave it unbounded"""
+    db, _ = transactions_db
+    monkeypatch.setattr(transaction_stats.settings, "transaction_stats_max_staleness_seconds", 0)
+    # The first refresh reads every transaction once; later ones only changes
+    await transaction_stats.refresh_daily_stats(db)
+    statements = []
+    
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+    
+    engine = db.get_bind()
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        await transaction_summary_service.generate_transaction_summary(
+            db, "1", date_from="2024-05-03", date_to="2024-05-10", include_samples=True
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    
+    conn = await db.connection()
+    searched = 0
+    for statement, parameters in statements:
+        plan = (await conn.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters)).all()
+        for detail in (row[-1] for row in plan):
+            if detail.split()[:2] in (["SCAN", "transactions"], ["SCAN", "transaction_items"]):
+                pytest.fail(f"full scan: {detail} in {statement}")
+            if detail.startswith("SEARCH transactions "):
+                # The rollup refresh reads changed rows through the updated_at watermark index
+                assert (
+                    "(merchant_id=? AND created_at>? AND created_at<?)" in detail
+                    or "idx_transactions_updated_at (updated_at>?)" in detail
+                ), detail
+                searched += 1
+            elif detail.startswith("SEARCH transaction_items "):
+                assert "(transaction_id=?)" in detail, detail
+    assert searched >= 4
+
+
+@pytest.mark.asyncio
+async def test_past_days_are_read_from_the_rollup(transactions_db):
+    db, _ = transactions_db
+    first = await transaction_summary_service.generate_transaction_summary(db, "1")
+    
+    # Raw rows vanishing without an updated_at bump must not change the answer
+    await db.execute(text("DELETE FROM transactions WHERE merchant_id = 1"))
+    await db.commit()
+    second = await transaction_summary_service.generate_transaction_summary(db, "1")
+    
+    assert second["total_transactions"] == first["total_transactions"]
+    assert second["total_revenue"] == pytest.approx(first["total_revenue"])
+    assert second["insights"] == first["insights"]
+
+
+@pytest.mark.asyncio
+async def test_summary_before_the_first_refresh_reads_live_rows(transactions_db, monkeypatch):
+    db, _ = transactions_db
+    # A refresh is running elsewhere (the startup catch-up), so none starts here
+    monkeypatch.setattr(transaction_stats, "_last_refresh", monotonic())
+    
+    async def live_summary(date_from, date_to):
+        filters = transaction_stats.transaction_filters("1", date_from, date_to)
+        stats = (await transaction_stats.aggregate_statistics(db, filters)).get(None)
+        return stats["transaction_count"], stats["revenue"]
+    
+    async def summary(date_from=None, date_to=None):
+        result = await transaction_summary_service.generate_transaction_summary(db, "1", date_from, date_to)
+        return result["total_transactions"], result["total_revenue"]
+    
+    assert not await transaction_stats.daily_stats_cover(db, date(2024, 5, 31))
+    assert await summary() == pytest.approx(await live_summary(None, None))
+    
+    # Part way through the history: a window reaching past the watermark is
+    # read live, not from the partial rollup
+    db.add(transaction_stats.SyncWatermark(name=transaction_stats.WATERMARK, value=datetime(2024, 5, 10)))
+    db.add(MerchantDailyStats(merchant_id=1, date=date(2024, 5, 3), transaction_count=1, completed_count=1, revenue=1.0))
+    await db.commit()
+    assert await transaction_stats.daily_stats_cover(db, date(2024, 5, 8))
+    assert not await transaction_stats.daily_stats_cover(db, date(2024, 5, 20))
+    assert await summary("2024-05-02", "2024-05-20") == pytest.approx(await live_summary("2024-05-02", "2024-05-20"))
+
+
+@pytest.mark.asyncio
+async def test_refresh_picks_up_changed_and_late_transactions(transactions_db, monkeypatch):
+    db, rows = transactions_db
+    monkeypatch.setattr(transaction_stats.settings, "transaction_stats_max_staleness_seconds", 0)
+    await transaction_summary_service.generate_transaction_summary(db, "1")
+    
+    cancelled = next(row for row in rows if row["merchant_id"] == 1 and row["status"] == "completed")
+    cancelled["status"] = "cancelled"
+    await db.execute(
+        text("UPDATE transactions SET status = 'cancelled', updated_at = :now WHERE id = :id"),
+        {"id": cancelled["id"], "now": stored_time(datetime.utcnow())}
+    )
+    late = dict(rows[0], id=2001, total_amount=5000.0, status="completed")
+    await insert_transactions(db, [late])
+    await db.execute(
+        text("UPDATE transactions SET updated_at = :now WHERE id = 2001"),
+        {"now": stored_time(datetime.utcnow())}
+    )
+    await db.commit()
+    rows.append(late)
+    
+    result = await transaction_summary_service.generate_transaction_summary(
+        db, "1", date_from="2024-05-01", date_to="2024-05-31"
+    )
+    
+    merchant_rows = [
+        row for row in rows
+        if row["merchant_id"] == 1 and row["created_at"].date().isoformat() <= "2024-05-31"
+    ]
+    assert result["total_transactions"] == len(merchant_rows)
+    assert result["total_revenue"] == pytest.approx(
+        sum(row["total_amount"] for row in merchant_rows if row["status"] == "completed")
+    )
+
+
+@pytest.mark.asyncio
+async def test_summaries_refresh_only_a_stale_rollup(transactions_db, monkeypatch):
+    db, _ = transactions_db
+    refreshes = []
+    refresh_daily_stats = transaction_stats.refresh_daily_stats
+    
+    async def counting_refresh(db):
+        refreshes.append(1)
+        return await refresh_daily_stats(db)
+    monkeypatch.setattr(transaction_stats, "refresh_daily_stats", counting_refresh)
+    
+    for _ in range(3):
+        await transaction_summary_service.generate_transaction_summary(db, "1")
+    assert len(refreshes) == 1
+    
+    # A refresh already running is not waited for
+    async with transaction_stats._refresh_lock:
+        monkeypatch.setattr(transaction_stats, "_last_refresh", None)
+        await transaction_summary_service.generate_transaction_summary(db, "1")
+    assert len(refreshes) == 1
+    
+    monkeypatch.setattr(transaction_stats.settings, "transaction_stats_max_staleness_seconds", 0)
+    await transaction_summary_service.generate_transaction_summary(db, "1")
+    assert len(refreshes) == 2
+
+
+@pytest.mark.asyncio
+async def test_refresh_pages_through_changed_transactions(transactions_db, monkeypatch):
+    db, _ = transactions_db
+    # Pages smaller than the runs of transactions sharing an updated_at
+    monkeypatch.setattr(transaction_stats.settings, "transaction_stats_page_size", 7)
+    await db.execute(
+        text("UPDATE transactions SET updated_at = :now, status = 'cancelled' WHERE id % 50 < 20"),
+        {"now": stored_time(datetime(2024, 6, 15))}
+    )
+    await db.commit()
+    
+    await transaction_stats.refresh_daily_stats(db)
+    
+    watermark = await db.get(transaction_stats.SyncWatermark, transaction_stats.WATERMARK)
+    assert watermark.value == datetime(2024, 6, 15)
+    for merchant_id in ("1", "2"):
+        live = await transaction_stats.aggregate_statistics(
+            db, transaction_stats.transaction_filters(merchant_id, None, None), by_day=True
+        )
+        rollup = await transaction_stats.rollup_statistics(db, merchant_id, None, date(2024, 12, 31))
+        assert dict(rollup) == live
+
+
+@pytest.mark.asyncio
+async def test_rollup_revenue_halves_match_live_rows(transactions_db):
+    db, _ = transactions_db
+    await transaction_stats.refresh_daily_stats(db)
+    
+    for date_from, date_to in (("2024-05-02", "2024-05-09"), ("2024-05-05", "2024-05-05"), (None, None)):
+        _, halves = await transaction_summary_service._rollup_statistics(db, "1", date_from, date_to)
+        live = await transaction_stats.revenue_halves(
+            db, transaction_stats.transaction_filters("1", date_from, date_to)
+        )
+        assert halves == pytest.approx(live)
+
+
+@pytest.mark.asyncio
+async def test_llm_summary_is_reused_until_the_statistics_change(transactions_db, monkeypatch):
+    db, rows = transactions_db
+    monkeypatch.setattr(transaction_stats.settings, "transaction_stats_max_staleness_seconds", 0)
+    prompts = db.info["llm_prompts"]
+    
+    first = await transaction_summary_service.generate_transaction_summary(db, "1", date_from="2024-05-03")
+    again = await transaction_summary_service.generate_transaction_summary(db, "1", date_from="2024-05-03")
+    assert again["summary"] == first["summary"]
+    assert len(prompts) == 1
+    
+    # Another period or payment method is summarized on its own
+    await transaction_summary_service.generate_transaction_summary(db, "1", date_from="2024-05-04")
+    await transaction_summary_service.generate_transaction_summary(
+        db, "1", date_from="2024-05-03", payment_method="cash"
+    )
+    assert len(prompts) == 3
+    
+    # A new sale in the period invalidates the cached summary
+    late = dict(rows[-1], id=2001, merchant_id=1, status="completed")
+    await insert_transactions(db, [late])
+    await db.execute(
+        text("UPDATE transactions SET updated_at = :now WHERE id = 2001"),
+        {"now": stored_time(datetime.utcnow())}
+    )
+    await db.commit()
+    changed = await transaction_summary_service.generate_transaction_summary(db, "1", date_from="2024-05-03")
+    assert changed["total_transactions"] == first["total_transactions"] + 1
+    assert changed["summary"] != first["summary"]
+    assert len(prompts) == 4
+
+
+@pytest.mark.asyncio
+async def test_fallback_summary_is_not_cached(transactions_db, monkeypatch):
+    db, _ = transactions_db
+    
+    async def failing_generate_text(prompt, max_tokens=None):
+        raise RuntimeError("LLM unavailable")
+    monkeypatch.setattr(transaction_summary_service, "generate_text", failing_generate_text)
+    await transaction_summary_service.generate_transaction_summary(db, "1")
+    assert len(transaction_summary_service.summary_cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_analyze_query_summarizes_the_parsed_window(transactions_db):
+    db, rows = transactions_db
+    matching = [
+        row for row in rows
+        if row["merchant_id"] == 1 and "2024-05-03" <= row["created_at"].date().isoformat() <= "2024-05-05"
+    ]
+    
+    result = await transaction_summary_service.analyze_transaction_query(
+        db, "1", "Ringkasan penjualan 3-5 mei 2024"
+    )
+    
+    assert result["period"] == "from 2024-05-03 to 2024-05-05"
+    assert result["total_transactions"] == len(matching)
+
+
+def test_summary_request_rejects_malformed_dates():
+    request = TransactionSummaryRequest(merchant_id="1", date_from="2024-05-03")
+    assert request.date_from == date(2024, 5, 3)
+    
+    for bad in ("2024-13-01", "03/05/2024", "kemarin"):
+        with pytest.raises(ValidationError):
+            TransactionSummaryRequest(merchant_id="1", date_to=bad)
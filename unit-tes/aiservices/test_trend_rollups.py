@@ -0,0 +1,153 @@
+"""Tests for the weekly, monthly and merchant-day sales rollups"""
+import random
+from contextlib import asynccontextmanager
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import delete, select
+from app.models.product import ProductTrend, ProductTrendWeekly, ProductTrendMonthly, MerchantTrendDaily
+from app.schemas.product import RecordSaleRequest
+from app.services import trend_rollups, trend_service
+
+
+def covered_days(plan):
+    days = []
+    for month in plan.months:
+        day = month
+        while day.month == month.month:
+            days.append(day)
+            day += timedelta(days=1)
+    for week in plan.weeks:
+        days.extend(week + timedelta(days=offset) for offset in range(7))
+    for first, last in plan.days:
+        days.extend(first + timedelta(days=offset) for offset in range((last - first).days + 1))
+    return sorted(days)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_plan_range_covers_each_day_once(seed):
+    rng = random.Random(seed)
+    start = date(2024, 1, 1) + timedelta(days=rng.randint(0, 400))
+    end = start + timedelta(days=rng.randint(0, 200))
+    
+    plan = trend_rollups.plan_range(start, end)
+    
+    assert covered_days(plan) == [start + timedelta(days=i) for i in range((end - start).days + 1)]
+    assert all(week.weekday() == 0 for week in plan.weeks)
+
+
+def test_plan_range_prefers_coarsest_pieces():
+    # Wed 2024-01-03 .. Mon 2024-03-11
+    plan = trend_rollups.plan_range(date(2024, 1, 3), date(2024, 3, 11))
+    
+    assert plan.months == [date(2024, 2, 1)]
+    assert plan.weeks == [date(2024, 1, 8), date(2024, 1, 15), date(2024, 1, 22), date(2024, 3, 4)]
+    assert plan.days == [
+        (date(2024, 1, 3), date(2024, 1, 7)),
+        (date(2024, 1, 29), date(2024, 1, 31)),
+        (date(2024, 3, 1), date(2024, 3, 3)),
+        (date(2024, 3, 11), date(2024, 3, 11))
+    ]
+
+
+async def rollup_snapshot(db):
+    snapshot = {}
+    for model, keys in (
+        (ProductTrendWeekly, ("product_id", "week_start")),
+        (ProductTrendMonthly, ("product_id", "month_start")),
+        (MerchantTrendDaily, ("merchant_id", "date"))
+    ):
+        rows = (await db.scalars(select(model).execution_options(populate_existing=True))).all()
+        snapshot[model.__tablename__] = {
+            tuple(getattr(row, key) for key in keys): (row.quantity_sold, round(row.revenue, 2))
+            for row in rows
+        }
+    return snapshot
+
+
+@pytest.mark.asyncio
+async def test_sales_keep_rollups_in_step_with_rebuild(test_db, multiple_products, test_merchant_id):
+    rng = random.Random(3)
+    rows = [
+        {
+            "product_id": rng.choice(multiple_products).id,
+            "merchant_id": test_merchant_id,
+            "quantity": rng.randint(1, 5),
+            "date": str(date.today() - timedelta(days=rng.randint(0, 70)))
+        }
+        for _ in range(150)
+    ]
+    for row in rows[:30]:
+        await trend_service.record_sale(test_db, RecordSaleRequest.model_validate(row))
+    await trend_service.record_sales_bulk(test_db, rows[30:])
+    
+    incremental = await rollup_snapshot(test_db)
+    assert all(incremental.values())
+    
+    await trend_rollups.rebuild_rollups(test_db)
+    assert await rollup_snapshot(test_db) == incremental
+
+
+@pytest.mark.asyncio
+async def test_sales_totals_match_daily_rows(test_db, multiple_products, test_merchant_id):
+    rng = random.Random(5)
+    today = date.today()
+    for product in multiple_products:
+        for offset in range(120):
+            if rng.random() < 0.6:
+                test_db.add(ProductTrend(
+                    product_id=product.id,
+                    date=today - timedelta(days=offset),
+                    quantity_sold=rng.randint(1, 9),
+                    revenue=float(rng.randint(0, 1000))
+                ))
+    await test_db.commit()
+    await trend_rollups.rebuild_rollups(test_db)
+    trends = (await test_db.scalars(select(ProductTrend))).all()
+    product_ids = [product.id for product in multiple_products]
+    
+    for _ in range(10):
+        start = today - timedelta(days=rng.randint(0, 119))
+        end = start + timedelta(days=rng.randint(0, (today - start).days))
+        expected = {}
+        for trend in trends:
+            if start <= trend.date <= end:
+                quantity, revenue = expected.get(trend.product_id, (0, 0.0))
+                expected[trend.product_id] = (quantity + trend.quantity_sold, revenue + trend.revenue)
+    
+        totals = await trend_rollups.product_sales_totals(test_db, product_ids, start, end)
+        assert {pid: (q, round(r, 2)) for pid, (q, r) in totals.items()} == {
+            pid: (q, round(r, 2)) for pid, (q, r) in expected.items()
+        }
+    
+        merchant = await trend_rollups.merchant_sales_totals(test_db, test_merchant_id, start, end)
+        assert merchant[0] == sum(q for q, _ in expected.values())
+
+
+@pytest.mark.asyncio
+async def test_history_before_first_rebuild_is_read_from_daily_rows(test_db, multiple_products, test_merchant_id, monkeypatch):
+    product = multiple_products[0]
+    start = date(2024, 1, 1)
+    for offset in range(90):
+        test_db.add(ProductTrend(product_id=product.id, date=start + timedelta(days=offset),
+                                 quantity_sold=2, revenue=100.0))
+    await test_db.commit()
+    end = start + timedelta(days=89)
+    
+    # Deployed over existing history: rollups are empty but must not read as zero
+    assert not await trend_rollups.rollups_ready(test_db)
+    assert await trend_rollups.product_sales_totals(test_db, [product.id], start, end) == {product.id: (180, 9000.0)}
+    assert await trend_rollups.merchant_sales_totals(test_db, int(test_merchant_id), start, end) == (180, 9000.0)
+    
+    @asynccontextmanager
+    async def session():
+        yield test_db
+    monkeypatch.setattr(trend_rollups, "SessionLocal", session)
+    await trend_rollups.run_rollup_backfill()
+    
+    assert await trend_rollups.rollups_ready(test_db)
+    # February is now read from its monthly row, not the daily ones
+    await test_db.execute(delete(ProductTrend).where(ProductTrend.date.between(date(2024, 2, 1), date(2024, 2, 29))))
+    await test_db.commit()
+    assert await trend_rollups.product_sales_totals(test_db, [product.id], start, end) == {product.id: (180, 9000.0)}
+    assert await trend_rollups.merchant_sales_totals(test_db, int(test_merchant_id), start, end) == (180, 9000.0)
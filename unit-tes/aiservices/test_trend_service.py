@@ -0,0 +1,378 @@
+"""Unit tests for trend service, the NumPy trend engine and forecasting"""
+import random
+import statistics
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+from app.services import forecasting, trend_engine, trend_service
+from app.services.trend_engine import SalesSeries
+from sqlalchemy import select, text
+from app.database import upgrade_schema
+from app.models.product import ProductTrend, RiskRefreshQueue
+from pydantic import ValidationError
+from app.schemas.product import BatchTrendRequest, RecordSaleRequest
+
+
+@pytest.mark.asyncio
+async def test_record_sale_accumulates_same_day(test_db, sample_product, test_merchant_id):
+    """Sales on the same day add up in a single row priced from the product"""
+    sale = RecordSaleRequest(product_id=sample_product.id, merchant_id=test_merchant_id, quantity=3)
+    
+    first = await trend_service.record_sale(test_db, sale)
+    second = await trend_service.record_sale(test_db, sale.model_copy(update={"quantity": 2}))
+    
+    assert first == second
+    assert first.date == date.today()
+    trends = (await test_db.scalars(select(ProductTrend).execution_options(populate_existing=True))).all()
+    assert len(trends) == 1
+    assert trends[0].id == first.trend_id
+    assert trends[0].quantity_sold == 5
+    assert trends[0].revenue == 5 * sample_product.price
+    assert trends[0].popularity_score == 3
+
+
+@pytest.mark.asyncio
+async def test_schema_upgrade_merges_duplicate_trend_days(test_db, sample_product, test_merchant_id):
+    """A product_trends table from before the unique key gets merged and keyed"""
+    await test_db.execute(text("DROP TABLE product_trends"))
+    await test_db.execute(text(
+        "CREATE TABLE product_trends (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL,"
+        " date DATE NOT NULL, quantity_sold INTEGER, revenue FLOAT, views INTEGER,"
+        " popularity_score FLOAT, meta_data JSON, created_at DATETIME)"
+    ))
+    today = date.today().isoformat()
+    await test_db.execute(text(
+        "INSERT INTO product_trends (product_id, date, quantity_sold, revenue, views, popularity_score)"
+        " VALUES (:product_id, :date, :quantity, :revenue, 0, :quantity)"
+    ), [
+        {"product_id": sample_product.id, "date": today, "quantity": 2, "revenue": 200.0},
+        {"product_id": sample_product.id, "date": today, "quantity": 3, "revenue": 300.0},
+        {"product_id": sample_product.id, "date": "2024-01-01", "quantity": 1, "revenue": 100.0}
+    ])
+    conn = await test_db.connection()
+    for _ in range(2):  # a second run finds the key and does nothing
+        await conn.run_sync(upgrade_schema)
+    await test_db.commit()
+    
+    sale = RecordSaleRequest(product_id=sample_product.id, merchant_id=test_merchant_id, quantity=1)
+    await trend_service.record_sale(test_db, sale)
+    
+    rows = (await test_db.execute(text(
+        "SELECT date, quantity_sold, revenue FROM product_trends ORDER BY date"
+    ))).all()
+    assert [tuple(row) for row in rows] == [
+        ("2024-01-01", 1, 100.0),
+        (today, 6, 500.0 + sample_product.price)
+    ]
+
+
+@pytest.mark.asyncio
+async def test_record_sales_bulk_matches_single_sales(test_db, multiple_products, test_merchant_id):
+    """Bulk upload aggregates to the same rows as recording each sale"""
+    rng = random.Random(7)
+    rows = [
+        {
+            "product_id": rng.choice(multiple_products).id,
+            "merchant_id": test_merchant_id,
+            "quantity": rng.randint(1, 5),
+            "date": str(date.today() - timedelta(days=rng.randint(0, 3)))
+        }
+        for _ in range(200)
+    ]
+    rows[10] = {"product_id": 9999, "merchant_id": test_merchant_id, "quantity": 1}
+    rows[20] = b'{"product_id": "abc"'
+    
+    result = await trend_service.record_sales_bulk(test_db, rows)
+    
+    assert result.accepted_count == 198
+    assert [e.index for e in result.errors] == [10, 20]
+    assert result.errors[0].error == "Product not found"
+    assert result.accepted[10] is False and result.accepted[11] is True
+    
+    query = select(ProductTrend).execution_options(populate_existing=True)
+    snapshot = lambda trends: {
+        (t.product_id, t.date): (t.quantity_sold, t.revenue, t.popularity_score) for t in trends
+    }
+    bulk = snapshot((await test_db.scalars(query)).all())
+    assert len(bulk) == result.trend_rows
+    
+    await test_db.execute(ProductTrend.__table__.delete())
+    for index, row in enumerate(rows):
+        if result.accepted[index]:
+            await trend_service.record_sale(test_db, RecordSaleRequest.model_validate(row))
+    assert snapshot((await test_db.scalars(query)).all()) == bulk
+
+
+
+@pytest.mark.asyncio
+async def test_record_sales_bulk_reads_streamed_lines_and_queues_sold_products(test_db, multiple_products, test_merchant_id):
+    """An NDJSON stream is consumed as it arrives, and only the products
+    that were sold are queued for a risk refresh"""
+    sold, unsold = multiple_products[0].id, multiple_products[1].id
+    
+    async def lines():
+        yield f'{{"product_id": {sold}, "merchant_id": "{test_merchant_id}", "quantity": 2}}'.encode()
+        yield b'{"product_id": 9999, "merchant_id": "1", "quantity": 1}'
+        yield f'{{"product_id": {sold}, "merchant_id": "{test_merchant_id}", "quantity": 3}}'.encode()
+    
+    result = await trend_service.record_sales_bulk(test_db, lines())
+    
+    assert result.accepted == [True, False, True]
+    assert (await test_db.scalar(select(ProductTrend.quantity_sold))) == 5
+    queued = set((await test_db.scalars(select(RiskRefreshQueue.product_id))).all())
+    assert queued == {sold} and unsold not in queued
+
+# Reference implementation: pure-Python trend statistics over calendar days
+
+def reference_analysis(trends, start, days):
+    """analyze_product_trend metrics with days without rows counted as zero"""
+    sold = {t.date: t.quantity_sold for t in trends}
+    calendar = [start + timedelta(days=i) for i in range(days)]
+    daily = [sold.get(day, 0) for day in calendar]
+    
+    average_daily_sales = sum(daily) / len(daily)
+    
+    ranked = sorted(range(len(daily)), key=lambda i: daily[i], reverse=True)
+    peak_dates = [calendar[i] for i in ranked[:max(1, len(daily) // 5)] if daily[i] > 0]
+    
+    first_week_avg = statistics.mean(daily[:7])
+    last_week_avg = statistics.mean(daily[-7:])
+    if last_week_avg > first_week_avg * 1.2:
+        trend_direction = "increasing"
+    elif last_week_avg < first_week_avg * 0.8:
+        trend_direction = "decreasing"
+    else:
+        trend_direction = "stable"
+    
+    day_groups = {}
+    for day, quantity in zip(calendar, daily):
+        day_groups.setdefault(day.weekday(), []).append(quantity)
+    day_averages = [statistics.mean(sales) for sales in day_groups.values()]
+    mean_sales = statistics.mean(day_averages)
+    seasonality_detected = mean_sales > 0 and statistics.stdev(day_averages) / mean_sales > 0.3
+    
+    return average_daily_sales, peak_dates, trend_direction, seasonality_detected
+
+
+async def seed_trends(db, product_id, rng, days, fill=0.8, high=20):
+    """Insert random daily sales over the last `days` days with gaps"""
+    trends = []
+    for offset in range(days - 1, -1, -1):
+        if rng.random() > fill:
+            continue
+        trend = ProductTrend(
+            product_id=product_id,
+            date=date.today() - timedelta(days=offset),
+            quantity_sold=rng.randint(0, high),
+            revenue=float(rng.randint(0, 100000)),
+            popularity_score=float(rng.randint(0, 50))
+        )
+        db.add(trend)
+        trends.append(trend)
+    await db.commit()
+    return trends
+
+
+@pytest.mark.parametrize("seed", range(8))
+@pytest.mark.asyncio
+async def test_analyze_product_trend_matches_reference(test_db, sample_product, seed):
+    """Vectorized analysis returns the same response as the Python loops"""
+    rng = random.Random(seed)
+    fill = rng.choice([0.2, 0.8])
+    trends = await seed_trends(test_db, sample_product.id, rng, days=31, fill=fill, high=rng.choice([3, 20]))
+    
+    result = await trend_service.analyze_product_trend(test_db, sample_product.id, days=30)
+    
+    average, peaks, direction, seasonality = reference_analysis(trends, date.today() - timedelta(days=30), 31)
+    assert result.average_daily_sales == average
+    assert result.peak_dates == peaks
+    assert result.trend_direction == direction
+    assert result.seasonality_detected == seasonality
+    assert [p.quantity_sold for p in result.data_points] == [t.quantity_sold for t in trends]
+    assert [p.date for p in result.data_points] == [t.date for t in trends]
+
+
+@pytest.mark.asyncio
+async def test_analyze_product_trend_counts_days_without_sales(test_db, sample_product):
+    """A single sale is spread over the whole window, not over one recorded day"""
+    test_db.add(ProductTrend(product_id=sample_product.id, date=date.today(), quantity_sold=31))
+    await test_db.commit()
+    
+    result = await trend_service.analyze_product_trend(test_db, sample_product.id, days=30)
+    
+    assert result.average_daily_sales == 1.0
+    assert result.peak_dates == [date.today()]
+    assert result.trend_direction == "increasing"
+
+
+@pytest.mark.asyncio
+async def test_analyze_product_trend_no_data(test_db, sample_product):
+    """A product without sales reports no_data"""
+    result = await trend_service.analyze_product_trend(test_db, sample_product.id)
+    
+    assert result.trend_direction == "no_data"
+    assert result.average_daily_sales == 0.0
+    assert result.data_points == []
+
+
+def test_forecast_selects_holt_winters_for_weekly_pattern():
+    """A strong weekday pattern is forecast day by day, not as a flat average"""
+    days = np.arange(61)
+    weekly = np.where(days % 7 == 5, 30.0, 2.0)
+    flat = np.full(61, 5.0)
+    
+    forecast = forecasting.forecast_demand(np.vstack([weekly, flat]), list(forecasting.FORECASTERS))
+    
+    assert forecast.model == ["holt_winters", "naive"]
+    assert forecast.next_7_days == pytest.approx([42.0, 35.0])
+    # Days 61-90 hold four full weeks plus one peak day and one normal day
+    assert forecast.next_30_days == pytest.approx([200.0, 150.0])
+
+
+def test_forecast_catalog_matches_single_products():
+    """Fitting the catalog in one pass gives each product its own fit"""
+    rng = np.random.default_rng(3)
+    history = rng.poisson(rng.uniform(0, 20, (12, 1)), (12, 61)).astype(float)
+    history[4, :40] = np.nan  # first sale 21 days ago
+    history[7] = np.nan  # never sold
+    
+    catalog = forecasting.forecast_demand(history, list(forecasting.FORECASTERS))
+    
+    for row in range(len(history)):
+        single = forecasting.forecast_demand(history[row:row + 1], list(forecasting.FORECASTERS))
+        assert single.model[0] == catalog.model[row]
+        assert single.next_30_days[0] == pytest.approx(catalog.next_30_days[row])
+        assert single.upper_7_days[0] == pytest.approx(catalog.upper_7_days[row])
+    assert np.all(catalog.lower_7_days <= catalog.next_7_days)
+    assert np.all(catalog.next_7_days <= catalog.upper_7_days)
+
+
+def test_demand_history_ignores_days_before_first_sale():
+    """Missing days are zero sales once a product has started selling"""
+    start = date(2024, 1, 1)
+    rows = [
+        ProductTrend(date=start + timedelta(days=3), quantity_sold=4),
+        ProductTrend(date=start + timedelta(days=5), quantity_sold=6)
+    ]
+    
+    history = forecasting.demand_history([SalesSeries.from_rows(rows)], start, 7)
+    
+    assert np.isnan(history[0, :3]).all()
+    assert history[0, 3:].tolist() == [4, 0, 6, 0]
+
+
+@pytest.mark.asyncio
+async def test_predict_demand_reports_intervals(test_db, sample_product):
+    """Predictions carry the chosen model and a 90% interval around the total"""
+    rng = random.Random(5)
+    await seed_trends(test_db, sample_product.id, rng, days=61, fill=0.9)
+    
+    result = await trend_service.predict_demand(test_db, sample_product.id)
+    
+    assert result.forecast_model in forecasting.FORECASTERS
+    assert result.interval_level == 0.9
+    assert result.predicted_demand_next_7_days_lower <= result.predicted_demand_next_7_days
+    assert result.predicted_demand_next_7_days <= result.predicted_demand_next_7_days_upper
+    assert result.predicted_demand_next_30_days_lower <= result.predicted_demand_next_30_days
+    assert result.predicted_demand_next_30_days <= result.predicted_demand_next_30_days_upper
+
+
+@pytest.mark.asyncio
+async def test_recommend_order_quantity_adds_safety_stock(test_db, sample_product):
+    """The order target covers two weeks of demand plus the interval margin"""
+    rng = random.Random(6)
+    await seed_trends(test_db, sample_product.id, rng, days=61, fill=1.0)
+    
+    prediction = await trend_service.predict_demand(test_db, sample_product.id)
+    result = await trend_service.recommend_order_quantity(test_db, sample_product.id)
+    
+    margin = prediction.predicted_demand_next_7_days_upper - prediction.predicted_demand_next_7_days
+    assert result["safety_stock"] == pytest.approx(margin * 2 ** 0.5)
+    assert result["target_stock"] == pytest.approx(2 * prediction.predicted_demand_next_7_days + result["safety_stock"])
+
+
+@pytest.mark.asyncio
+async def test_predict_demand_exactly_two_weeks(test_db, sample_product):
+    """Exactly 14 days of sales has no earlier window to compare against"""
+    for offset in range(14):
+        test_db.add(ProductTrend(
+            product_id=sample_product.id,
+            date=date.today() - timedelta(days=offset),
+            quantity_sold=2
+        ))
+    await test_db.commit()
+    
+    result = await trend_service.predict_demand(test_db, sample_product.id)
+    
+    assert result.predicted_demand_next_7_days == pytest.approx(14.0)
+    assert result.confidence_level == "medium"
+
+
+@pytest.mark.asyncio
+async def test_batch_results_match_single_product_calls(test_db, multiple_products):
+    """Batch analysis and prediction return the per-product results in request order"""
+    rng = random.Random(42)
+    for product in multiple_products:
+        await seed_trends(test_db, product.id, rng, days=61)
+    product_ids = [multiple_products[2].id, 9999, multiple_products[0].id]
+    
+    products, missing = await trend_service.get_batch_products(test_db, product_ids=product_ids)
+    analyses = list(await trend_service.analyze_trends_batch(test_db, products, missing, days=30))
+    predictions = list(await trend_service.predict_demand_batch(test_db, products, missing))
+    
+    assert [r.product_id for r in analyses] == [multiple_products[2].id, multiple_products[0].id, 9999]
+    assert analyses[-1].error == "Product not found"
+    for analysis, prediction in zip(analyses[:2], predictions[:2]):
+        assert analysis == await trend_service.analyze_product_trend(test_db, analysis.product_id, days=30)
+        assert prediction == await trend_service.predict_demand(test_db, prediction.product_id)
+
+
+@pytest.mark.asyncio
+async def test_batch_request_validates_merchant_id(test_db, multiple_products, test_merchant_id):
+    """A non-numeric merchant_id is a validation error (422), not a server error"""
+    with pytest.raises(ValidationError):
+        BatchTrendRequest(merchant_id="abc")
+    
+    request = BatchTrendRequest(merchant_id=test_merchant_id)
+    products, _ = await trend_service.get_batch_products(test_db, merchant_id=request.merchant_id)
+    assert sorted(p.id for p in products) == sorted(p.id for p in multiple_products)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_top_k_indices_matches_stable_sort(seed):
+    """argpartition-based top-k keeps ties in their original order"""
+    rng = random.Random(seed)
+    values = [rng.randint(0, 4) for _ in range(rng.randint(1, 40))]
+    k = rng.randint(1, len(values))
+    
+    expected = sorted(range(len(values)), key=lambda i: values[i], reverse=True)[:k]
+    
+    assert trend_engine.top_k_indices(np.array(values), k).tolist() == expected
+
+
+def test_dense_daily_scatters_query_rows():
+    """Rows land on their product row and day column; others are dropped"""
+    start = date(2024, 1, 1)
+    rows = [
+        (2, start + timedelta(days=1), 5),
+        (1, start, 3),
+        (2, start + timedelta(days=4), 7),
+        (3, start, 9),  # not requested
+        (1, start + timedelta(days=10), 1)  # outside the window
+    ]
+    
+    daily = trend_engine.dense_daily(rows, [1, 2], start, 5)
+    
+    assert daily.tolist() == [[3, 0, 0, 0, 0], [0, 5, 0, 0, 7]]
+
+
+def test_weekday_averages_use_calendar_weekdays():
+    """Weekday grouping from datetime64 days matches date.weekday()"""
+    start = date(2024, 1, 1)  # Monday
+    dates = np.array([start + timedelta(days=i) for i in range(14)], dtype="datetime64[D]")
+    values = np.array([10 if (start + timedelta(days=i)).weekday() == 5 else 1 for i in range(14)])
+    
+    averages = trend_engine.weekday_averages(dates, values)
+    
+    assert averages.tolist() == [1, 1, 1, 1, 1, 10, 1]